@@ -0,0 +1 @@
+""" netchat benchmark suite: run with ``python -m benchmarks.run`` """
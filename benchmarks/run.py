@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# netchat benchmarks
+
+import asyncio
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from time import monotonic
+
+import click
+
+import netchat
+from netchat import AsyncSession, Connection, Session, spawn, status
+
+from .server import BulkServer, LoopbackServer
+
+SPAWN_TYPES = ['direct', 'async', 'forkserver', 'internal', 'socat', 'nc']
+PROGRAMS = {'socat': 'socat', 'nc': 'nc'}
+
+
+def summary(values):
+    """return summary statistics in seconds for a list of durations"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return dict(
+        count=len(ordered),
+        mean=statistics.fmean(ordered),
+        median=statistics.median(ordered),
+        p90=ordered[min(int(len(ordered) * 0.9),
+                        len(ordered) - 1)],
+        min=ordered[0],
+        max=ordered[-1]
+    )
+
+
+def chat_script(steps):
+    return ' '.join(['"> " cmd'] * steps + ['"> " quit'])
+
+
+def run_session(address, script, spawn_name, timeout=30):
+    """run one session, returning (status, start time, [(event, time)...])"""
+    marks = []
+
+    def callback(event, data):
+        marks.append((event, monotonic()))
+
+    kwargs = dict(wait_timeout=timeout, out=None, err=None, events=list(status))
+    started = monotonic()
+    if spawn_name == 'async':
+        ret = asyncio.run(AsyncSession(address, script, **kwargs).run(callback))
+    else:
+        ret = Session(address, script, spawn_type=spawn[spawn_name], **kwargs).run(callback)
+    return ret, started, marks
+
+
+def measure_latency(address, spawn_name, sessions, steps):
+    """session setup latency and per-step EXPECT->FOUND latency"""
+    connected, first_prompt, step_latency, total = [], [], [], []
+    script = chat_script(steps)
+    for _ in range(sessions):
+        ret, started, marks = run_session(address, script, spawn_name)
+        if ret != status.DONE:
+            raise RuntimeError(f'{spawn_name} session ended with {ret}')
+        times = {}
+        expect = None
+        found = []
+        for event, when in marks:
+            times.setdefault(event, when)
+            if event == status.EXPECT:
+                expect = when
+            elif event == status.FOUND:
+                found.append(when - expect)
+        connected.append(times[status.CONNECTED] - started)
+        first_prompt.append(times[status.FOUND] - started)
+        step_latency.extend(found[1:])
+        total.append(marks[-1][1] - started)
+    return dict(
+        connected=summary(connected),
+        first_prompt=summary(first_prompt),
+        step=summary(step_latency),
+        session=summary(total)
+    )
+
+
+def measure_concurrency(address, spawn_name, levels, steps):
+    """wall time and session rate running N sessions at once"""
+    script = chat_script(steps)
+    results = []
+    for level in levels:
+        started = monotonic()
+        if spawn_name == 'async':
+
+            async def gather():
+                kwargs = dict(wait_timeout=30, out=None, err=None)
+                return await asyncio.gather(*[AsyncSession(address, script, **kwargs).run() for _ in range(level)])
+
+            returns = asyncio.run(gather())
+        else:
+            with ThreadPoolExecutor(max_workers=level) as pool:
+                returns = [r[0] for r in pool.map(lambda _: run_session(address, script, spawn_name), range(level))]
+        elapsed = monotonic() - started
+        results.append(
+            dict(
+                sessions=level,
+                elapsed=elapsed,
+                rate=level / elapsed,
+                failed=sum(1 for ret in returns if ret != status.DONE)
+            )
+        )
+    return results
+
+
+def measure_relay(size, bufsize):
+    """throughput of Connection.run relaying size bytes from a socket to a pipe"""
+    with BulkServer(size) as server:
+        tx_read, tx_write = os.pipe()
+        rx_read, rx_write = os.pipe()
+        os.close(tx_write)
+        received = 0
+
+        def sink():
+            nonlocal received
+            with open(rx_read, 'rb', buffering=0) as fp:
+                while data := fp.read(1048576):
+                    received += len(data)
+
+        thread = threading.Thread(target=sink)
+        thread.start()
+        started = monotonic()
+        Connection(server.address, bufsize=bufsize, stdin=tx_read, stdout=rx_write).run()
+        os.close(rx_write)
+        thread.join()
+        elapsed = monotonic() - started
+        os.close(tx_read)
+    return dict(bytes=received, bufsize=bufsize, elapsed=elapsed, mbytes_per_second=received / elapsed / 1e6)
+
+
+@click.command(name='netchat-benchmark')
+@click.option(
+    '-s',
+    '--spawn-type',
+    'spawn_types',
+    multiple=True,
+    type=click.Choice(SPAWN_TYPES),
+    help='spawn types to measure, defaults to all available'
+)
+@click.option('-n', '--sessions', type=int, default=20, show_default=True, help='sessions per latency measurement')
+@click.option('--steps', type=int, default=10, show_default=True, help='EXPECT/SEND steps per session')
+@click.option('--latency', type=float, default=0.0, show_default=True, help='server response delay in seconds')
+@click.option('--payload', type=int, default=256, show_default=True, help='server response size in bytes')
+@click.option('--chunk', type=int, default=4096, show_default=True, help='server write size in bytes')
+@click.option('--concurrency', default='1,8,32', show_default=True, help='comma-separated concurrent session counts')
+@click.option('--relay-size', type=int, default=64 * 1048576, show_default=True, help='bytes for relay throughput')
+@click.option('-o', '--output', type=click.File('w'), default='-', help='JSON results file')
+def main(spawn_types, sessions, steps, latency, payload, chunk, concurrency, relay_size, output):
+    """measure netchat session latency, relay throughput and concurrency scaling"""
+    spawn_types = spawn_types or SPAWN_TYPES
+    spawn_types = [s for s in spawn_types if s not in PROGRAMS or shutil.which(PROGRAMS[s])]
+    levels = [int(level) for level in concurrency.split(',')]
+    config = dict(
+        spawn_types=spawn_types,
+        sessions=sessions,
+        steps=steps,
+        latency=latency,
+        payload=payload,
+        chunk=chunk,
+        concurrency=levels,
+        relay_size=relay_size
+    )
+    results = dict(latency={}, concurrency={}, relay=None)
+    with LoopbackServer(latency=latency, payload=payload, chunk=chunk) as server:
+        for spawn_name in spawn_types:
+            click.echo(f'measuring {spawn_name}', err=True)
+            results['latency'][spawn_name] = measure_latency(server.address, spawn_name, sessions, steps)
+            results['concurrency'][spawn_name] = measure_concurrency(server.address, spawn_name, levels, steps)
+    click.echo('measuring relay', err=True)
+    results['relay'] = measure_relay(relay_size, netchat.connection.BUFSIZ)
+
+    report = dict(
+        netchat=netchat.__version__,
+        python=sys.version.split()[0],
+        platform=platform.platform(),
+        timestamp=datetime.now(timezone.utc).isoformat(),
+        config=config,
+        results=results
+    )
+    json.dump(report, output, indent=2)
+    output.write('\n')
+
+
+if __name__ == '__main__':
+    main()
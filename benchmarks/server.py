@@ -0,0 +1,118 @@
+# netchat benchmark loopback chat server
+
+import asyncio
+import threading
+
+
+class LoopbackServer():
+    """pure-python chat server run on its own event loop thread
+
+    On connect the server sends ``banner`` and ``prompt``; each received line is answered with
+    ``payload`` bytes, written ``chunk`` bytes at a time, followed by ``prompt``.  A received ``quit``
+    line closes the connection.
+
+    :param: latency: seconds to wait before each response
+    :type: latency: float
+    :param: payload: size in bytes of each response body
+    :type: payload: int
+    :param: chunk: size in bytes of each write of the response body
+    :type: chunk: int
+    :param: prompt: prompt written after each response
+    :type: prompt: str
+    :param: banner: greeting written on connect
+    :type: banner: str
+    """
+
+    def __init__(self, *, latency=0.0, payload=64, chunk=4096, prompt='> ', banner='netchat benchmark\n'):
+        self.latency = latency
+        self.payload = payload
+        self.chunk = chunk
+        self.prompt = prompt.encode()
+        self.banner = banner.encode()
+        self.body = (b'x'*79 + b'\n') * (payload//80) + b'x' * (payload%80)
+        self.port = None
+        self.connections = 0
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.server = None
+
+    def __enter__(self):
+        self.thread.start()
+        self.server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self.chat, 'localhost', 0, backlog=4096), self.loop
+        ).result()
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    def __exit__(self, _, exception, traceback):
+        self.loop.call_soon_threadsafe(self.server.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        return False
+
+    @property
+    def address(self):
+        return ('localhost', self.port)
+
+    async def respond(self, writer, body):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        view = memoryview(body)
+        for offset in range(0, len(view), self.chunk):
+            writer.write(view[offset:offset + self.chunk])
+            await writer.drain()
+        writer.write(self.prompt)
+        await writer.drain()
+
+    async def chat(self, reader, writer):
+        self.connections += 1
+        try:
+            await self.respond(writer, self.banner)
+            while True:
+                line = await reader.readline()
+                if not line or line.strip() == b'quit':
+                    break
+                await self.respond(writer, self.body)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+class BulkServer():
+    """loopback server that writes ``size`` bytes to each connection and then closes it
+
+    :param: size: bytes written per connection
+    :type: size: int
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.data = b'x' * 65536
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        self.server = asyncio.run_coroutine_threadsafe(asyncio.start_server(self.send, 'localhost', 0),
+                                                       self.loop).result()
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    def __exit__(self, _, exception, traceback):
+        self.loop.call_soon_threadsafe(self.server.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        return False
+
+    @property
+    def address(self):
+        return ('localhost', self.port)
+
+    async def send(self, reader, writer):
+        remaining = self.size
+        while remaining > 0:
+            writer.write(self.data[:remaining])
+            remaining -= len(self.data)
+            await writer.drain()
+        writer.close()
@@ -1,11 +1,36 @@
 """ connect to a listening TCP port and perform expect/send interaction """
 
-from .session import Session
-from .constant import status, spawn
-from .script import Script
-from .exception import TimeoutError, ParameterError
-from .connection import Connection
+from importlib import import_module
 
-__all__ = ['Session', 'Script', 'status', 'spawn', 'TimeoutError', 'ParameterError', 'Connection']
+__all__ = [
+    'Session', 'Script', 'status', 'spawn', 'TimeoutError', 'ParameterError', 'Connection', 'AsyncSession',
+    'PersistentSession', 'Pool'
+]
 
 __version__ = '1.0.3'
+
+# exports are imported on first use, so the connector subprocess loads only the relay
+_exports = {
+    'Session': '.session',
+    'status': '.constant',
+    'spawn': '.constant',
+    'Script': '.script',
+    'TimeoutError': '.exception',
+    'ParameterError': '.exception',
+    'Connection': '.connection',
+    'AsyncSession': '.aio',
+    'PersistentSession': '.pool',
+    'Pool': '.pool',
+}
+
+
+def __getattr__(name):
+    if name not in _exports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(_exports[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,262 @@
+# netchat asyncio session object
+
+import asyncio
+
+from collections import deque
+from contextlib import asynccontextmanager
+
+from .constant import status, spawn
+from .exception import EOF, TimeoutError
+from .expect import Expecter
+from .handler import Handler, Upload
+from .net import connect_async
+from .tls import describe
+from .transport import TCP, open_transport
+from .pattern import compile_pattern
+from .script import Cursor, Element, Exit, SendFile, Sleep
+from .session import Session
+from .timer import loop_timers
+
+BUFSIZ = 65536
+CHUNK = 1048576
+
+
+class AsyncSession(Session):
+    """connect to a listening TCP port and perform expect/send interaction on an asyncio event loop
+
+    Accepts the same parameters as ``Session``; the connection is always made in-process, so
+    ``spawn_type`` is ignored.  Many sessions may be run concurrently with ``asyncio.gather``.
+
+    ..note:: asyncio cannot offer a cached session to its TLS handshake, so ``tls`` connections made
+      by ``AsyncSession`` always perform a full handshake
+    """
+
+    def __init__(self, address, script, **kwargs):
+        kwargs['spawn_type'] = spawn.direct
+        super().__init__(address, script, **kwargs)
+
+    async def run(self, callback=None):
+        """connect to the server and iterate through the script, waiting for EXPECT and sending SEND
+          :param: callback: function to be called on state change events
+          :type: callback: callback_function(netchat.status, data)
+          :return: EOF, TIMEOUT, DONE, or a script exit status
+          :rtype: netchat.state
+        """
+        async with self.handler(callback) as handler:
+            result = await self._run(handler)
+        self.stats = handler.summary(result)
+        return result
+
+    async def _run(self, handler):
+        outstanding = deque()
+        cursor = Cursor(self.script)
+        try:
+            for step in cursor:
+                if self.pipeline and isinstance(step, Element) and step.linear:
+                    while len(outstanding) >= self.pipeline:
+                        await handler.expect(*outstanding.popleft())
+                    outstanding.append((step.pattern, step.timeout, cursor.index))
+                    await handler.send(step.send, cursor.index)
+                    continue
+                while outstanding:
+                    await handler.expect(*outstanding.popleft())
+                if isinstance(step, Sleep):
+                    await handler.sleep(step.seconds)
+                    continue
+                if isinstance(step, Exit):
+                    return handler.event(step.status)
+                try:
+                    index = await handler.expect(step.pattern, step.timeout, cursor.index)
+                except TimeoutError:
+                    if step.on_timeout is None or handler.expired():
+                        raise
+                    handler.event(status.TIMEOUT)
+                    cursor.jump(step.on_timeout)
+                    continue
+                step = step.choose(index)
+                if step.exit is not None:
+                    return handler.event(step.exit)
+                if step.goto is not None:
+                    cursor.jump(step.goto)
+                    continue
+                await handler.send(step.send, cursor.index)
+            while outstanding:
+                await handler.expect(*outstanding.popleft())
+        except EOF as ex:
+            return handler.event(status.EOF)
+        except TimeoutError as ex:
+            return handler.event(status.TIMEOUT)
+        return status.DONE
+
+    def handler(self, callback=None):
+        return AsyncHandler(self.address, self.wait_timeout, self.out, self.err, self.events, callback, **self.options)
+
+
+class AsyncHandler(Handler):
+    """async context manager for an asyncio stream connection
+
+    :param: address: (host, port) for TCP connection, or a ``scheme:target`` string naming another transport
+    :type: address: tuple/str
+
+    remaining parameters are as for ``Handler``
+    """
+
+    def __init__(self, address, timeout, out, err, events, callback, **kwargs):
+        super().__init__(None, timeout, out, err, events, callback, **kwargs)
+        self.address = address
+        self.transport = open_transport(address)
+
+    async def __aenter__(self):
+        self.event(status.CONNECTING)
+        connect_timeout = self.limit(self.connect_timeout)
+        if isinstance(self.transport, TCP):
+            sock = await connect_async(self.address, timeout=connect_timeout, retries=self.retries)
+        else:
+            # local transports open without waiting on the network
+            sock = self.transport.open(timeout=connect_timeout, tls=self.tls)
+        connected = None
+        if self.tls:
+            try:
+                self.reader, self.writer = await asyncio.open_connection(
+                    sock=sock,
+                    limit=BUFSIZ,
+                    ssl=self.tls.context,
+                    server_hostname=self.tls.name(self.address),
+                    ssl_handshake_timeout=connect_timeout
+                )
+            except asyncio.TimeoutError:
+                raise TimeoutError(f'timeout in TLS handshake with {self.address[0]}:{self.address[1]}') from None
+            connected = describe(self.writer.get_extra_info('ssl_object'))
+        else:
+            self.reader, self.writer = await asyncio.open_connection(sock=sock, limit=BUFSIZ)
+        self.expecter = Expecter(
+            self.encoding, logfile=self.out, search_window=self.search_window, max_buffer=self.max_buffer
+        )
+        self.event(status.CONNECTED, connected)
+        return self
+
+    async def __aexit__(self, _, exception, traceback):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except OSError:
+            pass
+        self.transport.close()
+        self.event(status.CLOSED)
+        return False
+
+    async def expect(self, pattern, timeout=None, step=None):
+        if pattern:
+            if isinstance(pattern, (str, bytes)):
+                pattern = compile_pattern(pattern)
+            self.event(status.EXPECT, pattern.text, step)
+            index = await self._expect(pattern, self.limit(self.timeout if timeout is None else timeout))
+            self.event(status.FOUND, pattern[index].text)
+            return index
+        else:
+            self.event(status.EXPECT_SKIPPED, step=step)
+            return 0
+
+    async def send(self, data, step=None):
+        if isinstance(data, SendFile):
+            self.event(status.SEND, str(data), step)
+            with data.open() as file:
+                upload = Upload(self, data, file)
+                await self._send_file(upload, file)
+            upload.report()
+            self.event(status.SENT, str(data))
+        elif data:
+            self.event(status.SEND, data, step)
+            await self._send(data)
+            self.event(status.SENT, data)
+        else:
+            self.event(status.SEND_SKIPPED, step=step)
+
+    async def sleep(self, seconds):
+        allowed = self.limit(seconds)
+        await asyncio.sleep(allowed)
+        if allowed < seconds:
+            raise TimeoutError('session timeout during sleep')
+
+    async def _expect(self, pattern, timeout):
+        match = self.expecter.search(pattern)
+        if match:
+            return match[2]
+        async with self._deadline(timeout):
+            while not match:
+                received = await self.reader.read(BUFSIZ)
+                self.rx.write(received)
+                self.expecter.feed(received)
+                if not received:
+                    raise EOF(f'connection closed by {self.transport}')
+                match = self.expecter.search(pattern)
+        return match[2]
+
+    async def _send(self, data):
+        data = data + self.linesep
+        self.expecter.log(data)
+        if not self.binary:
+            data = data.encode()
+        self.tx.write(data)
+        self.writer.write(data)
+        async with self._deadline(self.limit(self.write_timeout)):
+            await self.writer.drain()
+
+    async def _send_file(self, upload, file):
+        loop = asyncio.get_running_loop()
+        if upload.regular:
+            # the loop uses os.sendfile where the transport allows it, else reads and writes the file
+            offset = 0
+            while offset < upload.total:
+                async with self._deadline(self.limit(self.write_timeout)):
+                    count = await loop.sendfile(self.writer.transport, file, offset, min(CHUNK, upload.total - offset))
+                if not count:
+                    return
+                offset += count
+                upload.add(count)
+            return
+        while True:
+            # pipes may block: read them off the event loop
+            data = await loop.run_in_executor(None, file.read, CHUNK)
+            if not data:
+                return
+            self.writer.write(data)
+            async with self._deadline(self.limit(self.write_timeout)):
+                await self.writer.drain()
+            upload.add(len(data))
+
+    @asynccontextmanager
+    async def _deadline(self, timeout):
+        """raise TimeoutError if the block runs longer than timeout seconds
+
+        The deadline is a timer on the event loop's shared ``TimerWheel`` that cancels the waiting task,
+        rather than an event loop timer of its own.
+        """
+        if timeout is None:
+            yield
+            return
+        task = asyncio.current_task()
+        loop = task.get_loop()
+        timer = loop_timers(loop).call_at(loop.time() + timeout, task.cancel)
+        try:
+            yield
+        except asyncio.CancelledError:
+            if not timer.expired:
+                raise
+            _uncancel(task)
+            raise TimeoutError(f'timeout waiting for {self.transport}') from None
+        finally:
+            timer.cancel()
+        if timer.expired:
+            # the timer expired as the block finished: absorb the cancellation it left pending
+            try:
+                await asyncio.sleep(0)
+            except asyncio.CancelledError:
+                _uncancel(task)
+
+
+def _uncancel(task):
+    # Task.uncancel is new in python 3.11
+    uncancel = getattr(task, 'uncancel', None)
+    if uncancel:
+        uncancel()
@@ -0,0 +1,174 @@
+# netchat batch runner
+
+import json
+import shlex
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from time import monotonic
+
+from .constant import status
+from .exception import ParameterError
+from .script import Script
+from .session import Session, default_spawn, parse_address
+from .transcript import open_transcript
+from .transport import format_address
+
+
+class Result():
+    """outcome of running a script against one target
+
+    :param: address: (host, port) of the target
+    :type: address: tuple
+    :param: status: final session status, or None if the session raised an exception
+    :type: status: netchat.status
+    :param: elapsed: seconds spent on the target
+    :type: elapsed: float
+    :param: error: exception message, if any
+    :type: error: str
+    :param: stats: session timing summary
+    :type: stats: dict, optional
+    """
+
+    def __init__(self, address, status, elapsed, error=None, stats=None):
+        self.address = address
+        self.status = status
+        self.elapsed = elapsed
+        self.error = error
+        self.stats = stats
+
+    @property
+    def ok(self):
+        return self.status == status.DONE
+
+    def __str__(self):
+        result = dict(
+            address=format_address(self.address),
+            status=str(self.status) if self.status else None,
+            elapsed=round(self.elapsed, 6),
+            error=self.error
+        )
+        if self.stats is not None:
+            result['stats'] = self.stats
+        return json.dumps(result)
+
+    def __repr__(self):
+        return f"Result<{str(self)}>"
+
+
+class Batch():
+    """run one script against many targets with a bounded pool of workers
+
+    :param: targets: addresses, (address, variables) pairs giving each target its own script variables, or a
+      dict of script variables for each address; an address may be listed more than once
+    :type: targets: list/dict
+    :param: script: script run against every target
+    :type: script: str/Script
+    :param: parallel: maximum number of concurrent sessions
+    :type: parallel: int
+    :param: stats: include each session's timing summary in its result
+    :type: stats: bool
+    :param: transcript: per-target transcript file path, with ``{host}`` and ``{port}`` replaced by the target
+    :type: transcript: str, optional
+    :param: transcript_options: ``open_transcript`` options such as max_bytes, compress and flush_interval
+    :type: transcript_options: dict, optional
+    :param: variables: script variables for every target, overridden by the target's own variables
+    :type: variables: dict, optional
+    :param: kwargs: keyword arguments passed to each ``Session``; a ``spawn_type`` of None, or none at all,
+      chooses the spawn type for each target with ``default_spawn``
+    :type: kwargs: dict
+
+    ..note:: the script is parsed once and bound to each target's variables, see ``Script.bind``
+    """
+
+    def __init__(
+        self,
+        targets,
+        script,
+        *,
+        parallel=16,
+        stats=False,
+        transcript=None,
+        transcript_options=None,
+        variables=None,
+        **kwargs
+    ):
+        if isinstance(targets, dict):
+            targets = targets.items()
+        # (address, variables) of each target
+        self.targets = [target if _has_variables(target) else (target, {}) for target in targets]
+        self.variables = variables or {}
+        if isinstance(script, str):
+            script = Script(script=script, binary=kwargs.get('binary', False))
+        self.script = script
+        self.parallel = parallel
+        self.stats = stats
+        self.transcript = transcript
+        self.transcript_options = transcript_options or {}
+        self.kwargs = kwargs
+
+    def run(self, callback=None):
+        """run the sessions, yielding a Result for each target as it finishes
+
+          :param: callback: function to be called on state change events
+          :type: callback: callback_function(netchat.status, data)
+          :return: results in completion order
+          :rtype: generator of netchat.batch.Result
+        """
+        with ThreadPoolExecutor(max_workers=self.parallel) as pool:
+            futures = [pool.submit(self._run, address, variables, callback) for address, variables in self.targets]
+            for future in as_completed(futures):
+                yield future.result()
+
+    def _run(self, address, variables, callback):
+        started = monotonic()
+        kwargs = self.kwargs
+        if kwargs.get('spawn_type') is None:
+            kwargs = dict(kwargs, spawn_type=default_spawn(address, kwargs.get('tls')))
+        out = None
+        try:
+            if self.transcript:
+                out = open_transcript(self.transcript, address, **self.transcript_options)
+                kwargs = dict(kwargs, out=out)
+            variables = dict(self.variables, **variables)
+            session = Session(address, self.script, variables=variables, **kwargs)
+            try:
+                ret = session.run(callback)
+            finally:
+                if out:
+                    out.close()
+        except Exception as ex:
+            return Result(address, None, monotonic() - started, f"{ex.__class__.__name__}: {ex}")
+        return Result(address, ret, monotonic() - started, stats=session.stats if self.stats else None)
+
+
+def read_inventory(file):
+    """read target addresses with their script variables, one ``host:port [NAME=VALUE]...`` per line,
+    ignoring blank and comment lines; values may be quoted as in a shell
+
+    :param: file: open file for reading targets
+    :type: file: file-type
+    :return: address and script variables of each line, in file order
+    :rtype: list of (address, dict)
+    """
+    inventory = []
+    for line in file:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            address, *words = shlex.split(line)
+            inventory.append((parse_address(address), parse_variables(words)))
+    return inventory
+
+
+def parse_variables(words):
+    """return the dict of script variables set by ``NAME=VALUE`` words"""
+    variables = {}
+    for word in words:
+        name, equals, value = word.partition('=')
+        if not equals or not name.isidentifier():
+            raise ParameterError(f'expected NAME=VALUE, not {word!r}')
+        variables[name] = value
+    return variables
+
+
+def _has_variables(target):
+    return isinstance(target, tuple) and len(target) == 2 and isinstance(target[1], dict)
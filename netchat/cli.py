@@ -1,32 +1,133 @@
 #!/usr/bin/env python3
 
+import asyncio
 import click
+import json
 import sys
 
 from netchat import Session, Script, spawn, status, ParameterError, Connection
+from netchat.script import Element, SendFile
+from netchat.session import default_spawn, parse_address
+from netchat.batch import Batch, parse_variables, read_inventory
+from netchat.load import Load
+from netchat.stats import profiled
+from netchat.tls import TLS
+from netchat.trace import Recorder, ReplayServer
+from netchat.transcript import Transcript, open_transcript
 
 
-@click.command(name='netchat')
+class DefaultGroup(click.Group):
+    """command group that runs the ``default`` command when the first argument is not a command name"""
+
+    def __init__(self, *args, default=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.default = default
+
+    def parse_args(self, ctx, args):
+        if not args or (args[0] not in self.commands and args[0] not in ('--help', '--version')):
+            args = [self.default] + list(args)
+        return super().parse_args(ctx, args)
+
+
+# -s/--spawn-type values, the names of the spawn types
+SPAWN_TYPES = click.Choice(list(spawn.__members__))
+
+
+def tls_options(command):
+    """add the TLS options, passed to the command as keyword arguments for ``make_tls``"""
+    options = [
+        click.option('--tls', is_flag=True, help='connect with TLS; implies -s direct'),
+        click.option('--cafile', type=click.Path(exists=True, dir_okay=False), help='TLS CA bundle'),
+        click.option('--cert', type=click.Path(exists=True, dir_okay=False), help='TLS client certificate'),
+        click.option('--key', type=click.Path(exists=True, dir_okay=False), help='TLS client certificate key'),
+        click.option('--sni', type=str, default=None, help='TLS server name, defaults to the host'),
+        click.option('--insecure', is_flag=True, help='do not verify the TLS server certificate'),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+
+def make_tls(tls, cafile, cert, key, sni, insecure):
+    """return the TLS settings shared by every session of a command, or None"""
+    if not tls:
+        return None
+    return TLS(cafile=cafile, certfile=cert, keyfile=key, server_hostname=sni, verify=not insecure)
+
+
+@click.group(name='netchat', cls=DefaultGroup, default='chat')
 @click.version_option()
-@click.argument('address', type=str)
+def cli():
+    """connect to ADDRESS and run a chat script; ``chat`` is the default command"""
+
+
+@cli.command()
+@click.argument('address', type=str, required=False, default=None)
 @click.argument('script', type=str, required=False, default=None)
 @click.option('-f', '--file', type=click.File('r'), help='chat script file')
 @click.option('-t', '--timeout', type=int, default=None, help='timeout for each WAIT element')
+@click.option('--session-timeout', type=float, default=None, help='seconds allowed for the whole session')
+@click.option('--write-timeout', type=float, default=None, help='seconds allowed for each SEND to be written')
 @click.option(
     '-s',
     '--spawn-type',
-    type=click.Choice(['internal', 'socat', 'nc']),
-    default='internal',
+    type=SPAWN_TYPES,
+    default=None,
+    help='connection program  [default: internal, or direct with --tls, --upload or a unix: or exec: address]'
+)
+@click.option('--connect-timeout', type=float, default=None, help='seconds allowed for each connection attempt round')
+@click.option('--retries', type=int, default=0, show_default=True, help='connection retries, with jittered backoff')
+@click.option(
+    '--pipeline',
+    type=int,
+    default=0,
     show_default=True,
-    help='connection program'
+    help='steps whose SEND may be written before their EXPECT arrives'
 )
+@click.option(
+    '-T',
+    '--targets',
+    type=click.File('r'),
+    help='run SCRIPT against each "host:port [NAME=VALUE]..." line in file, setting its script variables'
+)
+@click.option('-p', '--parallel', type=int, default=16, show_default=True, help='concurrent sessions with --targets')
 @click.option('-e', '--echo', is_flag=True, help='write receive data to stdout')
+@click.option(
+    '-b',
+    '--binary',
+    is_flag=True,
+    help='exchange raw bytes; script elements may use \\x escapes and SENDs get no line ending'
+)
+@click.option(
+    '-V', '--var', 'variables', multiple=True, help='set script variable: NAME=VALUE replaces ${NAME} in the script'
+)
+@click.option('-u', '--upload', type=str, help='send the contents of file, or of stdin for -, after the script')
+@click.option(
+    '-o', '--transcript', type=str, help='write receive data to file; {host} and {port} are replaced per target'
+)
+@click.option('--rotate-bytes', type=int, default=None, help='rotate the transcript file at this size')
+@click.option('--compress', is_flag=True, help='gzip rotated transcript files')
 @click.option('-c', '--callback', is_flag=True, help='use callback mechanism')
 @click.option('-q', '--quiet', is_flag=True, help='suppress diagnostics')
 @click.option('-v', '--verbose', is_flag=True, help='increase diagnostic detail')
 @click.option('-d', '--debug', is_flag=True, help='output python stack trace on exceptions')
+@click.option(
+    '--stats', 'stats_format', type=click.Choice(['text', 'json']), default=None, help='write session timing summary'
+)
+@click.option('--record', type=click.Path(dir_okay=False), help='record the session timeline to a trace file')
+@click.option(
+    '--profile',
+    type=click.Path(dir_okay=False),
+    help='write a cProfile profile of the session to file, and of an internal connector to FILE.connector'
+)
+@tls_options
 @click.option('--subprocess', is_flag=True, hidden=True)
-def cli(address, script, file, timeout, spawn_type, echo, callback, quiet, verbose, debug, subprocess):
+def chat(
+    address, script, file, timeout, session_timeout, write_timeout, spawn_type, connect_timeout, retries, pipeline,
+    targets, parallel, echo, binary, variables, upload, transcript, rotate_bytes, compress, callback, quiet, verbose,
+    debug, stats_format, record, profile, subprocess, **tls_options
+):
+    """run SCRIPT against ADDRESS (host:port, unix:PATH or exec:COMMAND), or against every address in --targets"""
 
     def exception_handler(exception_type, exception, traceback, debug_hook=sys.excepthook):
         if debug:
@@ -41,34 +142,48 @@ def cli(address, script, file, timeout, spawn_type, echo, callback, quiet, verbo
 
     sys.excepthook = exception_handler
 
-    if isinstance(address, str):
-        if ':' in address:
-            address = address.split(':')
-        else:
-            raise ParameterError('address must include ":port"')
+    if targets:
+        if address is not None:
+            if script is not None:
+                raise ParameterError('cannot specify ADDRESS with --targets option')
+            address, script = None, address
+        if echo:
+            raise ParameterError('cannot specify --echo with --targets option')
+        if record:
+            raise ParameterError('cannot specify --record with --targets option')
+        if profile:
+            raise ParameterError('cannot specify --profile with --targets option')
+    elif address is None:
+        raise ParameterError('ADDRESS is required')
 
-    address, port = address[:2]
-    port = int(port)
+    if address:
+        address = parse_address(address)
 
     if subprocess:
-        breakpoint()
-        sys.exit(Connection((address, port), debug).run())
+        sys.exit(Connection(address, debug).run())
 
     if bool(script) and bool(file):
         raise ParameterError('cannot specify both SCRIPT and --file option')
 
     if script:
-        script = Script(script=script)
+        script = Script(script=script, binary=binary)
     elif file:
-        script = Script(file=file)
+        script = Script(file=file, binary=binary, stream=not (targets or upload))
+    else:
+        script = Script(binary=binary)
+
+    variables = parse_variables(variables)
+
+    if upload:
+        if upload == '-' and targets:
+            raise ParameterError('cannot --upload stdin with --targets option')
+        script = script.extend([Element('', SendFile(upload))])
 
     def _callback(event, data):
         click.echo(f"CALLBACK {str(event)}: {repr(data)}", err=True)
 
-    if echo:
-        output = sys.stdout
-    else:
-        output = None
+    transcript_options = dict(max_bytes=rotate_bytes, compress=compress)
+    echo = (sys.stdout.buffer if binary else sys.stdout) if echo else None
 
     if callback:
         callback = _callback
@@ -81,11 +196,204 @@ def cli(address, script, file, timeout, spawn_type, echo, callback, quiet, verbo
     if verbose:
         events = list(status.__members__.values())
     else:
-        events=[status.EXPECT, status.SEND]
+        events = [status.EXPECT, status.SEND]
+
+    tls = make_tls(**tls_options)
+    # left as None for --targets, where Batch chooses per target
+    spawn_type = spawn[spawn_type] if spawn_type else (spawn.direct if upload else None)
+
+    if targets:
+        batch = Batch(
+            read_inventory(targets),
+            script,
+            parallel=parallel,
+            variables=variables,
+            wait_timeout=timeout,
+            session_timeout=session_timeout,
+            write_timeout=write_timeout,
+            out=None,
+            err=error if verbose else None,
+            events=events,
+            spawn_type=spawn_type,
+            binary=binary,
+            pipeline=pipeline,
+            connect_timeout=connect_timeout,
+            retries=retries,
+            tls=tls,
+            stats=bool(stats_format),
+            transcript=transcript,
+            transcript_options=transcript_options
+        )
+        failed = 0
+        for result in batch.run(callback):
+            click.echo(str(result))
+            if not result.ok:
+                failed += 1
+        if not quiet:
+            click.echo(f"{len(batch.targets)} targets, {len(batch.targets) - failed} DONE, {failed} failed", err=True)
+        sys.exit(1 if failed else 0)
+
+    if transcript:
+        output = open_transcript(transcript, address, echo=echo, **transcript_options)
+    elif echo:
+        output = Transcript(echo, close_sinks=False)
+    else:
+        output = None
+
+    trace = Recorder(record, address) if record else None
+    spawn_type = spawn_type or default_spawn(address, tls)
+
+    session = Session(
+        address,
+        script,
+        wait_timeout=timeout,
+        session_timeout=session_timeout,
+        write_timeout=write_timeout,
+        out=output,
+        err=error,
+        events=events,
+        spawn_type=spawn_type,
+        binary=binary,
+        pipeline=pipeline,
+        connect_timeout=connect_timeout,
+        retries=retries,
+        tls=tls,
+        trace=trace,
+        variables=variables,
+        connector_profile=f'{profile}.connector' if profile and spawn_type == spawn.internal else None
+    )
+    output_error = None
+    try:
+        if profile:
+            profiled(profile, session.run, callback)
+        else:
+            session.run(callback)
+    finally:
+        if output:
+            # a failed transcript write must not hide the session's own outcome, so it is reported last
+            try:
+                output.close()
+            except Exception as ex:
+                output_error = ex
+        if trace:
+            trace.close()
+    if stats_format:
+        click.echo(format_stats(session.stats, stats_format), err=True)
+    if output_error:
+        raise output_error
+
+
+@cli.command(context_settings=dict(ignore_unknown_options=True, allow_extra_args=True))
+@click.argument('trace', type=click.Path(dir_okay=False))
+@click.pass_context
+def record(ctx, trace):
+    """run a chat session, recording its timeline to TRACE
+
+    Accepts the arguments and options of the chat command.  A TRACE name ending in .gz is compressed.
+    """
+    with chat.make_context('record', ['--record', trace] + ctx.args, parent=ctx) as context:
+        chat.invoke(context)
+
+
+@cli.command(name='replay-server')
+@click.argument('trace', type=click.Path(exists=True, dir_okay=False))
+@click.option('-H', '--host', type=str, default='localhost', show_default=True, help='listening address')
+@click.option('-P', '--port', type=int, default=0, help='listening port, defaults to any free port')
+@click.option(
+    '-S', '--speed', type=float, default=1.0, show_default=True, help='time compression factor; 0 for no delays'
+)
+def replay_server(trace, host, port, speed):
+    """serve the recorded server side of TRACE to every client that connects"""
+    server = ReplayServer(trace, host=host, port=port, speed=speed)
+
+    async def serve():
+        await server.start()
+        click.echo(f"replaying {trace} on {server.host}:{server.port}", err=True)
+        async with server.server:
+            await server.server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+@cli.command()
+@click.argument('address', type=str)
+@click.argument('script', type=str, required=False, default=None)
+@click.option('-f', '--file', type=click.File('r'), help='chat script file')
+@click.option('-t', '--timeout', type=int, default=None, help='timeout for each WAIT element')
+@click.option('--session-timeout', type=float, default=None, help='seconds allowed for the whole session')
+@click.option('--write-timeout', type=float, default=None, help='seconds allowed for each SEND to be written')
+@click.option('-s', '--spawn-type', type=SPAWN_TYPES, default='direct', show_default=True, help='connection program')
+@click.option('--connect-timeout', type=float, default=None, help='seconds allowed for each connection attempt round')
+@click.option('--retries', type=int, default=0, show_default=True, help='connection retries, with jittered backoff')
+@click.option('-n', '--sessions', type=int, default=16, show_default=True, help='maximum concurrent sessions')
+@click.option('-r', '--rate', type=float, default=None, help='sessions started per second, defaults to closed loop')
+@click.option('-D', '--duration', type=float, default=10.0, show_default=True, help='seconds to keep starting sessions')
+@click.option('-j', '--json', 'json_format', is_flag=True, help='write the report as JSON')
+@tls_options
+def load(
+    address, script, file, timeout, session_timeout, write_timeout, spawn_type, connect_timeout, retries, sessions,
+    rate, duration, json_format, **tls_options
+):
+    """drive ADDRESS (host:port, unix:PATH or exec:COMMAND) with concurrent sessions of SCRIPT, reporting latency"""
+    if bool(script) == bool(file):
+        raise click.UsageError('specify either SCRIPT or --file')
+    script = Script(script=script) if script else Script(file=file)
+    tls = make_tls(**tls_options)
+    runner = Load(
+        parse_address(address),
+        script,
+        sessions=sessions,
+        rate=rate,
+        duration=duration,
+        wait_timeout=timeout,
+        session_timeout=session_timeout,
+        write_timeout=write_timeout,
+        spawn_type=spawn[spawn_type],
+        connect_timeout=connect_timeout,
+        retries=retries,
+        tls=tls
+    )
+    report = runner.run()
+    click.echo(json.dumps(report) if json_format else format_load(report))
+    sys.exit(0 if set(report['statuses']) <= {str(status.DONE)} else 1)
+
+
+def format_load(report):
+    """format a load report as a summary line followed by one line per latency histogram"""
+    statuses = ' '.join(f"{key}={value}" for key, value in sorted(report['statuses'].items()))
+    lines = [
+        f"LOAD sessions={report['sessions']} elapsed={report['elapsed']:.3f} "
+        f"throughput={report['throughput']:.1f}/s {statuses}".rstrip()
+    ]
+    latencies = [('connect', report['connect']), ('session', report['session'])]
+    latencies += [(f'step {step}', summary) for step, summary in report['steps'].items()]
+    if 'wait' in report:
+        latencies.append(('wait', report['wait']))
+    for name, summary in latencies:
+        fields = ' '.join(
+            f"{key}={value * 1000:.3f}ms" if isinstance(value, float) else f"{key}={value}"
+            for key, value in summary.items()
+        )
+        lines.append(f"{name:>10} {fields}")
+    return '\n'.join(lines)
 
-    spawn_type = spawn[spawn_type]
 
-    Session((address, port), script, wait_timeout=timeout, out=output, err=error, events=events, spawn_type=spawn_type).run(callback)
+def format_stats(stats, stats_format):
+    """format a session summary as a JSON object or a line of key=value pairs"""
+    if stats_format == 'json':
+        return json.dumps(stats)
+    slowest = stats['slowest']
+    fields = [
+        f"{key}={value:.6f}" if isinstance(value, float) else f"{key}={value}"
+        for key, value in stats.items()
+        if key != 'slowest'
+    ]
+    if slowest:
+        fields.append(f"slowest={slowest['transition']}:{slowest['step']}:{slowest['duration']:.6f}")
+    return 'STATS ' + ' '.join(fields)
 
 
 if __name__ == '__main__':
@@ -1,23 +1,82 @@
 # netchat connector
 
+import argparse
+import errno
 import logging
+import os
+import select
+import selectors
+import signal
 import socket
 import sys
 import termios
 
-from collections import deque
-from select import select
+from .net import connect, numeric_addresses
+from .stats import RelayCounters, profiled
+
+BUFSIZ = 65536
+HIGH_WATER = 1048576
 
-BUFSIZ=1024
 
 class Connection():
-    def __init__(self, address, debug=False):
+    """relay data between a TCP connection and stdin/stdout
+
+    :param: address: (host, port) for TCP connection
+    :type: address: tuple
+    :param: debug: enable debug logging
+    :type: debug: bool
+    :param: bufsize: maximum size of each read
+    :type: bufsize: int
+    :param: high_water: buffered bytes in either direction at which reading that direction is paused
+    :type: high_water: int
+    :param: stdin: file descriptor read for data sent to the connection, defaults to stdin
+    :type: stdin: int, optional
+    :param: stdout: file descriptor written with data received from the connection, defaults to stdout
+    :type: stdout: int, optional
+    :param: connect_timeout: seconds allowed for each round of connection attempts
+    :type: connect_timeout: float, optional
+    :param: retries: connection attempt rounds after the first
+    :type: retries: int
+    :param: counters: relay system call, byte and wakeup counts, logged when the connection closes; created
+      automatically with debug
+    :type: counters: netchat.stats.RelayCounters, optional
+    :param: addresses: addresses already resolved for address, e.g. by the session's resolver cache
+    :type: addresses: list, optional
+
+    ..note:: trace points on the relay path are guarded by a check of the log level made once per relay,
+      so with debug off no message is formatted and no counter is updated per chunk
+    """
+
+    def __init__(
+        self,
+        address,
+        debug=False,
+        bufsize=BUFSIZ,
+        high_water=HIGH_WATER,
+        stdin=None,
+        stdout=None,
+        connect_timeout=None,
+        retries=0,
+        counters=None,
+        addresses=None
+    ):
         self.address = address
+        self.addresses = addresses
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.bufsize = bufsize
+        self.high_water = high_water
+        self.stdin = sys.stdin.fileno() if stdin is None else stdin
+        self.stdout = sys.stdout.fileno() if stdout is None else stdout
+        if self.stdout == self.stdin:
+            # the selector tracks one registration per descriptor
+            self.stdout = os.dup(self.stdin)
+        self.counters = RelayCounters() if debug and counters is None else counters
         if debug:
             logging.info('setting debug mode')
-            level=logging.DEBUG
+            level = logging.DEBUG
         else:
-            level=logging.INFO
+            level = logging.INFO
         logging.basicConfig(level=level)
         logging.debug('debug')
 
@@ -27,9 +86,9 @@ class Connection():
         old = termios.tcgetattr(fd)
         new = termios.tcgetattr(fd)
 
-        new[3] = new[3] & ~(termios.ECHO | termios.ICANON) # lflags
-        new[6][termios.VMIN] = 0  # cc
-        new[6][termios.VTIME] = 0 # cc
+        new[3] = new[3] & ~(termios.ECHO | termios.ICANON)    # lflags
+        new[6][termios.VMIN] = 0    # cc
+        new[6][termios.VTIME] = 0    # cc
 
         try:
             termios.tcsetattr(fd, termios.TCSADRAIN, new)
@@ -40,64 +99,187 @@ class Connection():
 
     def run(self):
         logging.info('run')
-        logging.debug('run')
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        #sock.setblocking(False)
         logging.info(f"Connecting to {self.address}")
-        sock.connect(self.address)
+        sock = connect(self.address, timeout=self.connect_timeout, retries=self.retries, addresses=self.addresses)
         logging.info("<connected>")
-
-        rx_buf = deque()
-        tx_buf = deque()
-
-        stdin = sys.stdin.buffer
-        stdout = sys.stdout.buffer
-
-        readable = [sock, stdin]
-        active = [sock,stdin, stdout]
-
-        done = False
-
-        while not done:
-            logging.debug(f'start: tx={len(tx_buf)} rx={len(rx_buf)}')
-
-            writeable = []
-            if len(rx_buf):
-                writeable.append(stdout)
-            if len(tx_buf):
-                writeable.append(sock)
-        
-            sources, sinks, errors = select(readable, writeable, active)
-            logging.debug(f'{len(sources)} {len(sinks)} {len(errors)}')
-
-            if sock in sinks:
-                data = tx_buf.popleft()
-                logging.debug(f'<--tx_buf {len(tx_buf)}')
-                logging.debug('-->socket {repr(data)}')
-                sock.sendall(data)
-
-            if stdout in sinks:
-                data = rx_buf.popleft()
-                logging.debug(f'<--rx_buf {len(rx_buf)}')
-                logging.debug(f'-->stdout {repr(data)}')
-                stdout.write(data)
-
-            if sock in sources:
-                logging.debug('socket.recv')
-                data = sock.recv(BUFSIZ)
-                logging.debug(f'<--socket {repr(data)}')
-                rx_buf.append(data)
-                logging.debug(f'rx_buf<-- {len(rx_buf)}')
-
-            if stdin in sources:
-                logging.debug('stdin.read')
-                data = stdin.read(BUFSIZ)
-                logging.debug(f'<--stdin {len(data)} {repr(data)}')
-                tx_buf.append(data)
-                logging.debug(f'tx_buf<-- {len(tx_buf)}')
-
-            if errors:
-                raise RuntimeError(f'socket exception: {repr(errors)}')
-
-        sock.close()
+        try:
+            self.relay(sock)
+        finally:
+            sock.close()
         logging.info("<closed>")
+        if self.counters:
+            logging.debug('relay counters %s', self.counters.to_dict())
+        return 0
+
+    def relay(self, sock):
+        """move data in both directions until the connection closes
+
+        :param: sock: connected socket
+        :type: sock: socket.socket
+        """
+        sock.setblocking(False)
+        os.set_blocking(self.stdin, False)
+        os.set_blocking(self.stdout, False)
+
+        rx_buf = bytearray()
+        tx_buf = bytearray()
+        sock_eof = False
+        stdin_eof = False
+        shutdown = False
+        self.hangup = False
+        # checked up front: a terminal that has hung up no longer reports itself as one
+        terminal = os.isatty(self.stdin)
+
+        # bound once, and counted only when requested, to keep the per-chunk path free of tracing
+        trace = logging.getLogger().isEnabledFor(logging.DEBUG)
+        counters = self.counters
+        recv, send = sock.recv, sock.send
+        stdin, stdout = self.stdin, self.stdout
+
+        def read_stdin(size):
+            return os.read(stdin, size)
+
+        def write_stdout(data):
+            return os.write(stdout, data)
+
+        if counters:
+            recv, read_stdin = counters.reader(recv, True), counters.reader(read_stdin, False)
+            send, write_stdout = counters.writer(send), counters.writer(write_stdout)
+
+        selector = selectors.DefaultSelector()
+        interest = {}
+
+        def select(fd, events):
+            if interest.get(fd, 0) == events:
+                return
+            if not events:
+                selector.unregister(fd)
+            elif fd in interest and interest[fd]:
+                selector.modify(fd, events)
+            else:
+                selector.register(fd, events)
+            interest[fd] = events
+
+        try:
+            while not (sock_eof and not rx_buf):
+                if self.hangup and not tx_buf:
+                    # the terminal is gone, so nothing more can be delivered: end now rather than waiting
+                    # for the server to close
+                    if trace:
+                        logging.debug('terminal hung up, closing')
+                    break
+                if stdin_eof and not tx_buf and not shutdown:
+                    if trace:
+                        logging.debug('stdin closed, shutting down socket for writing')
+                    sock.shutdown(socket.SHUT_WR)
+                    shutdown = True
+
+                events = 0
+                if not sock_eof and len(rx_buf) < self.high_water:
+                    events |= selectors.EVENT_READ
+                if tx_buf:
+                    events |= selectors.EVENT_WRITE
+                select(sock.fileno(), events)
+                select(self.stdin, selectors.EVENT_READ if not stdin_eof and len(tx_buf) < self.high_water else 0)
+                select(self.stdout, selectors.EVENT_WRITE if rx_buf else 0)
+
+                ready = selector.select()
+                if counters:
+                    counters.wakeups += 1
+                for key, mask in ready:
+                    fd = key.fd
+                    if fd == sock.fileno():
+                        if mask & selectors.EVENT_WRITE:
+                            self._drain(send, tx_buf)
+                        if mask & selectors.EVENT_READ:
+                            sock_eof = self._fill(recv, rx_buf)
+                    elif fd == stdout:
+                        self._drain(write_stdout, rx_buf)
+                    elif fd == stdin:
+                        stdin_eof = self._fill(read_stdin, tx_buf)
+                        if stdin_eof and terminal and not self.hangup:
+                            self.hangup = _hung_up(stdin)
+                if trace:
+                    logging.debug('tx=%d rx=%d', len(tx_buf), len(rx_buf))
+        finally:
+            selector.close()
+
+    def _fill(self, read, buf):
+        """read until the source would block, buf reaches the high-water mark, or EOF; return True on EOF"""
+        while len(buf) < self.high_water:
+            try:
+                data = read(self.bufsize)
+            except (BlockingIOError, InterruptedError):
+                return False
+            except OSError as ex:
+                # a pty reports a closed peer as EIO
+                if ex.errno == errno.EIO:
+                    self.hangup = True
+                    return True
+                raise
+            if not data:
+                return True
+            buf += data
+        return False
+
+    def _drain(self, write, buf):
+        """write buf until the sink would block or buf is empty"""
+        while buf:
+            try:
+                sent = write(buf)
+            except (BlockingIOError, InterruptedError):
+                return
+            del buf[:sent]
+
+
+def _hung_up(fd):
+    """return True if the other end of terminal fd has been closed"""
+    poller = select.poll()
+    poller.register(fd, select.POLLIN)
+    return any(event & select.POLLHUP for _, event in poller.poll(0))
+
+
+def _exit(signum, frame):
+    sys.exit(0)
+
+
+def main(argv=None):
+    """connector subprocess entry point:
+    ``python3 -m netchat.connection HOST:PORT [--debug] [--connect-timeout SECONDS] [--retries N] [--profile FILE]
+    [--resolved ADDRESS]...``"""
+    parser = argparse.ArgumentParser(prog='python3 -m netchat.connection')
+    parser.add_argument('address', metavar='HOST:PORT')
+    parser.add_argument('--debug', action='store_true')
+    parser.add_argument('--connect-timeout', type=float, default=None)
+    parser.add_argument('--retries', type=int, default=0)
+    parser.add_argument('--profile', metavar='FILE', default=None)
+    # numeric addresses the session has resolved HOST to, so the connector makes no lookup of its own
+    parser.add_argument('--resolved', metavar='ADDRESS', action='append', default=[])
+    args = parser.parse_args(argv)
+    if ':' not in args.address:
+        parser.error('address must include ":port"')
+    host, port = args.address.rsplit(':', 1)
+    connection = Connection((host, int(port)),
+                            args.debug,
+                            connect_timeout=args.connect_timeout,
+                            retries=args.retries,
+                            addresses=numeric_addresses(args.resolved, int(port)))
+    if not args.profile:
+        return connection.run()
+    # the session ends the connector with a signal: exit normally so that the profile is written, and
+    # ignore further signals while it is
+    for signum in (signal.SIGHUP, signal.SIGTERM):
+        signal.signal(signum, _exit)
+
+    def run():
+        try:
+            return connection.run()
+        finally:
+            for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+                signal.signal(signum, signal.SIG_IGN)
+
+    return profiled(args.profile, run)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
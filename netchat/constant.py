@@ -13,7 +13,8 @@ class State(enum.IntEnum):
 
 
 status = State(
-    'status', 'CONNECTING CONNECTED CLOSED DONE EXPECT EXPECT_SKIPPED FOUND SEND SEND_SKIPPED SENT EOF TIMEOUT'
+    'status',
+    'CONNECTING CONNECTED CLOSED DONE EXPECT EXPECT_SKIPPED FOUND SEND SEND_SKIPPED SENT EOF TIMEOUT FAILED TIMING SUMMARY PROGRESS'
 )
 
-spawn = State('SPAWN', 'internal socat nc')
+spawn = State('SPAWN', 'internal socat nc direct forkserver')
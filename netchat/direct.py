@@ -0,0 +1,192 @@
+# netchat in-process connection handler
+
+import errno
+import os
+import selectors
+import socket
+import ssl
+
+from time import monotonic
+
+from .constant import status
+from .exception import EOF, TimeoutError
+from .expect import Expecter
+from .handler import Handler
+from .tls import describe
+from .transport import open_transport
+
+BUFSIZ = 65536
+CHUNK = 1048576
+# sendfile and splice errors meaning that the descriptors do not support them
+UNSUPPORTED = (errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP)
+
+
+class DirectHandler(Handler):
+    """context manager for a non-blocking socket connection made from this process
+
+    :param: address: (host, port) for TCP connection, or a ``scheme:target`` string naming another transport,
+      see ``netchat.transport``
+    :type: address: tuple/str
+    :param: timeout: expect timeout
+    :type: timeout: int
+    :param: out: stream for writing connection receive data
+    :type: out: file-type
+    :param: err: stream for writing diagnostic messages
+    :type: out: file-type
+    :param: events: list of desired status change diagnostics
+    :type: events: status
+    :param: callback: function to be called on state change events
+    :type: callback: function
+
+    ..note:: EXPECT and SEND follow the pexpect handler: EXPECT is a regex and SEND is written as a line
+    """
+
+    def __init__(self, address, timeout, out, err, events, callback, **kwargs):
+        super().__init__(None, timeout, out, err, events, callback, **kwargs)
+        self.address = address
+        self.transport = open_transport(address)
+        self.sock = None
+
+    def __enter__(self):
+        self.event(status.CONNECTING)
+        self.sock = self.transport.open(timeout=self.limit(self.connect_timeout), retries=self.retries, tls=self.tls)
+        connected = describe(self.sock) if self.tls else None
+        self.sock.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.sock, selectors.EVENT_READ)
+        self.expecter = Expecter(
+            self.encoding, logfile=self.out, search_window=self.search_window, max_buffer=self.max_buffer
+        )
+        self.event(status.CONNECTED, connected)
+        return self
+
+    def __exit__(self, _, exception, traceback):
+        self.selector.close()
+        if self.tls:
+            self.tls.save(self.sock, self.address)
+        self.sock.close()
+        self.transport.close()
+        self.event(status.CLOSED)
+        return False
+
+    def alive(self):
+        """return True unless the peer has closed or reset the connection"""
+        self.selector.modify(self.sock, selectors.EVENT_READ)
+        if not self.selector.select(0):
+            return True
+        try:
+            if not self.tls:
+                return bool(self.sock.recv(1, socket.MSG_PEEK))
+            # TLS records cannot be peeked; anything decrypted is kept for the next EXPECT
+            received = self.sock.recv(BUFSIZ)
+        except (BlockingIOError, ssl.SSLWantReadError, ssl.SSLWantWriteError):
+            return True
+        except OSError:
+            return False
+        self.rx.write(received)
+        self.expecter.feed(received)
+        return bool(received)
+
+    def _deadline(self, timeout):
+        if timeout is None:
+            return None
+        return monotonic() + timeout
+
+    def _wait(self, deadline, events):
+        if deadline is None:
+            remaining = None
+        else:
+            remaining = max(deadline - monotonic(), 0)
+        self.selector.modify(self.sock, events)
+        if not self.selector.select(remaining):
+            raise TimeoutError(f'timeout waiting for {self.transport}')
+
+    def _expect(self, pattern, timeout):
+        deadline = self._deadline(timeout)
+        while True:
+            match = self.expecter.search(pattern)
+            if match:
+                return match[2]
+            if not (self.tls and self.sock.pending()):
+                self._wait(deadline, selectors.EVENT_READ)
+            try:
+                received = self.sock.recv(BUFSIZ)
+            except (BlockingIOError, ssl.SSLWantReadError):
+                continue
+            except ssl.SSLWantWriteError:
+                self._wait(deadline, selectors.EVENT_WRITE)
+                continue
+            self.rx.write(received)
+            self.expecter.feed(received)
+            if not received:
+                raise EOF(f'connection closed by {self.transport}')
+
+    def _send(self, data):
+        data = data + self.linesep
+        self.expecter.log(data)
+        if not self.binary:
+            data = data.encode()
+        self.tx.write(data)
+        self._write(data)
+
+    def _write(self, data):
+        deadline = self._deadline(self.limit(self.write_timeout))
+        view = memoryview(data)
+        while view:
+            try:
+                sent = self.sock.send(view)
+            except (BlockingIOError, ssl.SSLWantWriteError):
+                self._wait(deadline, selectors.EVENT_WRITE)
+                continue
+            except ssl.SSLWantReadError:
+                self._wait(deadline, selectors.EVENT_READ)
+                continue
+            view = view[sent:]
+
+    def _send_file(self, upload, file):
+        # the kernel copies the file unless TLS must encrypt it here; write_timeout bounds each stall
+        if not self.tls and upload.regular and self._sendfile(upload, file):
+            return
+        if not self.tls and upload.pipe and hasattr(os, 'splice') and self._splice(upload, file):
+            return
+        buffer = bytearray(CHUNK)
+        view = memoryview(buffer)
+        while True:
+            count = file.readinto(buffer)
+            if not count:
+                return
+            self._write(view[:count])
+            upload.add(count)
+
+    def _sendfile(self, upload, file):
+        offset = 0
+        while offset < upload.total:
+            try:
+                count = os.sendfile(self.sock.fileno(), file.fileno(), offset, min(CHUNK, upload.total - offset))
+            except BlockingIOError:
+                self._wait(self._deadline(self.limit(self.write_timeout)), selectors.EVENT_WRITE)
+                continue
+            except OSError as ex:
+                if offset == 0 and ex.errno in UNSUPPORTED:
+                    return False
+                raise
+            if not count:
+                break
+            offset += count
+            upload.add(count)
+        return True
+
+    def _splice(self, upload, file):
+        while True:
+            try:
+                count = os.splice(file.fileno(), self.sock.fileno(), CHUNK)
+            except BlockingIOError:
+                self._wait(self._deadline(self.limit(self.write_timeout)), selectors.EVENT_WRITE)
+                continue
+            except OSError as ex:
+                if not upload.sent and ex.errno in UNSUPPORTED:
+                    return False
+                raise
+            if not count:
+                return True
+            upload.add(count)
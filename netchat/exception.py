@@ -11,3 +11,11 @@ class TimeoutError(Error):
 
 class ParameterError(Error):
     pass
+
+
+class EOF(Error):
+    pass
+
+
+class ForkServerError(Error, ConnectionError):
+    pass
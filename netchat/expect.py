@@ -0,0 +1,131 @@
+# netchat receive buffer and pattern matching
+
+import codecs
+
+from .pattern import compile_pattern
+
+
+class Expecter():
+    """receive buffer for the in-process handlers, matching EXPECT patterns as pexpect would
+
+    Received data is kept as a list of chunks; a failed search records how far it got, so the next
+    search for the same pattern only rescans the tail that could still hold a match.
+
+    :param: encoding: codec used to decode received data, or None to match raw bytes
+    :type: encoding: str
+    :param: logfile: stream for writing received data
+    :type: logfile: file-type, optional
+    :param: search_window: characters before new data rescanned by a regex EXPECT, defaults to the whole buffer
+    :type: search_window: int, optional
+    :param: max_buffer: characters of unmatched receive data retained, defaults to unlimited
+    :type: max_buffer: int, optional
+
+    ..note:: literal patterns are always searched incrementally; a regex is only when search_window is set
+    """
+
+    def __init__(self, encoding='utf-8', logfile=None, search_window=None, max_buffer=None):
+        self.decoder = codecs.getincrementaldecoder(encoding)() if encoding else None
+        self.empty = '' if encoding else b''
+        self.logfile = logfile
+        self.search_window = search_window
+        self.max_buffer = max_buffer
+        self.chunks = []
+        self.size = 0
+        self.scanned = 0
+        self.pattern = None
+        self.before = None
+        self.after = None
+        self.bytes_received = 0
+        self.bytes_scanned = 0
+
+    @property
+    def buffer(self):
+        """unmatched receive data"""
+        return self._join()
+
+    def _join(self):
+        if len(self.chunks) > 1:
+            self.chunks = [self.empty.join(self.chunks)]
+        return self.chunks[0] if self.chunks else self.empty
+
+    def _tail(self, count):
+        """return the last count characters of the buffer"""
+        if count <= 0:
+            return self.empty
+        if count >= self.size:
+            return self._join()
+        parts = []
+        length = 0
+        for chunk in reversed(self.chunks):
+            parts.append(chunk)
+            length += len(chunk)
+            if length >= count:
+                break
+        parts.reverse()
+        return self.empty.join(parts)[-count:]
+
+    def feed(self, data):
+        """decode received data and append it to the buffer
+
+        :param: data: bytes received from the connection
+        :type: data: bytes
+        """
+        self.bytes_received += len(data)
+        text = self.decoder.decode(data, final=not data) if self.decoder else data
+        if text:
+            self.log(text)
+            self.chunks.append(text)
+            self.size += len(text)
+            if self.max_buffer is not None and self.size > 2 * self.max_buffer:
+                self._trim()
+
+    def _trim(self):
+        dropped = self.size - self.max_buffer
+        self.chunks = [self._join()[dropped:]]
+        self.size = self.max_buffer
+        self.scanned = max(self.scanned - dropped, 0)
+
+    def log(self, text):
+        if self.logfile:
+            self.logfile.write(text)
+            self.logfile.flush()
+
+    def search(self, pattern):
+        """search the buffer for pattern, consuming the buffer through the end of the match
+
+        :param: pattern: EXPECT pattern
+        :type: pattern: netchat.pattern.Pattern, netchat.pattern.PatternSet or str
+        :return: (start, end, index) of the match and the matching alternative, or None
+        :rtype: tuple
+        """
+        if isinstance(pattern, (str, bytes)):
+            pattern = compile_pattern(pattern)
+        if pattern is not self.pattern:
+            self.pattern = pattern
+            self.scanned = 0
+        if self.max_buffer is not None and self.size > self.max_buffer:
+            self._trim()
+
+        if pattern.overlap is not None:
+            start = max(self.scanned - pattern.overlap, 0)
+        elif self.search_window is not None:
+            start = max(self.scanned - self.search_window, 0)
+        else:
+            start = 0
+
+        tail = self._tail(self.size - start)
+        self.bytes_scanned += len(tail)
+        span = pattern.search(tail)
+        if not span:
+            self.scanned = self.size
+            return None
+
+        buffer = self._join()
+        offset = self.size - len(tail)
+        start, end, index = span[0] + offset, span[1] + offset, span[2]
+        self.before = buffer[:start]
+        self.after = buffer[start:end]
+        self.chunks = [buffer[end:]] if end < len(buffer) else []
+        self.size = len(buffer) - end
+        self.scanned = 0
+        return start, end, index
@@ -0,0 +1,379 @@
+# netchat pre-forked connector server
+
+import array
+import fcntl
+import json
+import os
+import pexpect.fdpexpect
+import signal
+import socket
+import stat
+import struct
+import subprocess
+import sys
+import tempfile
+import termios
+import tty
+
+from time import monotonic, sleep
+
+from .connection import Connection
+from .constant import status
+from .exception import ForkServerError
+from .handler import Handler
+from .net import numeric_addresses, numeric_hosts
+
+# the server passes the caller's terminal on to the connector, so only the owner may use the socket:
+# it lives in a private directory, and both ends check the uid of their peer
+DEFAULT_PATH = os.environ.get('NETCHAT_FORKSERVER')
+IDLE_TIMEOUT = 600
+START_TIMEOUT = 10
+CLOSE_GRACE = 1.0
+
+
+def runtime_dir():
+    """return the per-user directory holding the forkserver socket, creating it if needed
+
+    ``$XDG_RUNTIME_DIR/netchat``, or ``netchat-UID`` in the temp directory, created with mode 0700; an
+    existing directory must be owned by the user and closed to other users
+    """
+    base = os.environ.get('XDG_RUNTIME_DIR')
+    path = os.path.join(base, 'netchat') if base else os.path.join(tempfile.gettempdir(), f'netchat-{os.getuid()}')
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise ForkServerError(f'unsafe forkserver directory {path}: it must be a directory owned by you with mode 0700')
+    return path
+
+
+def default_path():
+    """return the forkserver socket path: ``$NETCHAT_FORKSERVER``, or ``forkserver.sock`` in ``runtime_dir()``"""
+    return DEFAULT_PATH or os.path.join(runtime_dir(), 'forkserver.sock')
+
+
+def check_peer(sock):
+    """raise ForkServerError unless the process at the other end of a unix socket runs as this user"""
+    if not hasattr(socket, 'SO_PEERCRED'):
+        # without peer credentials the private directory is the only protection
+        return
+    _, uid, _ = struct.unpack('3i', sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i')))
+    if uid != os.getuid():
+        raise ForkServerError(f'forkserver peer runs as uid {uid}, not {os.getuid()}')
+
+
+class _Lock():
+    """exclusive lock on ``PATH.lock`` serializing forkserver starts and socket removal"""
+
+    def __init__(self, path):
+        self.path = path + '.lock'
+
+    def __enter__(self):
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, _, exception, traceback):
+        os.close(self.fd)
+        return False
+
+
+def send_request(sock, request, fds):
+    """send a JSON request line, passing file descriptors with SCM_RIGHTS"""
+    data = json.dumps(request).encode() + b'\n'
+    ancdata = [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', fds))] if fds else []
+    sock.sendmsg([data], ancdata)
+
+
+def recv_request(sock, maxfds=1):
+    """receive a JSON request line and the file descriptors passed with it"""
+    fds = array.array('i')
+    data, ancdata, flags, _ = sock.recvmsg(65536, socket.CMSG_LEN(maxfds * fds.itemsize))
+    for level, kind, cmsg in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(cmsg[:len(cmsg) - (len(cmsg) % fds.itemsize)])
+    return json.loads(data) if data else None, list(fds)
+
+
+class ForkServer():
+    """warm connector process: forks a ``Connection`` child for each request on a unix socket
+
+    A request is a JSON line ``{"address": [host, port], "resolved": [numeric host, ...], "debug": false,
+    "connect_timeout": null, "retries": 0}`` sent with one file descriptor, the terminal the child relays through; the reply is ``{"pid": pid}``.
+    A ``{"shutdown": true}`` request stops the server.
+
+    :param: path: unix socket path
+    :type: path: str
+    :param: idle_timeout: seconds without a request before the server exits
+    :type: idle_timeout: float
+    """
+
+    def __init__(self, path=None, idle_timeout=IDLE_TIMEOUT):
+        self.path = path or default_path()
+        self.idle_timeout = idle_timeout
+        self.inode = None
+
+    def serve_forever(self):
+        signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+        listener = self.listen()
+        if listener is None:
+            return
+        try:
+            while True:
+                try:
+                    conn, _ = listener.accept()
+                except socket.timeout:
+                    return
+                with conn:
+                    try:
+                        check_peer(conn)
+                    except ForkServerError:
+                        continue
+                    if not self.handle(conn, listener):
+                        return
+        finally:
+            listener.close()
+            with _Lock(self.path):
+                # a server started after this one may own the path by now
+                if _inode(self.path) == self.inode:
+                    os.unlink(self.path)
+
+    def listen(self):
+        """bind the socket, replacing a stale one; return None if another server is already listening"""
+        with _Lock(self.path):
+            sock = _connect(self.path)
+            if sock:
+                sock.close()
+                return None
+            if _inode(self.path) is not None:
+                os.unlink(self.path)
+            listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            umask = os.umask(0o077)
+            try:
+                listener.bind(self.path)
+            finally:
+                os.umask(umask)
+            listener.listen(128)
+            self.inode = _inode(self.path)
+        listener.settimeout(self.idle_timeout)
+        return listener
+
+    def handle(self, conn, listener):
+        """fork a connector for one request; return False when the server should stop"""
+        request, fds = recv_request(conn)
+        if not request or len(fds) != 1:
+            for fd in fds:
+                os.close(fd)
+            return not (request or {}).get('shutdown')
+        pid = os.fork()
+        if pid == 0:
+            listener.close()
+            conn.close()
+            self.child(request, fds[0])
+        os.close(fds[0])
+        conn.sendall(json.dumps(dict(pid=pid)).encode() + b'\n')
+        return True
+
+    def child(self, request, fd):
+        code = 1
+        try:
+            os.setsid()
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            # the session resolves the address through its cache; the server itself never resolves, so a
+            # lookup the session could not make holds up only this child
+            host, port = request['address']
+            code = Connection((host, port),
+                              request.get('debug', False),
+                              stdin=fd,
+                              stdout=fd,
+                              connect_timeout=request.get('connect_timeout'),
+                              retries=request.get('retries', 0),
+                              addresses=numeric_addresses(request.get('resolved') or [], port)).run()
+        finally:
+            os._exit(code)
+
+
+def start(path=None, timeout=START_TIMEOUT):
+    """start a forkserver listening on path unless one is already running
+
+    :param: path: unix socket path
+    :type: path: str
+    :param: timeout: seconds to wait for the server to start listening
+    :type: timeout: float
+    """
+    path = path or default_path()
+    with _Lock(path):
+        sock = _connect(path)
+        if sock:
+            sock.close()
+            return
+        subprocess.Popen([sys.executable, '-m', 'netchat.forkserver', path],
+                         stdin=subprocess.DEVNULL,
+                         stdout=subprocess.DEVNULL,
+                         stderr=subprocess.DEVNULL,
+                         start_new_session=True)
+    deadline = monotonic() + timeout
+    while monotonic() < deadline:
+        sock = _connect(path)
+        if sock:
+            sock.close()
+            return
+        sleep(0.01)
+    raise ForkServerError(f'forkserver did not start on {path}')
+
+
+def stop(path=None):
+    """stop the forkserver listening on path, if any
+
+    :param: path: unix socket path
+    :type: path: str
+    """
+    sock = _connect(path or default_path())
+    if sock:
+        with sock:
+            send_request(sock, dict(shutdown=True), [])
+
+
+def _connect(path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def _inode(path):
+    try:
+        return os.lstat(path).st_ino
+    except FileNotFoundError:
+        return None
+
+
+def fork(address, fd, path=None, debug=False, connect_timeout=None, retries=0):
+    """ask the forkserver for a connector relaying between address and fd
+
+    :param: address: (host, port) for TCP connection
+    :type: address: tuple
+    :param: fd: terminal file descriptor for the connector's stdin and stdout
+    :type: fd: int
+    :param: connect_timeout: seconds allowed for each round of connection attempts
+    :type: connect_timeout: float, optional
+    :param: retries: connection attempt rounds after the first
+    :type: retries: int
+    :return: pid of the connector
+    :rtype: int
+    """
+    path = path or default_path()
+    # resolved through this process's cache, so that sessions to the same host share one lookup
+    resolved = numeric_hosts(address)
+    sock = _connect(path)
+    if not sock:
+        start(path)
+        sock = _connect(path)
+        if not sock:
+            raise ForkServerError(f'forkserver on {path} stopped before accepting the request')
+    with sock:
+        check_peer(sock)
+        request = dict(
+            address=list(address), resolved=resolved, debug=debug, connect_timeout=connect_timeout, retries=retries
+        )
+        send_request(sock, request, [fd])
+        reply = sock.makefile('rb').readline()
+    try:
+        return json.loads(reply)['pid']
+    except (ValueError, KeyError, TypeError):
+        raise ForkServerError(f'forkserver on {path} refused request') from None
+
+
+class ForkHandler(Handler):
+    """context manager for a connector forked by the forkserver, driven through a pty with pexpect
+
+    :param: address: (host, port) for TCP connection
+    :type: address: tuple
+    :param: path: forkserver unix socket path, defaults to ``default_path()``
+    :type: path: str, optional
+
+    remaining parameters are as for ``Handler``
+    """
+
+    def __init__(self, address, timeout, out, err, events, callback, *, path=None, **kwargs):
+        super().__init__(None, timeout, out, err, events, callback, **kwargs)
+        self.address = address
+        self.path = path
+        self.pid = None
+        self.tty = None
+
+    def __enter__(self):
+        self.event(status.CONNECTING)
+        master, slave = os.openpty()
+        attributes = termios.tcgetattr(slave)
+        attributes[3] &= ~termios.ECHO
+        termios.tcsetattr(slave, termios.TCSANOW, attributes)
+        self.tty = os.ttyname(slave)
+        try:
+            self.pid = fork(self.address, slave, self.path, connect_timeout=self.connect_timeout, retries=self.retries)
+        except Exception:
+            os.close(master)
+            raise
+        finally:
+            os.close(slave)
+        self.child = pexpect.fdpexpect.fdspawn(
+            master, encoding=self.encoding, timeout=self.timeout, logfile=self.out, searchwindowsize=self.search_window
+        )
+        self.child.logfile_read = self.rx
+        self.child.logfile_send = self.tx
+        self.event(status.CONNECTED)
+        return self
+
+    def __exit__(self, _, exception, traceback):
+        self._drain()
+        self.child.close()
+        self._terminate()
+        self.event(status.CLOSED)
+        return False
+
+    def _drain(self, grace=CLOSE_GRACE):
+        # closing the pty master discards input the connector has not read yet, such as the last SEND
+        try:
+            fd = os.open(self.tty, os.O_RDWR | os.O_NOCTTY)
+        except OSError:
+            return
+        try:
+            deadline = monotonic() + grace
+            while monotonic() < deadline and self.alive():
+                pending = fcntl.ioctl(fd, termios.FIONREAD, b'\0' * 4)
+                if not int.from_bytes(pending, sys.byteorder):
+                    return
+                sleep(0.001)
+        finally:
+            os.close(fd)
+
+    def _terminate(self, grace=CLOSE_GRACE):
+        # the connector exits as soon as it sees the pty hang up and has flushed the last send
+        deadline = monotonic() + grace
+        while monotonic() < deadline:
+            try:
+                os.kill(self.pid, 0)
+            except ProcessLookupError:
+                return
+            sleep(0.005)
+        try:
+            os.kill(self.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    def alive(self):
+        """return True while the connector process is running"""
+        try:
+            os.kill(self.pid, 0)
+        except ProcessLookupError:
+            return False
+        return self.child.isalive()
+
+
+if __name__ == '__main__':
+    ForkServer(*sys.argv[1:2]).serve_forever()
@@ -0,0 +1,265 @@
+# netchat handler objects
+
+import os
+import pexpect
+import stat
+
+from time import monotonic, sleep
+
+from .constant import status
+from .exception import ParameterError, TimeoutError
+from .pattern import compile_pattern
+from .script import SendFile
+from .stats import Counter, Stats
+
+EXIT_GRACE = 5.0
+PROGRESS_BYTES = 1048576
+
+
+class Upload():
+    """a ``@file`` SEND in progress, reporting ``status.PROGRESS`` events of {path, sent, total}
+
+    :param: handler: handler sending the file
+    :type: handler: netchat.handler.Handler
+    :param: source: SEND being run
+    :type: source: netchat.script.SendFile
+    :param: file: opened source
+    :type: file: file-type
+    """
+
+    def __init__(self, handler, source, file):
+        info = os.fstat(file.fileno())
+        self.handler = handler
+        self.source = source
+        self.regular = stat.S_ISREG(info.st_mode)
+        self.pipe = stat.S_ISFIFO(info.st_mode)
+        self.total = info.st_size if self.regular else None
+        self.sent = 0
+        self.reported = 0
+
+    def add(self, count):
+        """count bytes written to the connection, reporting progress every ``PROGRESS_BYTES``"""
+        self.sent += count
+        self.handler.tx.bytes += count
+        if self.sent - self.reported >= PROGRESS_BYTES:
+            self.report()
+
+    def report(self):
+        self.reported = self.sent
+        self.handler.event(status.PROGRESS, dict(path=self.source.path, sent=self.sent, total=self.total))
+
+
+class Handler():
+    """context manager for the pexpect subprocess
+
+    :param: command: command line for the spawned subprocess
+    :type: command: str
+    :param: timeout: expect timeout
+    :type: timeout: int
+    :param: out: stream for writing connection receive data
+    :type: out: file-type
+    :param: err: stream for writing diagnostic messages
+    :type: out: file-type
+    :param: events: list of desired status change diagnostics
+    :type: events: status
+    :param: callback: function to be called on state change events
+    :type: callback: function
+    :param: search_window: receive data before new data rescanned by a regex EXPECT
+    :type: search_window: int, optional
+    :param: max_buffer: unmatched receive data retained (in-process handlers only)
+    :type: max_buffer: int, optional
+    :param: binary: exchange bytes without decoding; ``out`` must then accept bytes
+    :type: binary: bool
+    :param: trace: recorder receiving every status event and the data received and sent
+    :type: trace: netchat.trace.Recorder, optional
+    :param: connect_timeout: seconds allowed for each round of connection attempts
+    :type: connect_timeout: float, optional
+    :param: retries: connection attempt rounds after the first, separated by a jittered exponential backoff
+    :type: retries: int
+    :param: tls: TLS settings and session cache; in-process connections only
+    :type: tls: netchat.tls.TLS, optional
+    :param: session_timeout: seconds allowed for the whole session, from ``start``
+    :type: session_timeout: float, optional
+    :param: write_timeout: seconds allowed for each SEND to be written (in-process handlers only)
+    :type: write_timeout: float, optional
+    :param: exit_grace: seconds a subprocess that outlives its terminating signals is given to exit before
+      it is killed, defaults to not waiting for it
+    :type: exit_grace: float, optional
+    """
+
+    def __init__(
+        self,
+        command,
+        timeout,
+        out,
+        err,
+        events,
+        callback,
+        *,
+        search_window=None,
+        max_buffer=None,
+        binary=False,
+        trace=None,
+        connect_timeout=None,
+        retries=0,
+        tls=None,
+        session_timeout=None,
+        write_timeout=None,
+        exit_grace=None
+    ):
+        self.command = command
+        self.timeout = timeout
+        self.out = out
+        self.err = err
+        self.events = events
+        self.callback = callback
+        self.search_window = search_window
+        self.max_buffer = max_buffer
+        self.binary = binary
+        self.encoding = None if binary else 'utf-8'
+        # a binary SEND is written as is; the script adds any line ending it needs
+        self.linesep = b'' if binary else '\n'
+        self.session_timeout = session_timeout
+        self.write_timeout = write_timeout
+        self.exit_grace = exit_grace
+        self.trace = trace
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.tls = tls
+        self.rx = Counter(trace and trace.rx)
+        self.tx = Counter(trace and trace.tx)
+        self.start()
+
+    def __enter__(self):
+        self.event(status.CONNECTING)
+        self.child = pexpect.spawn(
+            self.command,
+            encoding=self.encoding,
+            timeout=self.timeout,
+            logfile=self.out,
+            echo=False,
+            searchwindowsize=self.search_window
+        )
+        self.child.logfile_read = self.rx
+        self.child.logfile_send = self.tx
+        self.event(status.CONNECTED)
+        return self
+
+    def __exit__(self, _, exception, traceback):
+        if self.child.isalive() and not self.child.terminate() and self.exit_grace:
+            deadline = monotonic() + self.exit_grace
+            while self.child.isalive() and monotonic() < deadline:
+                sleep(0.01)
+            self.child.terminate(force=True)
+        self.event(status.CLOSED)
+        return False
+
+    def alive(self):
+        """return True if the connection is still usable"""
+        return self.child.isalive()
+
+    def start(self):
+        """begin timing a script run and start its ``session_timeout``"""
+        self.stats = Stats()
+        self.deadline = None if self.session_timeout is None else monotonic() + self.session_timeout
+
+    def expired(self):
+        """return True once the session deadline has passed"""
+        return self.deadline is not None and monotonic() >= self.deadline
+
+    def sleep(self, seconds):
+        """pause with the connection open, raising TimeoutError if the session deadline comes first"""
+        allowed = self.limit(seconds)
+        sleep(allowed)
+        if allowed < seconds:
+            raise TimeoutError('session timeout during sleep')
+
+    def limit(self, timeout):
+        """return the seconds allowed for a wait of ``timeout`` seconds, bounded by the session deadline"""
+        if self.deadline is None:
+            return timeout
+        remaining = max(self.deadline - monotonic(), 0)
+        return remaining if timeout is None else min(timeout, remaining)
+
+    def event(self, event, data=None, step=None):
+        transition = self.stats.mark(event, data, self.rx.bytes, self.tx.bytes, step)
+        self._emit(event, data)
+        if transition:
+            self._emit(status.TIMING, transition)
+        return event
+
+    def summary(self, result):
+        """record the final session status and emit the session summary
+
+        :param: result: status returned by the session
+        :type: result: netchat.status
+        :return: session summary
+        :rtype: dict
+        """
+        self.stats.finish(result)
+        summary = self.stats.summary()
+        self._emit(status.SUMMARY, summary)
+        return summary
+
+    def _emit(self, event, data=None):
+        if self.trace:
+            self.trace.event(event, data)
+        if event in self.events:
+            if self.err:
+                if data:
+                    self.err.write(f"{str(event)} {repr(data)}\n")
+                else:
+                    self.err.write(f"{str(event)}\n")
+            if self.callback:
+                self.callback(event, data)
+
+    def expect(self, pattern, timeout=None, step=None):
+        """wait for pattern, returning the index of the matching alternative
+
+        :param: pattern: EXPECT
+        :type: pattern: str/bytes/netchat.pattern.Pattern/netchat.pattern.PatternSet
+        :param: timeout: seconds to wait, defaults to the handler's timeout
+        :type: timeout: float, optional
+        :param: step: script step number reported in the EXPECT's timing
+        :type: step: int, optional
+        :return: alternative index
+        :rtype: int
+        """
+        if pattern:
+            if isinstance(pattern, (str, bytes)):
+                pattern = compile_pattern(pattern)
+            self.event(status.EXPECT, pattern.text, step)
+            index = self._expect(pattern, self.limit(self.timeout if timeout is None else timeout))
+            self.event(status.FOUND, pattern[index].text)
+            return index
+        else:
+            self.event(status.EXPECT_SKIPPED, step=step)
+            return 0
+
+    def send(self, data, step=None):
+        if isinstance(data, SendFile):
+            self.event(status.SEND, str(data), step)
+            with data.open() as file:
+                upload = Upload(self, data, file)
+                self._send_file(upload, file)
+            upload.report()
+            self.event(status.SENT, str(data))
+        elif data:
+            self.event(status.SEND, data, step)
+            self._send(data)
+            self.event(status.SENT, data)
+        else:
+            self.event(status.SEND_SKIPPED, step=step)
+
+    def _expect(self, pattern, timeout):
+        if pattern.literal:
+            return self.child.expect_exact(pattern.text, timeout=timeout)
+        self.child.expect(pattern.regex, timeout=timeout)
+        return pattern.index(self.child.match)
+
+    def _send(self, data):
+        self.child.send(data + self.linesep)
+
+    def _send_file(self, upload, file):
+        # the connector's pty would alter the data and truncate long lines
+        raise ParameterError(f'{upload.source} requires spawn.direct or AsyncSession')
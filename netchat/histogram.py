@@ -0,0 +1,118 @@
+# netchat latency histograms
+
+SUB_BUCKET_BITS = 7
+PERCENTILES = (50, 90, 99, 99.9)
+UNIT = 1e-6
+
+
+class Histogram():
+    """HDR-style log-linear histogram of durations, mergeable across workers
+
+    Values are recorded in microseconds into buckets whose width grows with the value, so every
+    recorded value is reported within ``1 / 2**(sub_bucket_bits - 1)`` of its true value (under 2%
+    with the default of 7 bits) at a constant cost per ``record`` and a memory footprint independent
+    of the number of values.  Buckets are kept sparse, so ``merge`` and ``to_dict`` cost only the
+    buckets in use.
+
+    :param: sub_bucket_bits: binary digits of precision kept for each value
+    :type: sub_bucket_bits: int
+    """
+
+    __slots__ = ('sub_bucket_bits', 'half', 'counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self, sub_bucket_bits=SUB_BUCKET_BITS):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.half = 1 << (sub_bucket_bits - 1)
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        exponent = max(0, value.bit_length() - self.sub_bucket_bits)
+        return exponent * self.half + (value >> exponent)
+
+    def _value(self, index):
+        # midpoint of the values sharing bucket index
+        exponent = max(0, index // self.half - 1)
+        low = (index - exponent * self.half) << exponent
+        return low + ((1 << exponent) - 1) // 2
+
+    def record(self, seconds, count=1):
+        """record a duration
+
+        :param: seconds: duration
+        :type: seconds: float
+        :param: count: number of times the duration occurred
+        :type: count: int
+        """
+        value = max(0, int(seconds/UNIT + 0.5))
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.count += count
+        self.total += value * count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """add the values recorded in another histogram of the same precision
+
+        :param: other: histogram to merge
+        :type: other: netchat.histogram.Histogram
+        :return: self
+        :rtype: netchat.histogram.Histogram
+        """
+        if other.sub_bucket_bits != self.sub_bucket_bits:
+            raise ValueError('cannot merge histograms of different precision')
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.count:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+    def percentile(self, percent):
+        """return the duration in seconds at or below which ``percent`` of the values fall, or None if empty"""
+        if not self.count:
+            return None
+        rank = max(1, -(-self.count * percent // 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(max(self._value(index), self.min), self.max) * UNIT
+        return self.max * UNIT
+
+    def summary(self, percentiles=PERCENTILES):
+        """return count, min, mean, max and percentiles in seconds as a dict"""
+        result = dict(count=self.count)
+        if self.count:
+            result.update(min=self.min * UNIT, mean=self.total / self.count * UNIT, max=self.max * UNIT)
+            result.update((f'p{p:g}', self.percentile(p)) for p in percentiles)
+        return {key: round(value, 6) if isinstance(value, float) else value for key, value in result.items()}
+
+    def to_dict(self):
+        """return the histogram as plain data, e.g. for sending it from a worker process"""
+        return dict(
+            sub_bucket_bits=self.sub_bucket_bits,
+            counts=sorted(self.counts.items()),
+            total=self.total,
+            min=self.min,
+            max=self.max
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        """return a histogram created from ``to_dict`` output"""
+        histogram = cls(data['sub_bucket_bits'])
+        histogram.counts = {int(index): count for index, count in data['counts']}
+        histogram.count = sum(histogram.counts.values())
+        histogram.total = data['total']
+        histogram.min = data['min']
+        histogram.max = data['max']
+        return histogram
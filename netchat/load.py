@@ -0,0 +1,173 @@
+# netchat load generator
+
+import queue
+import threading
+
+from collections import Counter
+from time import monotonic, sleep
+
+from .constant import status
+from .histogram import Histogram
+from .script import Script
+from .session import Session
+
+
+class LoadStats():
+    """status counts and latency histograms for the sessions run by one load worker
+
+    Each worker records into its own ``LoadStats`` without locking; the workers' stats are
+    combined with ``merge`` when the run ends.
+    """
+
+    def __init__(self):
+        self.statuses = Counter()
+        self.connect = Histogram()
+        self.session = Histogram()
+        self.wait = Histogram()
+        self.steps = {}
+
+    def timing(self, event, transition):
+        """session callback recording ``status.TIMING`` transitions"""
+        if event != status.TIMING:
+            return
+        if transition['transition'].startswith(str(status.CONNECTING)):
+            self.connect.record(transition['duration'])
+        elif transition['transition'].startswith(str(status.EXPECT)):
+            step = self.steps.get(transition['step'])
+            if step is None:
+                step = self.steps[transition['step']] = Histogram()
+            step.record(transition['duration'])
+
+    def merge(self, other):
+        """add another worker's counts and histograms
+
+        :param: other: worker stats
+        :type: other: netchat.load.LoadStats
+        :return: self
+        :rtype: netchat.load.LoadStats
+        """
+        self.statuses.update(other.statuses)
+        self.connect.merge(other.connect)
+        self.session.merge(other.session)
+        self.wait.merge(other.wait)
+        for step, histogram in other.steps.items():
+            self.steps.setdefault(step, Histogram()).merge(histogram)
+        return self
+
+
+class Load():
+    """run many concurrent instances of a script against one target, at a controlled arrival rate
+
+    With ``rate`` set, sessions are started on a fixed schedule of ``rate`` per second, each by the
+    next idle worker; the delay between a session's scheduled and actual start is reported as ``wait``,
+    so a saturated target shows up in the results rather than silently lowering the rate.  Without
+    ``rate`` each worker starts a new session as soon as its previous one finishes.
+
+    :param: address: (host, port) of the target
+    :type: address: tuple
+    :param: script: script run by every session
+    :type: script: str/Script
+    :param: sessions: maximum number of concurrent sessions
+    :type: sessions: int
+    :param: rate: sessions started per second, defaults to as fast as the workers allow
+    :type: rate: float, optional
+    :param: duration: seconds during which new sessions are started
+    :type: duration: float
+    :param: kwargs: keyword arguments passed to each ``Session``; ``out`` and ``err`` default to None
+    :type: kwargs: dict
+    """
+
+    def __init__(self, address, script, *, sessions=16, rate=None, duration=10.0, **kwargs):
+        self.address = address
+        if isinstance(script, str):
+            script = Script(script=script, binary=kwargs.get('binary', False))
+        self.script = script
+        self.sessions = sessions
+        self.rate = rate
+        self.duration = duration
+        self.kwargs = dict(out=None, err=None)
+        self.kwargs.update(kwargs, events=[status.TIMING])
+        self.stats = None
+
+    def run(self):
+        """run the load, returning the report from ``report``
+
+          :return: load report
+          :rtype: dict
+        """
+        started = monotonic()
+        deadline = started + self.duration
+        workers = [LoadStats() for _ in range(self.sessions)]
+        if self.rate:
+            schedule = queue.Queue()
+            threads = [threading.Thread(target=self._scheduled, args=(stats, schedule)) for stats in workers]
+        else:
+            threads = [threading.Thread(target=self._closed, args=(stats, deadline)) for stats in workers]
+        for thread in threads:
+            thread.start()
+        if self.rate:
+            self._schedule(schedule, started, deadline)
+        for thread in threads:
+            thread.join()
+        elapsed = monotonic() - started
+        self.stats = LoadStats()
+        for stats in workers:
+            self.stats.merge(stats)
+        return self.report(elapsed)
+
+    def _schedule(self, schedule, started, deadline):
+        count = 0
+        while True:
+            due = started + count / self.rate
+            if due >= deadline:
+                break
+            delay = due - monotonic()
+            if delay > 0:
+                sleep(delay)
+            schedule.put(due)
+            count += 1
+        for _ in range(self.sessions):
+            schedule.put(None)
+
+    def _scheduled(self, stats, schedule):
+        for due in iter(schedule.get, None):
+            stats.wait.record(max(0.0, monotonic() - due))
+            self._session(stats)
+
+    def _closed(self, stats, deadline):
+        while monotonic() < deadline:
+            self._session(stats)
+
+    def _session(self, stats):
+        session = Session(self.address, self.script, **self.kwargs)
+        try:
+            result = session.run(stats.timing)
+        except Exception:
+            stats.statuses['ERROR'] += 1
+            return
+        stats.statuses[str(result)] += 1
+        stats.session.record(session.stats['elapsed'])
+
+    def report(self, elapsed):
+        """return the load results
+
+        :param: elapsed: seconds the run took
+        :type: elapsed: float
+        :return: session count, throughput in sessions per second, counts per final status and latency
+          summaries for connecting, each EXPECT step, whole sessions and, with ``rate``, the start delay
+        :rtype: dict
+        """
+        total = sum(self.stats.statuses.values())
+        report = dict(
+            sessions=total,
+            elapsed=round(elapsed, 6),
+            throughput=round(total / elapsed, 3) if elapsed else 0.0,
+            statuses=dict(self.stats.statuses),
+            connect=self.stats.connect.summary(),
+            session=self.stats.session.summary(),
+            steps={str(step): self.stats.steps[step].summary()
+                   for step in sorted(self.stats.steps)}
+        )
+        if self.rate:
+            report['wait'] = self.stats.wait.summary()
+        return report
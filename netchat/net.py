@@ -0,0 +1,262 @@
+# netchat connection establishment
+
+import errno
+import random
+import selectors
+import socket
+import threading
+
+from time import monotonic, sleep
+
+from .exception import TimeoutError
+
+RESOLVER_TTL = 60.0
+ATTEMPT_DELAY = 0.25
+BACKOFF = 0.1
+MAX_BACKOFF = 5.0
+
+
+class Resolver():
+    """thread-safe ``getaddrinfo`` cache shared by every session in the process
+
+    :param: ttl: seconds a resolved address list is reused
+    :type: ttl: float
+    """
+
+    def __init__(self, ttl=RESOLVER_TTL):
+        self.ttl = ttl
+        self.cache = {}
+        self.lock = threading.Lock()
+
+    def cached(self, host, port):
+        """return the cached address list for host and port, or None"""
+        entry = self.cache.get((host, port))
+        if entry and entry[0] > monotonic():
+            return entry[1]
+        return None
+
+    def store(self, host, port, addresses):
+        with self.lock:
+            self.cache[(host, port)] = (monotonic() + self.ttl, addresses)
+        return addresses
+
+    def resolve(self, host, port):
+        """return the stream socket addresses for host and port, ordered for happy eyeballs
+
+        :param: host: hostname or address literal
+        :type: host: str
+        :param: port: TCP port
+        :type: port: int
+        :return: (family, type, proto, canonname, sockaddr) tuples
+        :rtype: list
+        """
+        addresses = self.cached(host, port)
+        if addresses is None:
+            addresses = self.store(host, port, interleave(socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)))
+        return addresses
+
+    async def resolve_async(self, host, port):
+        """``resolve`` without blocking the running event loop on a cache miss"""
+        addresses = self.cached(host, port)
+        if addresses is None:
+            import asyncio
+            loop = asyncio.get_running_loop()
+            infos = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+            addresses = self.store(host, port, interleave(infos))
+        return addresses
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
+
+
+resolver = Resolver()
+
+
+def interleave(addresses):
+    """order addresses alternating between families, starting with the first family returned (RFC 8305)"""
+    families = {}
+    for address in addresses:
+        families.setdefault(address[0], []).append(address)
+    ordered = []
+    queues = list(families.values())
+    while queues:
+        ordered.extend(queue.pop(0) for queue in queues)
+        queues = [queue for queue in queues if queue]
+    return ordered
+
+
+def numeric_hosts(address, cache=resolver):
+    """resolve address through cache on behalf of a connector running in another process
+
+    :param: address: (host, port)
+    :type: address: tuple
+    :param: cache: resolver
+    :type: cache: netchat.net.Resolver
+    :return: the numeric host of each resolved address, in connection order, or None if the lookup failed,
+      leaving the connector to resolve address and report the failure itself
+    :rtype: list of str
+    """
+    try:
+        addresses = cache.resolve(*address)
+    except OSError:
+        return None
+    return [socket.getnameinfo(entry[4], socket.NI_NUMERICHOST | socket.NI_NUMERICSERV)[0] for entry in addresses]
+
+
+def numeric_addresses(hosts, port):
+    """return addresses as ``Resolver.resolve`` does for numeric hosts, without a name lookup
+
+    :param: hosts: numeric hosts, as returned by ``numeric_hosts``
+    :type: hosts: list of str
+    :param: port: TCP port
+    :type: port: int
+    :return: (family, type, proto, canonname, sockaddr) tuples
+    :rtype: list
+    """
+    addresses = []
+    for host in hosts:
+        addresses.extend(socket.getaddrinfo(host, port, type=socket.SOCK_STREAM, flags=socket.AI_NUMERICHOST))
+    return addresses
+
+
+def backoff(attempt, base=BACKOFF, limit=MAX_BACKOFF):
+    """return a fully jittered exponential backoff delay for a retry attempt, counting from 0"""
+    return random.uniform(0, min(limit, base * 2**attempt))
+
+
+def connect(address, *, timeout=None, retries=0, delay=ATTEMPT_DELAY, cache=resolver, addresses=None):
+    """return a blocking socket connected to address
+
+    Addresses are resolved through ``cache`` and raced happy eyeballs style: a connection attempt to
+    the next address starts ``delay`` seconds after the previous one, or as soon as it fails, and the
+    first attempt to connect wins.  A failed round is retried after a jittered exponential backoff.
+
+    :param: address: (host, port)
+    :type: address: tuple
+    :param: timeout: seconds allowed for each round of attempts, defaults to the operating system's limit
+    :type: timeout: float, optional
+    :param: retries: rounds of attempts after the first
+    :type: retries: int
+    :param: delay: seconds before racing the next address
+    :type: delay: float
+    :param: cache: resolver
+    :type: cache: netchat.net.Resolver
+    :param: addresses: addresses already resolved for address, raced instead of resolving it
+    :type: addresses: list, optional
+    :return: connected socket
+    :rtype: socket.socket
+    """
+    host, port = address
+    for attempt in range(retries + 1):
+        try:
+            return _race(addresses or cache.resolve(host, port), timeout, delay, address)
+        except (OSError, TimeoutError):
+            if attempt == retries:
+                raise
+        sleep(backoff(attempt))
+
+
+def _race(addresses, timeout, delay, address):
+    deadline = None if timeout is None else monotonic() + timeout
+    pending = list(addresses)
+    attempts = {}
+    error = None
+    next_start = 0
+    with selectors.DefaultSelector() as selector:
+        try:
+            while pending or attempts:
+                if pending and (not attempts or next_start <= monotonic()):
+                    family, kind, proto, _, sockaddr = pending.pop(0)
+                    sock = socket.socket(family, kind, proto)
+                    sock.setblocking(False)
+                    code = sock.connect_ex(sockaddr)
+                    if code not in (0, errno.EINPROGRESS):
+                        error = OSError(code, f'{errno.errorcode.get(code, code)} connecting to {sockaddr}')
+                        sock.close()
+                        continue
+                    selector.register(sock, selectors.EVENT_WRITE)
+                    attempts[sock] = sockaddr
+                    next_start = monotonic() + delay
+                now = monotonic()
+                if deadline is not None and now >= deadline:
+                    raise TimeoutError(f'timeout connecting to {address[0]}:{address[1]}')
+                wait = None if deadline is None else deadline - now
+                if pending:
+                    wait = max(0, next_start - now) if wait is None else min(wait, max(0, next_start - now))
+                for key, _ in selector.select(wait):
+                    sock = key.fileobj
+                    code = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    selector.unregister(sock)
+                    sockaddr = attempts.pop(sock)
+                    if code == 0:
+                        sock.setblocking(True)
+                        return sock
+                    error = OSError(code, f'{errno.errorcode.get(code, code)} connecting to {sockaddr}')
+                    sock.close()
+                    next_start = monotonic()
+        finally:
+            for sock in attempts:
+                sock.close()
+    raise error or OSError(f'no addresses for {address[0]}:{address[1]}')
+
+
+async def connect_async(address, *, timeout=None, retries=0, delay=ATTEMPT_DELAY, cache=resolver):
+    """``connect`` on the running event loop, returning a connected non-blocking socket"""
+    # asyncio is imported here so the blocking connector process does not pay for it at startup
+    import asyncio
+    host, port = address
+    for attempt in range(retries + 1):
+        try:
+            addresses = await cache.resolve_async(host, port)
+            return await asyncio.wait_for(_race_async(addresses, delay, address), timeout)
+        except asyncio.TimeoutError:
+            if attempt == retries:
+                raise TimeoutError(f'timeout connecting to {host}:{port}') from None
+        except OSError:
+            if attempt == retries:
+                raise
+        await asyncio.sleep(backoff(attempt))
+
+
+async def _race_async(addresses, delay, address):
+    import asyncio
+    loop = asyncio.get_running_loop()
+    winner = None
+    error = None
+    tasks = set()
+
+    async def attempt(family, kind, proto, _, sockaddr):
+        sock = socket.socket(family, kind, proto)
+        sock.setblocking(False)
+        try:
+            await loop.sock_connect(sock, sockaddr)
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    try:
+        pending = list(addresses)
+        while pending or tasks:
+            if pending:
+                tasks.add(asyncio.ensure_future(attempt(*pending.pop(0))))
+            done, tasks = await asyncio.wait(
+                tasks, timeout=delay if pending else None, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None and winner is None:
+                    winner = task.result()
+                elif task.exception() is None:
+                    task.result().close()
+                else:
+                    error = task.exception()
+            if winner:
+                return winner
+    finally:
+        for task in tasks:
+            task.cancel()
+        for result in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(result, socket.socket):
+                result.close()
+    raise error or OSError(f'no addresses for {address[0]}:{address[1]}')
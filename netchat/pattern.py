@@ -0,0 +1,190 @@
+# netchat EXPECT patterns
+
+import re
+
+from functools import lru_cache
+
+from .exception import ParameterError
+
+REGEX_CHARS = frozenset('.^$*+?{}[]\\|()')
+REGEX_BYTES = frozenset(b'.^$*+?{}[]\\|()')
+# an octal escape, a numbered backreference, any other escape, a character class, or a conditional group reference
+_REFERENCE = re.compile(r'\\[0-7]{3}|\\([1-9][0-9]?)|\\.|\[\^?\]?(?:\\.|[^\]\\])*\]|\(\?\(([0-9]+)\)', re.S)
+
+
+class Pattern():
+    """a compiled EXPECT element
+
+    :param: text: data or regex to be awaited
+    :type: text: str or bytes
+
+    ..note:: text containing no regex metacharacters is matched by substring search
+    ..note:: ``overlap`` is how far before new data a match may start, or None if unbounded
+    """
+
+    __slots__ = ('text', 'literal', 'regex', 'overlap')
+
+    def __init__(self, text):
+        self.text = text
+        self.literal = (REGEX_BYTES if isinstance(text, bytes) else REGEX_CHARS).isdisjoint(text)
+        self.regex = None if self.literal else re.compile(text, re.DOTALL)
+        self.overlap = len(text) - 1 if self.literal else None
+
+    def search(self, buffer, start=0):
+        """find the first match in buffer at or after start
+
+        :param: buffer: received data
+        :type: buffer: str or bytes
+        :param: start: offset at which to begin the search
+        :type: start: int
+        :return: (start, end, 0) of the match, or None
+        :rtype: tuple
+        """
+        if self.literal:
+            index = buffer.find(self.text, start)
+            if index < 0:
+                return None
+            return index, index + len(self.text), 0
+        match = self.regex.search(buffer, start)
+        if match:
+            return match.start(), match.end(), 0
+        return None
+
+    def index(self, match):
+        """return the alternative selected by a match of ``regex``"""
+        return 0
+
+    def __getitem__(self, index):
+        if index:
+            raise IndexError(index)
+        return self
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return f"Pattern<{self.text!r}>"
+
+
+class PatternSet():
+    """EXPECT alternatives compiled into a single regex, so each search is one pass over the buffer
+
+    :param: texts: data or regex for each alternative
+    :type: texts: tuple of str, or tuple of bytes
+
+    ..note:: as with pexpect, the earliest match wins, and the first listed alternative breaks a tie
+    ..note:: each alternative is wrapped in a group, so its numbered backreferences are renumbered to match;
+      named groups must be unique across the alternatives
+    """
+
+    __slots__ = ('text', 'patterns', 'regex', 'groups', 'literal', 'overlap')
+
+    def __init__(self, texts):
+        self.text = tuple(texts)
+        self.patterns = tuple(compile_pattern(text) for text in self.text)
+        self.literal = False
+        if all(p.literal for p in self.patterns):
+            self.overlap = max(p.overlap for p in self.patterns)
+        else:
+            self.overlap = None
+        self.groups = []
+        group = 1
+        for pattern in self.patterns:
+            self.groups.append(group)
+            group += 1 + (0 if pattern.literal else pattern.regex.groups)
+        if isinstance(self.text[0], bytes):
+            left, right, bar = b'(', b')', b'|'
+        else:
+            left, right, bar = '(', ')', '|'
+        regex = bar.join(
+            left + (re.escape(p.text) if p.literal else renumber(p.text, group)) + right
+            for p, group in zip(self.patterns, self.groups)
+        )
+        try:
+            self.regex = re.compile(regex, re.DOTALL)
+        except re.error as ex:
+            raise ParameterError(f'cannot combine EXPECT alternatives {self.text!r}: {ex}') from None
+
+    def search(self, buffer, start=0):
+        """find the first match of any alternative in buffer at or after start
+
+        :param: buffer: received data
+        :type: buffer: str
+        :param: start: offset at which to begin the search
+        :type: start: int
+        :return: (start, end, index) of the match and the matching alternative, or None
+        :rtype: tuple
+        """
+        match = self.regex.search(buffer, start)
+        if match:
+            return match.start(), match.end(), self.index(match)
+        return None
+
+    def index(self, match):
+        """return the alternative selected by a match of ``regex``"""
+        for index, group in enumerate(self.groups):
+            if match.start(group) >= 0:
+                return index
+
+    def __getitem__(self, index):
+        return self.patterns[index]
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def __str__(self):
+        return ' | '.join(self.text)
+
+    def __repr__(self):
+        return f"PatternSet<{self.text!r}>"
+
+
+def renumber(text, offset):
+    """return regex text with its numbered group references moved up by offset
+
+    :param: text: regex
+    :type: text: str or bytes
+    :param: offset: number of groups preceding the regex's own groups
+    :type: offset: int
+    :return: regex
+    :rtype: str or bytes
+    """
+    if isinstance(text, bytes):
+        return renumber(text.decode('latin-1'), offset).encode('latin-1')
+
+    def replace(match):
+        reference, condition = match.groups()
+        if reference is None and condition is None:
+            return match.group()
+        number = int(reference or condition) + offset
+        if condition is not None:
+            return f'(?({number})'
+        if number > 99:
+            raise ParameterError(f'too many groups to renumber backreference \\{reference} in {text!r}')
+        return f'(?:\\{number})'
+
+    return _REFERENCE.sub(replace, text)
+
+
+@lru_cache(maxsize=1024)
+def compile_patternset(texts):
+    """return the shared compiled PatternSet for a tuple of alternatives
+
+    :param: texts: data or regex for each alternative
+    :type: texts: tuple of str
+    :return: pattern set
+    :rtype: netchat.pattern.PatternSet
+    """
+    return PatternSet(texts)
+
+
+@lru_cache(maxsize=4096)
+def compile_pattern(text):
+    """return the shared compiled Pattern for text
+
+    :param: text: data or regex to be awaited
+    :type: text: str
+    :return: pattern
+    :rtype: netchat.pattern.Pattern
+    """
+    return Pattern(text)
@@ -0,0 +1,200 @@
+# netchat persistent sessions and connection pool
+
+import threading
+
+from collections import defaultdict
+from contextlib import contextmanager
+from time import monotonic
+
+from .constant import status, spawn
+from .exception import ParameterError
+from .script import Script
+from .session import Session
+
+
+class PersistentSession(Session):
+    """a session whose connection stays open so several scripts can be run over it
+
+    :param: address: (host, port) for TCP connection
+    :type: address: tuple
+    :param: login: script run once when the connection is opened, e.g. to authenticate
+    :type: login: str/Script, optional
+    :param: idle_timeout: seconds a connection may sit unused before it is closed instead of reused
+    :type: idle_timeout: float, optional
+
+    remaining keyword parameters are as for ``Session``; ``spawn_type`` defaults to ``spawn.direct``
+
+    ..note:: a script ending in anything but DONE closes the connection, since the peer's state is unknown
+    """
+
+    def __init__(self, address, login=None, *, idle_timeout=None, **kwargs):
+        kwargs.setdefault('spawn_type', spawn.direct)
+        super().__init__(address, Script(binary=kwargs.get('binary', False)) if login is None else login, **kwargs)
+        self.idle_timeout = idle_timeout
+        self.connection = None
+        self.last_used = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, _, exception, traceback):
+        self.close()
+        return False
+
+    def open(self, callback=None):
+        """connect and run the login script
+
+          :param: callback: function to be called on state change events
+          :type: callback: callback_function(netchat.status, data)
+          :return: status of the login script
+          :rtype: netchat.status
+        """
+        self.close()
+        self.connection = self.handler(callback).__enter__()
+        self.last_used = monotonic()
+        return self._execute()
+
+    def run(self, script=None, callback=None):
+        """run a script over the open connection, connecting and logging in first if necessary
+
+          :param: script: script to run; its ``${name}`` placeholders are bound as for the login script
+          :type: script: str/Script
+          :param: callback: function to be called on state change events
+          :type: callback: callback_function(netchat.status, data)
+          :return: EOF, TIMEOUT, DONE, or a script exit status
+          :rtype: netchat.status
+        """
+        if not self.alive():
+            result = self.open(callback)
+            if result != status.DONE:
+                return result
+        if script is None:
+            return status.DONE
+        if isinstance(script, str):
+            script = Script.load(script=script, binary=self.options['binary'])
+        script = self._bind(script, self.options['binary'])
+        self.connection.callback = callback
+        self.connection.start()
+        return self._execute(script)
+
+    def alive(self):
+        """return True if the connection is open, within its idle timeout, and passes a health check"""
+        if self.connection is None:
+            return False
+        if self.idle_timeout is not None and monotonic() - self.last_used > self.idle_timeout:
+            self.close()
+            return False
+        if not self.connection.alive():
+            self.close()
+            return False
+        return True
+
+    def close(self):
+        """close the connection, if open"""
+        if self.connection is not None:
+            connection, self.connection = self.connection, None
+            connection.__exit__(None, None, None)
+
+    def _execute(self, script=None):
+        # an exception leaves the peer's state unknown, so the connection is not kept for reuse
+        try:
+            result = self._run(self.connection, script)
+        except BaseException:
+            self.close()
+            raise
+        return self._finish(result)
+
+    def _finish(self, result):
+        self.stats = self.connection.summary(result)
+        self.last_used = monotonic()
+        if result != status.DONE:
+            self.close()
+        return result
+
+
+class Pool():
+    """persistent sessions shared between callers, keyed by address
+
+    :param: max_per_host: maximum number of open connections per address
+    :type: max_per_host: int
+    :param: login: script run on each new connection
+    :type: login: str/Script, optional
+    :param: idle_timeout: seconds an idle connection is kept for reuse
+    :type: idle_timeout: float, optional
+
+    remaining keyword parameters are passed to each ``PersistentSession``
+    """
+
+    def __init__(self, *, max_per_host=4, login=None, idle_timeout=300, **kwargs):
+        self.max_per_host = max_per_host
+        self.login = Script.load(script=login, binary=kwargs.get('binary', False)) if isinstance(login, str) else login
+        self.idle_timeout = idle_timeout
+        self.kwargs = kwargs
+        self.condition = threading.Condition()
+        self.idle = defaultdict(list)
+        self.count = defaultdict(int)
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, _, exception, traceback):
+        self.close()
+        return False
+
+    @contextmanager
+    def session(self, address):
+        """borrow a session for address, waiting while max_per_host sessions are in use
+
+        :param: address: (host, port) for TCP connection, or a transport address string
+        :type: address: tuple/str
+        :return: session, returned to the pool when the context exits
+        :rtype: netchat.pool.PersistentSession
+        :raises: ParameterError if the pool is closed
+        """
+        if not isinstance(address, str):
+            address = tuple(address)
+        with self.condition:
+            while not self.closed and not self.idle[address] and self.count[address] >= self.max_per_host:
+                self.condition.wait()
+            if self.closed:
+                raise ParameterError('pool is closed')
+            if self.idle[address]:
+                session = self.idle[address].pop()
+            else:
+                session = PersistentSession(address, self.login, idle_timeout=self.idle_timeout, **self.kwargs)
+                self.count[address] += 1
+        try:
+            yield session
+        finally:
+            with self.condition:
+                if self.closed or session.connection is None:
+                    session.close()
+                    self.count[address] -= 1
+                else:
+                    self.idle[address].append(session)
+                self.condition.notify()
+
+    def run(self, address, script, callback=None):
+        """run a script on a pooled connection to address
+
+        :param: address: (host, port) for TCP connection
+        :type: address: tuple
+        :param: script: script to run
+        :type: script: str/Script
+        :return: EOF, TIMEOUT, DONE, or a script exit status
+        :rtype: netchat.status
+        """
+        with self.session(address) as session:
+            return session.run(script, callback)
+
+    def close(self):
+        """close all idle connections; sessions in use are closed when they are returned"""
+        with self.condition:
+            self.closed = True
+            for address, sessions in self.idle.items():
+                for session in sessions:
+                    session.close()
+                self.count[address] -= len(sessions)
+                sessions.clear()
+            self.condition.notify_all()
@@ -1,8 +1,24 @@
 # netchat script objects
 
-import shlex
+import codecs
+import re
+from functools import lru_cache
 from pathlib import Path
 
+from .constant import status
+from .exception import ParameterError
+from .pattern import REGEX_BYTES, REGEX_CHARS, compile_pattern, compile_patternset
+
+# unquoted text: a run of word characters, whitespace, an opening quote, or a backslash escape
+_PLAIN = re.compile(r'''([^\s'"\\]+)|(\s+)|(['"])|\\(.?)''', re.S)
+# inside double quotes a backslash escapes only a double quote or another backslash
+_DOUBLE = re.compile(r'''([^"\\]+)|\\(["\\])|(\\)|(")''')
+# words written in place of an EXPECT as ``@name:argument``
+DIRECTIVES = frozenset(['label', 'goto', 'loop', 'sleep', 'exit', 'timeout', 'ontimeout'])
+# ``${name}`` script variable, or ``$${name}`` for the text ``${name}``
+_VARIABLE = re.compile(r'\$(\$?)\{([A-Za-z_]\w*)\}')
+_VARIABLE_BYTES = re.compile(rb'\$(\$?)\{([A-Za-z_]\w*)\}')
+
 
 class Element():
     """EXPECT,SEND script element
@@ -11,19 +27,304 @@ class Element():
     :type: expect: str
     :param: send: data sent after the expected data is recieved
     :type: expect: str
+    :param: exit: status ending the script when the expected data is received, instead of a SEND
+    :type: exit: netchat.status, optional
+    :param: timeout: seconds to wait for EXPECT, overriding the session's ``wait_timeout``
+    :type: timeout: float, optional
+    :param: goto: label jumped to when the expected data is received, instead of a SEND
+    :type: goto: str, optional
+    :param: on_timeout: label jumped to if EXPECT times out, instead of ending the script
+    :type: on_timeout: str, optional
+
+    ..note:: ``pattern`` holds the compiled EXPECT, or None when EXPECT is empty
     """
 
-    def __init__(self, expect, send):
+    __slots__ = ('expect', 'send', 'pattern', 'exit', 'timeout', 'goto', 'on_timeout')
+
+    def __init__(self, expect, send, exit=None, timeout=None, goto=None, on_timeout=None):
         self.expect = expect
         self.send = send
+        self.exit = exit
+        self.timeout = timeout
+        self.goto = goto
+        self.on_timeout = on_timeout
+        self.pattern = compile_pattern(expect) if expect else None
+
+    @property
+    def linear(self):
+        """True if the step always continues with the next step after its SEND"""
+        return self.exit is None and self.goto is None and self.on_timeout is None
+
+    def choose(self, index):
+        """return the element selected by the EXPECT alternative index"""
+        return self
 
     def __str__(self):
-        return repr(dict(expect=self.expect, send=self.send))
+        if self.exit is not None:
+            fields = dict(expect=self.expect, exit=str(self.exit))
+        elif self.goto is not None:
+            fields = dict(expect=self.expect, goto=self.goto)
+        else:
+            fields = dict(expect=self.expect, send=self.send)
+        if self.timeout is not None:
+            fields['timeout'] = self.timeout
+        if self.on_timeout is not None:
+            fields['on_timeout'] = self.on_timeout
+        return repr(fields)
 
     def __repr__(self):
         return f"Element<{str(self)}>"
 
 
+class Alternatives():
+    """EXPECT alternatives, each with its own SEND or exit status
+
+    :param: elements: one element per alternative
+    :type: elements: list of netchat.script.Element
+    :param: timeout: seconds to wait for any of the EXPECTs, overriding the session's ``wait_timeout``
+    :type: timeout: float, optional
+    :param: on_timeout: label jumped to if no EXPECT is received in time, instead of ending the script
+    :type: on_timeout: str, optional
+
+    ..note:: ``pattern`` holds all of the EXPECTs compiled as a single ``PatternSet``
+    """
+
+    __slots__ = ('elements', 'pattern', 'timeout', 'on_timeout')
+
+    def __init__(self, elements, timeout=None, on_timeout=None):
+        self.elements = tuple(elements)
+        self.timeout = timeout
+        self.on_timeout = on_timeout
+        self.pattern = compile_patternset(tuple(element.expect for element in self.elements))
+
+    def choose(self, index):
+        """return the element selected by the EXPECT alternative index"""
+        return self.elements[index]
+
+    def __str__(self):
+        return repr([str(element) for element in self.elements])
+
+    def __repr__(self):
+        return f"Alternatives<{str(self)}>"
+
+
+class SendFile():
+    """``@file:PATH`` SEND: the contents of a file, or of stdin for ``-``, streamed to the connection as is
+
+    :param: path: file path, or ``-`` for stdin
+    :type: path: str
+    """
+
+    __slots__ = ('path', )
+
+    def __init__(self, path):
+        self.path = path
+
+    def open(self):
+        """return the source opened for unbuffered binary reading; stdin is left open when it is closed"""
+        if self.path == '-':
+            return open(0, 'rb', buffering=0, closefd=False)
+        return open(self.path, 'rb', buffering=0)
+
+    def __str__(self):
+        return f"@file:{self.path}"
+
+    def __repr__(self):
+        return f"SendFile<{self.path}>"
+
+
+class Template():
+    """EXPECT or SEND text with ``${name}`` placeholders, split once into literal text and variable names
+
+    :param: parts: literal text, variable name, literal text, ... ending with literal text
+    :type: parts: list
+    """
+
+    __slots__ = ('parts', 'names', 'regex')
+
+    def __init__(self, parts):
+        self.parts = tuple(parts)
+        self.names = frozenset(self.parts[1::2])
+        # True if the literal text is itself a regex, see ``netchat.pattern.Pattern``
+        self.regex = not all(_metachars(part).isdisjoint(part) for part in self.parts[0::2])
+
+    @classmethod
+    def parse(cls, text):
+        """return the Template for str or bytes text, or None if the text has no placeholders"""
+        binary = isinstance(text, bytes)
+        fields = (_VARIABLE_BYTES if binary else _VARIABLE).split(text)
+        if len(fields) == 1:
+            return None
+        parts = [fields[0]]
+        for escape, name, literal in zip(fields[1::3], fields[2::3], fields[3::3]):
+            if escape:
+                parts[-1] += (b'${' if binary else '${') + name + (b'}' if binary else '}') + literal
+            else:
+                parts.extend([name.decode() if binary else name, literal])
+        return cls(parts)
+
+    def render(self, variables, pattern=False):
+        """return the text with each placeholder replaced by its value from ``variables``
+
+        :param: variables: value of each variable, converted with ``str``
+        :type: variables: dict
+        :param: pattern: the text is an EXPECT: if it is a regex, values are escaped so that each matches
+          only its own text
+        :type: pattern: bool
+        :return: text
+        :rtype: str/bytes
+        """
+        parts = list(self.parts)
+        binary = isinstance(parts[0], bytes)
+        for index in range(1, len(parts), 2):
+            value = str(variables[parts[index]])
+            parts[index] = value.encode() if binary else value
+        values = parts[1::2]
+        if pattern and (self.regex or not all(_metachars(value).isdisjoint(value) for value in values)):
+            parts[1::2] = [re.escape(value) for value in values]
+        return parts[0][:0].join(parts)
+
+    def __repr__(self):
+        return f"Template<{self.parts!r}>"
+
+
+class Label():
+    """``@label:NAME``, the target of jumps to NAME"""
+
+    __slots__ = ('name', )
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return f"Label<{self.name}>"
+
+
+class Goto():
+    """``@goto:LABEL`` jump, or with ``count`` a ``@loop:LABEL:COUNT`` that jumps back to LABEL until the
+    steps from LABEL have run ``count`` times, then continues
+
+    :param: label: label jumped to
+    :type: label: str
+    :param: count: number of times the loop runs, or None to always jump
+    :type: count: int, optional
+    """
+
+    __slots__ = ('label', 'count')
+
+    def __init__(self, label, count=None):
+        self.label = label
+        self.count = count
+
+    def __repr__(self):
+        return f"Goto<{self.label}{'' if self.count is None else f':{self.count}'}>"
+
+
+class Sleep():
+    """``@sleep:SECONDS``, a pause with the connection left open"""
+
+    __slots__ = ('seconds', )
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def __repr__(self):
+        return f"Sleep<{self.seconds}>"
+
+
+class Exit():
+    """``@exit:STATUS`` in place of an EXPECT, ending the script with STATUS"""
+
+    __slots__ = ('status', )
+
+    def __init__(self, status):
+        self.status = status
+
+    def __repr__(self):
+        return f"Exit<{str(self.status)}>"
+
+
+class Cursor():
+    """position in a running script, following its jumps
+
+    Iterating a cursor yields the ``Element``, ``Alternatives``, ``Sleep`` and ``Exit`` steps to run;
+    labels are skipped and ``@goto``/``@loop`` jumps are followed.  The session calls ``jump`` for an
+    element's ``goto`` or ``on_timeout``.
+
+    A streamed script is read as it runs.  Its steps are kept from the first label on, since only those
+    can be jumped to, and a jump to a label not yet read reads ahead to it.
+
+    :param: script: script to run
+    :type: script: netchat.Script
+    """
+
+    def __init__(self, script):
+        self.index = 0
+        self.counts = {}
+        # steps[0] is step number base; steps before the first label of a streamed script are dropped
+        self.base = 0
+        if script.elements is not None:
+            self.steps = script.elements
+            self.labels = script.labels
+            self.stream = None
+        else:
+            self.steps = []
+            self.labels = {}
+            self.stream = iter(script)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while True:
+            index, step = self.index, self._step(self.index)
+            if step is None:
+                raise StopIteration
+            self.index += 1
+            if isinstance(step, Label):
+                continue
+            if not isinstance(step, Goto):
+                return step
+            if step.count is not None:
+                count = self.counts.get(index, 1)
+                if count >= step.count:
+                    # reset, so that an enclosing loop runs this one again in full
+                    self.counts.pop(index, None)
+                    continue
+                self.counts[index] = count + 1
+            self.jump(step.label)
+
+    def jump(self, label):
+        """continue the script at label"""
+        while label not in self.labels:
+            if not self._read():
+                raise ParameterError(f'undefined label {label!r}')
+        self.index = self.labels[label]
+
+    def _step(self, index):
+        """return step number index, reading the stream up to it, or None after the last step"""
+        while index >= self.base + len(self.steps):
+            if not self._read():
+                return None
+        return self.steps[index - self.base]
+
+    def _read(self):
+        """read the next step of a streamed script; return False at its end"""
+        step = next(self.stream, None) if self.stream else None
+        if step is None:
+            self.stream = None
+            return False
+        if not self.labels:
+            self.base += len(self.steps)
+            self.steps.clear()
+        if isinstance(step, Label):
+            if step.name in self.labels:
+                raise ParameterError(f'duplicate label {step.name!r}')
+            self.labels[step.name] = self.base + len(self.steps)
+        self.steps.append(step)
+        return True
+
+
 class Script():
     """a chat script composed of EXPECT,SEND pairs
 
@@ -33,20 +334,85 @@ class Script():
     :type: pathname: str, optional
     :param: file: readable stream for reading script
     :type: file: file-type object, optional
+    :param: binary: parse EXPECT and SEND elements as bytes
+    :type: binary: bool, optional
+
+    :param: stream: parse ``pathname`` or ``file`` incrementally each time the script is iterated, instead of
+      holding every element in memory
+    :type: stream: bool, optional
 
     ::note:
-      Uses ``shlex`` to parse, so shell quoting may be used.
+      Words are split with POSIX shell quoting rules, so shell quoting may be used.
       Missing elements will be give a NULL value
-      Any lines beginning with # will be ignored.
-     
+      Any lines beginning with # (outside a quoted word) will be ignored; a # anywhere else is data.
+
+    ::note:
+      A streamed script reads its source in constant memory, up to its first ``@label``, as ``Session.run``
+      consumes its elements, so syntax errors and undefined labels are raised when they are reached; a
+      ``file`` stream can be run only once
+
+    ::note:
+      EXPECT elements may be regular expressions; they are compiled once, when the script is parsed
+
     ::note:
-      EXPECT elements may be regular expressions
+      ``( EXPECT SEND [EXPECT SEND]... )`` waits for whichever EXPECT arrives first and sends its SEND;
+      the parentheses must be separate words, so an EXPECT of a literal parenthesis is written as an escaped
+      regex in single quotes, e.g. ``'\\(' yes``.  A SEND of ``@exit:STATUS`` ends the script with that
+      status (e.g. ``@exit:FAILED``); a SEND beginning with ``@@`` sends the text after the first ``@``;
+      other words beginning with ``@``, apart from ``@goto:`` and ``@file:``, are sent as they are.
+
+    ::note:
+      A SEND of ``@file:PATH`` streams the contents of PATH, or of stdin for ``@file:-``, with no line
+      ending added, e.g. ``"ready> " @file:firmware.bin "OK"`` (spawn.direct and AsyncSession only)
+
+    ::note:
+      ``@timeout:SECONDS`` in place of an EXPECT sets the timeout of the EXPECT, or the ``(`` alternatives,
+      that follow it, e.g. ``@timeout:30 "$ " make``; ``@ontimeout:LABEL`` continues the script at LABEL
+      when they time out instead of ending it with TIMEOUT
+
+    ::note:
+      Control flow words are also written in place of an EXPECT: ``@label:NAME`` marks a position,
+      ``@goto:NAME`` jumps to it, ``@loop:NAME:COUNT`` jumps back to NAME until the steps from it have run
+      COUNT times, ``@sleep:SECONDS`` pauses and ``@exit:STATUS`` ends the script.  A SEND of ``@goto:NAME``
+      jumps when its EXPECT is received.  An EXPECT beginning with ``@@`` expects the text after the first
+      ``@``.  For example, to poll every minute for an hour over one connection::
+
+        "> " "" @label:poll @sleep:60 "" "show status" ( "OK" "" "ALARM" @exit:FAILED ) @loop:poll:60
+
+      A streamed script holds its steps in memory from the first ``@label`` on, so that they can be run again.
+
+    ::note:
+      In a binary script, escapes such as ``\\r``, ``\\x1b`` and ``\\0`` in an element are decoded to bytes;
+      write them inside single quotes so that the backslash is kept.  A binary SEND is sent as is, with no
+      line ending, so a line-based exchange writes it out, e.g. ``'login: ' 'admin\\r\\n'``
+
+    ::note:
+      ``${name}`` in an EXPECT, a SEND or an ``@file`` path is replaced by the value of variable ``name`` when
+      the script is bound with ``bind``, e.g. ``"login: " ${user} "${host}> " "show interface ${port}"``;
+      ``$${name}`` is the text ``${name}``.  The script is parsed and its EXPECTs compiled once; binding
+      rebuilds only the steps holding placeholders.  A streamed script is bound step by step as it is read,
+      so an unset variable is reported when its step is reached.
+
+    ::note:
+      ``Script.load`` returns a cached Script, shared between callers, which must not be modified
     """
 
-    def __init__(self, *, script=None, pathname=None, file=None):
-        self.elements = []
+    def __init__(self, *, script=None, pathname=None, file=None, binary=False, stream=False):
+        self.binary = binary
+        self.elements = ()
+        self.labels = {}
+        self.templates = ()
+        self.variables = frozenset()
+        self.bindings = None
+        self.source = None
         if script:
             self.parse_string(script)
+        elif stream and (pathname or file):
+            self.elements = None
+            self.labels = None
+            self.templates = None
+            self.variables = None
+            self.source = pathname or file
         elif pathname:
             self.parse_pathname(pathname)
         elif file:
@@ -61,43 +427,24 @@ class Script():
         :rtype: netchat.Script
         
         """
-        self.elements = []
-        tokens = list(shlex.shlex(script, posix=True))
-        if len(tokens) & 1:
-            tokens.append('')
-        tokens.reverse()
-        while len(tokens):
-            send = tokens.pop()
-            expect = tokens.pop()
-            self.elements.append(Element(send, expect))
-
+        self.elements = tuple(parse_tokens(tokenize(script.splitlines(keepends=True)), self.binary))
+        self.labels = link(self.elements)
+        self.templates, self.variables = compile_templates(self.elements)
         return self
 
-    def read_file(self, file):
-        """read script from a file, ignoring comment lines
-
-        :param: file: open file for reading script data
-        :type: file: file-type
-        :return: script data 
-        :rtype: str
-        """
-        buffer = ''
-        for line in file.readlines():
-            line = line.strip()
-            if not line.startswith('#'):
-                buffer += ' ' + line
-        return buffer
-
     def parse_file(self, file):
         """read script data from an open file and parse it
-    
-        :param: script_file: readable stream for reading script
-        :type: script_file: file-type object, optional
+
+        :param: file: readable stream for reading script
+        :type: file: file-type object
         :return: script
         :rtype: netchat.Script
         """
         with file:
-            return self.parse_string(read_script_file(file))
+            self.elements = tuple(parse_tokens(tokenize(file), self.binary))
+        self.labels = link(self.elements)
+        self.templates, self.variables = compile_templates(self.elements)
+        return self
 
     def parse_pathname(self, pathname):
         """open and read a script file and parse the script data
@@ -110,17 +457,418 @@ class Script():
         with Path(pathname).open('r') as fp:
             return self.parse_file(fp)
 
+    @classmethod
+    def load(cls, *, script=None, pathname=None, binary=False):
+        """return a cached, parsed Script for script text or a script file
+
+        :param: script: input string to be parsed
+        :type: script: str, optional
+        :param: pathname: pathname of script file, reparsed when its modification time or size changes
+        :type: pathname: str, optional
+        :param: binary: parse EXPECT and SEND elements as bytes
+        :type: binary: bool, optional
+        :return: script
+        :rtype: netchat.Script
+        """
+        if script is not None:
+            return _load_string(script, binary)
+        path = Path(pathname).resolve()
+        stat = path.stat()
+        return _load_pathname(str(path), stat.st_mtime_ns, stat.st_size, binary)
+
+    def bind(self, variables):
+        """return a copy of the script with its ``${name}`` placeholders replaced
+
+        Steps without placeholders, and their compiled EXPECTs, are shared with this script; a rebuilt
+        EXPECT shares its compiled pattern with every other binding that rendered the same text.  A
+        streamed script is bound as it is read.
+
+        :param: variables: value of each variable, converted with ``str``
+        :type: variables: dict
+        :return: script
+        :rtype: netchat.Script
+        """
+        script = Script(binary=self.binary)
+        if self.elements is None:
+            # each step is bound as it is read
+            script.elements = script.labels = script.templates = script.variables = None
+            script.source = self.source
+            script.bindings = variables
+            return script
+        _check_variables(self.variables, variables)
+        steps = list(self.elements)
+        for index, template in self.templates:
+            steps[index] = render_step(steps[index], template, variables)
+        script.elements = tuple(steps)
+        script.labels = self.labels
+        return script
+
+    def extend(self, steps):
+        """return a copy of the script with steps added at its end
+
+        :param: steps: parsed script steps, such as ``Element`` objects
+        :type: steps: iterable
+        :return: script
+        :rtype: netchat.Script
+        :raises: ParameterError for a streamed script
+        """
+        if self.elements is None:
+            raise ParameterError('cannot add steps to a streamed script')
+        script = Script(binary=self.binary)
+        script.elements = self.elements + tuple(steps)
+        script.labels = link(script.elements)
+        script.templates, script.variables = compile_templates(script.elements)
+        return script
+
     def __iter__(self):
-        self.index = 0
-        return self
+        if self.elements is not None:
+            return iter(self.elements)
+        return self._stream()
 
-    def __next__(self):
-        if self.index < len(self.elements):
-            ret = self.elements[self.index]
-            self.index += 1
-            return ret
+    def _stream(self):
+        if isinstance(self.source, (str, Path)):
+            with Path(self.source).open('r') as fp:
+                yield from self._bind_steps(parse_tokens(tokenize(fp), self.binary))
         else:
-            raise StopIteration
+            with self.source:
+                yield from self._bind_steps(parse_tokens(tokenize(self.source), self.binary))
+
+    def _bind_steps(self, steps):
+        # placeholders are never sent as text: an unbound variable fails when its step is reached
+        variables = self.bindings or {}
+        for step in steps:
+            found = step_template(step)
+            if found:
+                _check_variables(found[1], variables)
+                step = render_step(step, found[0], variables)
+            yield step
 
     def __len__(self):
+        if self.elements is None:
+            return sum(1 for _ in self)
         return len(self.elements)
+
+
+def tokenize(lines):
+    """generate script words from lines of script text, reading one line at a time
+
+    :param: lines: script text, with line endings
+    :type: lines: iterable of str
+    :return: script words
+    :rtype: generator of str
+    """
+    word = None
+    quote = None
+    for line in lines:
+        if word is None and line.lstrip().startswith('#'):
+            continue
+        pos, end = 0, len(line)
+        while pos < end:
+            if quote == "'":
+                close = line.find("'", pos)
+                if close < 0:
+                    word.append(line[pos:])
+                    break
+                word.append(line[pos:close])
+                pos, quote = close + 1, None
+            elif quote == '"':
+                match = _DOUBLE.match(line, pos)
+                pos = match.end()
+                text, escaped, backslash, _ = match.groups()
+                if text or escaped or backslash:
+                    word.append(text or escaped or backslash)
+                else:
+                    quote = None
+            else:
+                match = _PLAIN.match(line, pos)
+                pos = match.end()
+                text, space, quote, escaped = match.groups()
+                if space:
+                    if word is not None:
+                        yield ''.join(word)
+                        word = None
+                    continue
+                if word is None:
+                    word = []
+                if escaped == '':
+                    raise ParameterError('missing escaped character at end of script')
+                if text or escaped:
+                    word.append(text or escaped)
+    if quote:
+        raise ParameterError(f'missing closing {quote} in script')
+    if word is not None:
+        yield ''.join(word)
+
+
+def parse_tokens(tokens, binary=False):
+    """generate script elements from a sequence of script words
+
+    :param: tokens: script words
+    :type: tokens: iterable of str
+    :param: binary: decode escapes in EXPECT and SEND elements to bytes
+    :type: binary: bool
+    :return: script steps
+    :rtype: generator of netchat.script.Element, Alternatives, Label, Goto, Sleep or Exit
+    """
+    tokens = iter(tokens)
+    group = None
+    # @timeout and @ontimeout settings for the next EXPECT or alternatives
+    wait = {}
+    for expect in tokens:
+        directive = parse_directive(expect)
+        if directive:
+            name, argument = directive
+            if group is not None:
+                raise ParameterError(f'{expect!r} cannot be used inside alternatives')
+            if name in ('timeout', 'ontimeout'):
+                if name in wait:
+                    raise ParameterError(f'repeated {expect!r}')
+                wait[name] = parse_seconds(expect, argument) if name == 'timeout' else parse_label(expect, argument)
+            elif wait:
+                raise ParameterError(f'{expect!r} follows @timeout or @ontimeout instead of an EXPECT')
+            else:
+                yield parse_instruction(expect, name, argument)
+            continue
+        if expect == '(':
+            if group is not None:
+                raise ParameterError('alternatives cannot be nested')
+            group, group_wait, wait = [], wait, {}
+            continue
+        if expect == ')':
+            if not group:
+                raise ParameterError('unexpected ")" in script')
+            yield Alternatives(group, group_wait.get('timeout'), group_wait.get('ontimeout'))
+            group = None
+            continue
+        if expect.startswith('@@'):
+            expect = expect[1:]
+        send = next(tokens, '')
+        close = group is not None and send == ')'
+        send, exit, goto = parse_action('' if close else send)
+        if binary:
+            expect = unescape(expect)
+            send = send if isinstance(send, SendFile) else unescape(send)
+        element = Element(expect, send, exit, wait.get('timeout'), goto, wait.get('ontimeout'))
+        wait = {}
+        if group is None:
+            yield element
+        elif not expect:
+            raise ParameterError('alternatives require a non-empty EXPECT')
+        else:
+            group.append(element)
+            if close:
+                yield Alternatives(group, group_wait.get('timeout'), group_wait.get('ontimeout'))
+                group = None
+    if group is not None:
+        raise ParameterError('missing ")" in script')
+    if wait:
+        raise ParameterError('@timeout or @ontimeout at end of script')
+
+
+def parse_directive(word):
+    """return the (name, argument) of an ``@name:argument`` word written in place of an EXPECT, or None
+
+    :param: word: script word
+    :type: word: str
+    :return: directive name and argument
+    :rtype: tuple
+    """
+    if not word.startswith('@') or word.startswith('@@'):
+        return None
+    name, colon, argument = word[1:].partition(':')
+    if not colon or name not in DIRECTIVES:
+        return None
+    return name, argument
+
+
+def parse_instruction(word, name, argument):
+    """return the control flow step for a ``@label``, ``@goto``, ``@loop``, ``@sleep`` or ``@exit`` word"""
+    if name == 'label':
+        return Label(parse_label(word, argument))
+    if name == 'goto':
+        return Goto(parse_label(word, argument))
+    if name == 'loop':
+        label, _, count = argument.rpartition(':')
+        if not count.isdigit() or int(count) < 1:
+            raise ParameterError(f'invalid loop count in {word!r}')
+        return Goto(parse_label(word, label), int(count))
+    if name == 'sleep':
+        return Sleep(parse_seconds(word, argument))
+    return Exit(parse_status(argument))
+
+
+def parse_seconds(word, argument):
+    """return the non-negative seconds given as a directive argument"""
+    try:
+        seconds = float(argument)
+    except ValueError:
+        seconds = -1
+    if not seconds >= 0:
+        raise ParameterError(f'invalid seconds in {word!r}')
+    return seconds
+
+
+def parse_label(word, argument):
+    if not argument:
+        raise ParameterError(f'missing label in {word!r}')
+    return argument
+
+
+def parse_status(argument):
+    try:
+        return status[argument]
+    except KeyError:
+        raise ParameterError(f'invalid exit status {argument!r}') from None
+
+
+def link(steps):
+    """return the step index of each label, checking that every jump has a target
+
+    :param: steps: parsed script steps
+    :type: steps: tuple
+    :return: label name to index
+    :rtype: dict
+    """
+    labels = {}
+    for index, step in enumerate(steps):
+        if isinstance(step, Label):
+            if step.name in labels:
+                raise ParameterError(f'duplicate label {step.name!r}')
+            labels[step.name] = index
+    for step in steps:
+        if isinstance(step, Goto):
+            targets = [step.label]
+        elif isinstance(step, Alternatives):
+            targets = [step.on_timeout] + [element.goto for element in step.elements]
+        elif isinstance(step, Element):
+            targets = [step.on_timeout, step.goto]
+        else:
+            continue
+        for label in targets:
+            if label is not None and label not in labels:
+                raise ParameterError(f'undefined label {label!r}')
+    return labels
+
+
+def compile_templates(steps):
+    """find the steps whose EXPECT, SEND or ``@file`` path holds ``${name}`` placeholders
+
+    :param: steps: parsed script steps
+    :type: steps: tuple
+    :return: (index, template) for each such step, and the variable names they use
+    :rtype: tuple
+    """
+    templates = []
+    names = set()
+    for index, step in enumerate(steps):
+        found = step_template(step)
+        if found:
+            templates.append((index, found[0]))
+            names.update(found[1])
+    return tuple(templates), frozenset(names)
+
+
+def step_template(step):
+    """return the template of a step holding ``${name}`` placeholders and the names it uses, or None
+
+    :param: step: parsed script step
+    :type: step: netchat.script.Element/netchat.script.Alternatives
+    :return: (template, names)
+    :rtype: tuple
+    """
+    if isinstance(step, Alternatives):
+        template = tuple(_element_template(element) for element in step.elements)
+        parts = [part for part in template if part]
+    elif isinstance(step, Element):
+        template = _element_template(step)
+        parts = [template] if template else []
+    else:
+        return None
+    if not parts:
+        return None
+    return template, frozenset().union(*(text.names for part in parts for text in part if text))
+
+
+def _check_variables(names, variables):
+    missing = names.difference(variables)
+    if missing:
+        raise ParameterError(f'script variables not set: {", ".join(sorted(missing))}')
+
+
+def _element_template(element):
+    send = element.send.path if isinstance(element.send, SendFile) else element.send
+    template = (Template.parse(element.expect), Template.parse(send))
+    return template if any(template) else None
+
+
+def render_step(step, template, variables):
+    """return an Element or Alternatives with the placeholders found by ``compile_templates`` replaced"""
+    if isinstance(step, Alternatives):
+        elements = [
+            _render_element(element, part, variables) if part else element
+            for element, part in zip(step.elements, template)
+        ]
+        return Alternatives(elements, step.timeout, step.on_timeout)
+    return _render_element(step, template, variables)
+
+
+def _render_element(element, template, variables):
+    expect, send = template
+    expect = expect.render(variables, pattern=True) if expect else element.expect
+    if not send:
+        send = element.send
+    elif isinstance(element.send, SendFile):
+        send = SendFile(send.render(variables))
+    else:
+        send = send.render(variables)
+    return Element(expect, send, element.exit, element.timeout, element.goto, element.on_timeout)
+
+
+def _metachars(text):
+    return REGEX_BYTES if isinstance(text, bytes) else REGEX_CHARS
+
+
+def unescape(token):
+    """return the bytes for a script word, decoding backslash escapes
+
+    :param: token: script word
+    :type: token: str
+    :return: element data
+    :rtype: bytes
+    """
+    return codecs.escape_decode(token.encode())[0]
+
+
+def parse_action(send):
+    """return the (send, exit, goto) triple for a SEND word
+
+    :param: send: SEND word
+    :type: send: str
+    :return: data to send, exit status and label to jump to
+    :rtype: tuple
+    """
+    if not send.startswith('@'):
+        return send, None, None
+    if send.startswith('@@'):
+        return send[1:], None, None
+    directive, _, argument = send[1:].partition(':')
+    if directive == 'exit':
+        return '', parse_status(argument), None
+    if directive == 'goto':
+        return '', None, parse_label(send, argument)
+    if directive == 'file':
+        if not argument:
+            raise ParameterError(f'missing path in {send!r}')
+        return SendFile(argument), None, None
+    # any other word beginning with @, such as a password, is sent as it is
+    return send, None, None
+
+
+@lru_cache(maxsize=256)
+def _load_string(script, binary):
+    return Script(script=script, binary=binary)
+
+
+@lru_cache(maxsize=256)
+def _load_pathname(pathname, mtime, size, binary):
+    return Script(pathname=pathname, binary=binary)
@@ -1,30 +1,132 @@
 # netchat session object
 
 import pexpect
+import shlex
 import sys
 
-from .exception import ParameterError
+from collections import deque
+
+from .exception import ParameterError, TimeoutError, EOF
 from .constant import status, spawn
-from .script import Script
+from .script import Alternatives, Cursor, Element, Exit, Script, SendFile, Sleep
+from .handler import EXIT_GRACE, Handler
+from .direct import DirectHandler
+from .forkserver import ForkHandler
+from .net import numeric_hosts
+from .transport import format_address, is_local, open_transport
+
+TIMEOUTS = (pexpect.exceptions.TIMEOUT, TimeoutError)
+
+
+def parse_address(address):
+    """split a ``host:port`` string into an address tuple
+
+    ``unix:/path`` and ``exec:command`` addresses, or any other registered transport scheme, are
+    returned unchanged, see ``netchat.transport``.
+
+    :param: address: address string
+    :type: address: str
+    :return: (host, port), or the address string
+    :rtype: tuple/str
+    """
+    if is_local(address):
+        return address
+    if ':' not in address:
+        raise ParameterError('address must include ":port"')
+    host, port = address.rsplit(':', 1)
+    return host, int(port)
+
+
+def default_spawn(address, tls=None):
+    """return the spawn type used for address when none is given
+
+    Transport addresses and TLS are only supported in process, so they get ``spawn.direct``;
+    other TCP addresses get ``spawn.internal``.
+
+    :param: address: (host, port), or a transport address string
+    :type: address: tuple/str
+    :param: tls: TLS settings
+    :type: tls: netchat.tls.TLS, optional
+    :return: spawn type
+    :rtype: netchat.spawn
+    """
+    return spawn.direct if tls or is_local(address) else spawn.internal
+
+
+def _elements(step):
+    if isinstance(step, Alternatives):
+        return step.elements
+    if isinstance(step, Element):
+        return (step, )
+    return ()
+
+
+def address_variables(address):
+    """return the script variables describing a session address
+
+    :param: address: (host, port) or transport address
+    :type: address: tuple/str
+    :return: ``address`` in display form, and ``host`` and ``port`` for a TCP address
+    :rtype: dict
+    """
+    if isinstance(address, str):
+        return dict(address=format_address(address))
+    host, port = address
+    return dict(address=format_address(address), host=host, port=port)
 
 
 class Session():
     """connect to a listening TCP port and perform expect/send interaction 
 
-    :param: address: (host, port) for TCP connection
-    :type: address: tuple
+    :param: address: (host, port) for TCP connection, or ``unix:/path`` for a unix domain socket or
+      ``exec:command`` for a local program's stdin and stdout (spawn.direct only)
+    :type: address: tuple/str
     :param: script: script composed of EXPECT,SEND element pairs as string or Script
     :type: script: str/Script
     :param: wait_timeout: seconds before an EXPECT wait will return TIMEOUT, defaults to Infinite 
     :type: wait_timeout: int, optional
+    :param: session_timeout: seconds allowed for the whole run, including connecting, after which the session
+      returns TIMEOUT, defaults to Infinite
+    :type: session_timeout: float, optional
+    :param: write_timeout: seconds allowed for each SEND to be written before the session returns TIMEOUT
+      (spawn.direct and AsyncSession only), defaults to Infinite
+    :type: write_timeout: float, optional
     :param: out: stream for writing receive data from the connection, defaults to stdout 
     :type: out: file-type, optional
     :param: err: stream for writing diagnostic and status messages, defaults to stderr
     :type: out: file-type, optional
     :param: events: a list of status events for which diagnostics should be emitted
     :type: events: netchat.status, optional
-    :param: spawn_type: type of subprocess used for TCP connection (spawn.internal, spawn.socat, spawn.nc)
+    :param: spawn_type: type of subprocess used for TCP connection (spawn.internal, spawn.socat, spawn.nc),
+      spawn.direct to connect from this process without a subprocess, or spawn.forkserver to relay through a
+      connector forked from a warm, preloaded server process
     :type: spawn_type: netchat.spawn
+    :param: search_window: characters before newly received data rescanned by a regex EXPECT, defaults to all
+    :type: search_window: int, optional
+    :param: max_buffer: characters of unmatched receive data retained (spawn.direct only), defaults to all
+    :type: max_buffer: int, optional
+    :param: binary: exchange raw bytes: EXPECT and SEND are bytes, each SEND is written without a line ending,
+      and ``out`` receives undecoded data
+    :type: binary: bool, optional
+    :param: connect_timeout: seconds allowed for each round of connection attempts, defaults to the operating
+      system's limit (not applied by spawn.socat or spawn.nc)
+    :type: connect_timeout: float, optional
+    :param: retries: connection attempt rounds after the first, separated by a jittered exponential backoff
+    :type: retries: int, optional
+    :param: tls: connect with TLS using these settings, resuming sessions cached by earlier connections made
+      with the same object (spawn.direct only)
+    :type: tls: netchat.tls.TLS, optional
+    :param: trace: recorder capturing the session timeline, see ``netchat.trace.Recorder``
+    :type: trace: netchat.trace.Recorder, optional
+    :param: connector_profile: write a ``cProfile`` profile of the connector subprocess to this file
+      (spawn.internal only)
+    :type: connector_profile: str, optional
+    :param: pipeline: number of steps whose SEND may go out before their EXPECT is received, defaults to 0
+      (lock-step)
+    :type: pipeline: int, optional
+    :param: variables: values for the script's ``${name}`` placeholders, in addition to ``address``, ``host``
+      and ``port`` which are set from ``address``
+    :type: variables: dict, optional
 
     ..note:: ``script`` can be a ``Script`` or a string
 
@@ -34,115 +136,210 @@ class Session():
        - elements are separated by whitespace and may be quote-delimited
        - a single element is treated as an EXPECT
        - an EXPECT without a SEND will have a null SEND appended
+
+    ..note:: after ``run`` returns, ``stats`` holds the session summary: final status, elapsed seconds,
+      seconds spent connecting, waiting on EXPECTs and sending, byte totals and the slowest transition;
+      each transition is also reported to the callback as a ``status.TIMING`` event and the summary
+      as a ``status.SUMMARY`` event
+
+    ..note:: a ``@timeout:SECONDS`` word before an EXPECT replaces ``wait_timeout`` for that EXPECT; every wait
+      is also cut short by ``session_timeout``, which also ends the script when ``@ontimeout`` would jump
+
+    ..note:: scripts may loop with ``@label``, ``@goto``, ``@loop`` and ``@sleep`` (see ``Script``), so one
+      connection can poll a device for as long as the script runs
+
+    ..note:: with ``pipeline`` set, SENDs are written ahead of their EXPECTs and the received data is matched
+      in order against the outstanding EXPECTs, so a run of N request/response steps costs about one round trip
+      instead of N; alternatives, jumps, sleeps and ``@exit`` steps depend on what was received, so the
+      outstanding EXPECTs are matched before one of them is run.  Each step reports the same status events as in lock-step mode.
+
+    ..note:: a script with ``${name}`` placeholders is bound to ``variables`` when the session is created,
+      sharing everything but the steps holding placeholders, so one parsed ``Script`` serves many sessions
     """
 
     def __init__(
-        self, address, script, *, wait_timeout=None, out=sys.stdout, err=sys.stderr, events=[status.EXPECT,status.SEND], spawn_type=spawn.internal
+        self,
+        address,
+        script,
+        *,
+        wait_timeout=None,
+        out=sys.stdout,
+        err=sys.stderr,
+        events=[status.EXPECT, status.SEND],
+        spawn_type=spawn.internal,
+        search_window=None,
+        max_buffer=None,
+        binary=False,
+        pipeline=0,
+        trace=None,
+        connect_timeout=None,
+        retries=0,
+        tls=None,
+        connector_profile=None,
+        session_timeout=None,
+        write_timeout=None,
+        variables=None
     ):
         """constructor"""
 
-        address, port = address
-
-        if isinstance(script, str):
-            self.script = Script(script=script)
-        elif isinstance(script, Script):
-            self.script = script
+        if isinstance(address, str):
+            transport = open_transport(address)
+            if spawn_type != spawn.direct:
+                raise ParameterError(f'{transport.scheme} transport requires spawn.direct')
+            if tls:
+                raise ParameterError(f'tls is not supported by the {transport.scheme} transport')
         else:
-            raise ParameterError(f'script must be of type {str} or {Script}')
+            host, port = address
+            address = (host, port)
+
+        self.variables = dict(address_variables(address), **(variables or {}))
+        self.script = self._bind(script, binary)
 
         self.wait_timeout = wait_timeout
         self.out = out
         self.err = err
         self.events = events
+        self.address = address
+        self.spawn_type = spawn_type
+        self.command = None
+        # a profiling connector ignores signals while it writes its profile
+        self.exit_grace = EXIT_GRACE if connector_profile else None
+        self.stats = None
+        self.pipeline = pipeline
+        self.options = dict(
+            search_window=search_window,
+            max_buffer=max_buffer,
+            binary=binary,
+            trace=trace,
+            connect_timeout=connect_timeout,
+            retries=retries,
+            tls=tls,
+            session_timeout=session_timeout,
+            write_timeout=write_timeout
+        )
+
+        if tls and spawn_type != spawn.direct:
+            raise ParameterError('tls requires spawn.direct')
+        if spawn_type != spawn.direct and self.script.elements is not None:
+            for step in self.script.elements:
+                for element in _elements(step):
+                    if isinstance(element.send, SendFile):
+                        raise ParameterError(f'{element.send} requires spawn.direct')
+        if connector_profile and spawn_type != spawn.internal:
+            raise ParameterError('connector_profile requires spawn.internal')
 
-        if spawn_type == spawn.socat:
-            self.command = f'socat stdio tcp4-connect:{address}:{port}'
+        if spawn_type in (spawn.direct, spawn.forkserver):
+            pass
+        elif spawn_type == spawn.socat:
+            self.command = f'socat stdio tcp4-connect:{address[0]}:{address[1]}'
         elif spawn_type == spawn.nc:
-            self.command = f'nc {address} {port}'
+            self.command = f'nc {address[0]} {address[1]}'
         elif spawn_type == spawn.internal:
-            self.command = f'python3 -m netchat {address}:{port} --subprocess'
+            self.command = f'{shlex.quote(sys.executable)} -m netchat.connection {address[0]}:{address[1]}'
+            if connect_timeout is not None:
+                self.command += f' --connect-timeout {connect_timeout}'
+            if retries:
+                self.command += f' --retries {retries}'
+            if connector_profile:
+                self.command += f' --profile {shlex.quote(connector_profile)}'
         else:
             raise ParameterError(f'invalid spawn_type {spawn_type}')
 
+    def _bind(self, script, binary):
+        # parse a str script, check a Script's binary mode, and fill in any placeholders from the variables
+        if isinstance(script, str):
+            script = Script(script=script, binary=binary)
+        elif not isinstance(script, Script):
+            raise ParameterError(f'script must be of type {str} or {Script}')
+        elif script.binary != binary:
+            raise ParameterError(f'script binary mode does not match session binary={binary}')
+        if script.templates or script.elements is None:
+            script = script.bind(self.variables)
+        return script
+
     def run(self, callback=None):
         """connect to the server and iterate through the script, waiting for EXPECT and sending SEND
           :param: callback: function to be called on state change events
           :type: callback: callback_function(netchat.status, data)
-          :return: EOF, TIMEOUT, or DONE 
+          :return: EOF, TIMEOUT, DONE, or a script exit status 
           :rtype: netchat.state
         """
-        with Handler(self.command, self.wait_timeout, self.out, self.err, self.events, callback) as handler:
-            for step in self.script:
+        with self.handler(callback) as handler:
+            result = self._run(handler)
+        self.stats = handler.summary(result)
+        return result
+
+    def _run(self, handler, script=None):
+        # (pattern, timeout, step number) of the steps whose SEND has been written ahead of their EXPECT;
+        # cursor.index is the number of the step it has just yielded, counting script elements from 1
+        outstanding = deque()
+        cursor = Cursor(self.script if script is None else script)
+        try:
+            for step in cursor:
+                if self.pipeline and isinstance(step, Element) and step.linear:
+                    while len(outstanding) >= self.pipeline:
+                        handler.expect(*outstanding.popleft())
+                    outstanding.append((step.pattern, step.timeout, cursor.index))
+                    handler.send(step.send, cursor.index)
+                    continue
+                while outstanding:
+                    handler.expect(*outstanding.popleft())
+                if isinstance(step, Sleep):
+                    handler.sleep(step.seconds)
+                    continue
+                if isinstance(step, Exit):
+                    return handler.event(step.status)
                 try:
-                    handler.expect(step.expect)
-                    handler.send(step.send)
-                except pexpect.exceptions.EOF as ex:
-                    return handler.event(status.EOF)
-                except pexpect.exceptions.TIMEOUT as ex:
-                    return handler.event(status.TIMEOUT)
+                    index = handler.expect(step.pattern, step.timeout, cursor.index)
+                except TIMEOUTS:
+                    if step.on_timeout is None or handler.expired():
+                        raise
+                    handler.event(status.TIMEOUT)
+                    cursor.jump(step.on_timeout)
+                    continue
+                step = step.choose(index)
+                if step.exit is not None:
+                    return handler.event(step.exit)
+                if step.goto is not None:
+                    cursor.jump(step.goto)
+                    continue
+                handler.send(step.send, cursor.index)
+            while outstanding:
+                handler.expect(*outstanding.popleft())
+        except (pexpect.exceptions.EOF, EOF) as ex:
+            return handler.event(status.EOF)
+        except TIMEOUTS as ex:
+            return handler.event(status.TIMEOUT)
         return status.DONE
 
+    def handler(self, callback=None):
+        """return the connection handler for this session's spawn_type
 
-class Handler():
-    """context manager for the pexpect subprocess
-
-    :param: command: command line for the spawned subprocess
-    :type: command: str
-    :param: timeout: expect timeout
-    :type: timeout: int
-    :param: out: stream for writing connection receive data
-    :type: out: file-type
-    :param: err: stream for writing diagnostic messages
-    :type: out: file-type
-    :param: events: list of desired status change diagnostics
-    :type: events: status
-    :param: callback: function to be called on state change events
-    :type: callback: function
-    """
-
-    def __init__(self, command, timeout, out, err, events, callback):
-        self.command = command
-        self.timeout = timeout
-        self.out = out
-        self.err = err
-        self.events = events
-        self.callback = callback
-
-    def __enter__(self):
-        self.event(status.CONNECTING)
-        self.child = pexpect.spawn(self.command, encoding='utf-8', timeout=self.timeout, logfile=self.out, echo=False)
-        self.event(status.CONNECTED)
-        return self
-
-    def __exit__(self, _, exception, traceback):
-        if self.child.isalive():
-            self.child.terminate()
-        self.event(status.CLOSED)
-        return False
-
-    def event(self, event, data=None):
-        if event in self.events:
-            if self.err:
-                if data:
-                    self.err.write(f"{str(event)} {repr(data)}\n")
-                else:
-                    self.err.write(f"{str(event)}\n")
-            if self.callback:
-                self.callback(event, data)
-        return event
-
-    def expect(self, data):
-        if data:
-            self.event(status.EXPECT, data)
-            ret = self.child.expect(data)
-            self.event(status.FOUND, data)
-        else:
-            self.event(status.EXPECT_SKIPPED)
-
-    def send(self, data):
-        if data:
-            self.event(status.SEND, data)
-            self.child.sendline(data)
-            self.event(status.SENT, data)
-        else:
-            self.event(status.SEND_SKIPPED)
+          :param: callback: function to be called on state change events
+          :type: callback: callback_function(netchat.status, data)
+          :return: handler context manager
+          :rtype: netchat.handler.Handler
+        """
+        if self.spawn_type == spawn.forkserver:
+            return ForkHandler(
+                self.address, self.wait_timeout, self.out, self.err, self.events, callback, **self.options
+            )
+        if self.spawn_type == spawn.direct:
+            return DirectHandler(
+                self.address, self.wait_timeout, self.out, self.err, self.events, callback, **self.options
+            )
+        command = self.command
+        if self.spawn_type == spawn.internal:
+            # resolved through this process's cache, so that sessions to the same host share one lookup
+            for host in numeric_hosts(self.address) or []:
+                command += f' --resolved {shlex.quote(host)}'
+        return Handler(
+            command,
+            self.wait_timeout,
+            self.out,
+            self.err,
+            self.events,
+            callback,
+            exit_grace=self.exit_grace,
+            **self.options
+        )
@@ -0,0 +1,199 @@
+# netchat session timing and byte counts
+
+from time import monotonic
+
+from .constant import status
+
+STARTS = frozenset([status.CONNECTING, status.EXPECT, status.SEND])
+ENDS = {
+    status.CONNECTED: status.CONNECTING,
+    status.FOUND: status.EXPECT,
+    status.EOF: status.EXPECT,
+    status.TIMEOUT: status.EXPECT,
+    status.SENT: status.SEND,
+}
+
+
+class Counter():
+    """file-like sink counting the bytes written to it, passing each chunk to ``tap`` if given"""
+
+    def __init__(self, tap=None):
+        self.bytes = 0
+        self.tap = tap
+
+    def write(self, data):
+        self.bytes += len(data.encode()) if isinstance(data, str) else len(data)
+        if self.tap:
+            self.tap(data)
+
+    def flush(self):
+        pass
+
+
+class RelayCounters():
+    """system call, byte and wakeup counts for a ``Connection`` relay
+
+    ``reader`` and ``writer`` wrap the relay's I/O functions; the relay uses the unwrapped functions
+    when it is not counting, so disabled counters cost nothing per chunk.
+    """
+
+    __slots__ = ('wakeups', 'reads', 'writes', 'blocked', 'rx_bytes', 'tx_bytes')
+
+    def __init__(self):
+        self.wakeups = 0
+        self.reads = 0
+        self.writes = 0
+        self.blocked = 0
+        self.rx_bytes = 0
+        self.tx_bytes = 0
+
+    def reader(self, read, rx):
+        """return read wrapped to count calls, would-block results and bytes received (rx) or sent"""
+
+        def counted(size):
+            self.reads += 1
+            try:
+                data = read(size)
+            except BlockingIOError:
+                self.blocked += 1
+                raise
+            if rx:
+                self.rx_bytes += len(data)
+            else:
+                self.tx_bytes += len(data)
+            return data
+
+        return counted
+
+    def writer(self, write):
+        """return write wrapped to count calls and would-block results"""
+
+        def counted(data):
+            self.writes += 1
+            try:
+                return write(data)
+            except BlockingIOError:
+                self.blocked += 1
+                raise
+
+        return counted
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def profiled(pathname, function, *args, **kwargs):
+    """call function under ``cProfile``, writing the profile to pathname in ``pstats`` format
+
+    :param: pathname: output file, readable with ``python -m pstats``
+    :type: pathname: str
+    :param: function: function to profile
+    :type: function: callable
+    :return: function's return value
+    """
+    # imported here so that the connector only pays for cProfile when it is asked to profile
+    import cProfile
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, *args, **kwargs)
+    finally:
+        profiler.dump_stats(pathname)
+
+
+class Stats():
+    """monotonic timing of status transitions, with the bytes received and sent during each
+
+    ``mark`` is called for every status event; when an event completes a transition
+    (CONNECTING→CONNECTED, EXPECT→FOUND/EOF/TIMEOUT, SEND→SENT) the timing is recorded in
+    ``transitions`` and returned as a dict.  A transition's ``step`` is the script step number
+    given with its starting event, or else a count of the EXPECTs so far; ``steps`` in the summary
+    counts the EXPECTs run.
+    """
+
+    def __init__(self):
+        self.started = None
+        self.finished = None
+        self.status = None
+        self.step = 0
+        self.pending = {}
+        self.transitions = []
+        self.rx_bytes = 0
+        self.tx_bytes = 0
+
+    def mark(self, event, data, rx_bytes, tx_bytes, step=None):
+        """record a status event
+
+        :param: event: status event
+        :type: event: netchat.status
+        :param: data: event data
+        :type: data: str
+        :param: rx_bytes: total bytes received so far
+        :type: rx_bytes: int
+        :param: tx_bytes: total bytes sent so far
+        :type: tx_bytes: int
+        :param: step: number of the script step the event belongs to
+        :type: step: int, optional
+        :return: the completed transition, or None
+        :rtype: dict
+        """
+        now = monotonic()
+        if self.started is None:
+            self.started = now
+        self.rx_bytes = rx_bytes
+        self.tx_bytes = tx_bytes
+        if event in (status.EXPECT, status.EXPECT_SKIPPED):
+            self.step += 1
+        if event in STARTS:
+            if isinstance(data, bytes):
+                # binary mode data: transitions and summaries must serialize as JSON
+                data = data.decode(errors='backslashreplace')
+            self.pending[event] = (now, rx_bytes, tx_bytes, data, self.step if step is None else step)
+            return None
+        start = ENDS.get(event)
+        if start is None or start not in self.pending:
+            return None
+        then, rx_then, tx_then, start_data, start_step = self.pending.pop(start)
+        transition = dict(
+            transition=f"{start}->{event}",
+            step=start_step,
+            data=start_data,
+            time=now,
+            offset=now - self.started,
+            duration=now - then,
+            rx_bytes=rx_bytes - rx_then,
+            tx_bytes=tx_bytes - tx_then
+        )
+        self.transitions.append(transition)
+        return transition
+
+    def finish(self, result):
+        """record the final session status
+
+        :param: result: status returned by the session
+        :type: result: netchat.status
+        """
+        self.finished = monotonic()
+        self.status = result
+
+    def summary(self):
+        """return the session summary
+
+        :return: final status, elapsed time, time spent connecting, waiting and sending, byte totals
+          and the slowest transition
+        :rtype: dict
+        """
+        totals = dict(connect=0.0, expect=0.0, send=0.0)
+        for transition in self.transitions:
+            key = transition['transition'].split('->')[0].lower().replace('connecting', 'connect')
+            totals[key] += transition['duration']
+        slowest = max(self.transitions, key=lambda t: t['duration'], default=None)
+        end = self.finished or monotonic()
+        return dict(
+            status=str(self.status) if self.status is not None else None,
+            elapsed=end - self.started if self.started is not None else 0.0,
+            steps=self.step,
+            rx_bytes=self.rx_bytes,
+            tx_bytes=self.tx_bytes,
+            **totals,
+            slowest=slowest
+        )
@@ -0,0 +1,153 @@
+# netchat timer wheel
+
+import weakref
+
+from math import ceil
+
+TICK = 0.01
+SLOT_BITS = 8
+LEVELS = 4
+
+
+class Timer():
+    """timer scheduled on a ``TimerWheel``; ``expired`` is set when its callback has been called"""
+
+    __slots__ = ('tick', 'callback', 'wheel', 'expired')
+
+    def __init__(self, tick, callback, wheel):
+        self.tick = tick
+        self.callback = callback
+        self.wheel = wheel
+        self.expired = False
+
+    def cancel(self):
+        """stop the timer unless it has already expired"""
+        if self.callback is not None and not self.expired:
+            self.callback = None
+            self.wheel.count -= 1
+
+
+class TimerWheel():
+    """hierarchical timing wheel holding many timers at a constant cost per timer
+
+    Time is counted in ticks.  Level 0 has one slot per tick for the next ``2**slot_bits`` ticks; each
+    higher level has slots ``2**slot_bits`` times wider, and its timers are moved down a level when
+    the wheel reaches their slot.  Scheduling and cancelling a timer cost O(1), and ``advance`` costs
+    one step per elapsed tick plus the timers that expire or move, however many timers are pending.
+    Timers due beyond the top level wait in its last slot and are placed again when it is reached.
+
+    :param: tick: seconds per tick; timers expire up to one tick late
+    :type: tick: float
+    :param: slot_bits: log2 of the number of slots in each level
+    :type: slot_bits: int
+    :param: levels: number of levels
+    :type: levels: int
+    :param: now: current time, in seconds
+    :type: now: float
+    """
+
+    def __init__(self, tick=TICK, slot_bits=SLOT_BITS, levels=LEVELS, now=0.0):
+        self.tick = tick
+        self.slot_bits = slot_bits
+        self.mask = (1 << slot_bits) - 1
+        self.wheels = [[[] for _ in range(1 << slot_bits)] for _ in range(levels)]
+        self.current = int(now / tick)
+        self.count = 0
+
+    def schedule(self, when, callback):
+        """call ``callback()`` from ``advance`` once time ``when`` (seconds) is reached
+
+        :param: when: expiry time, on the clock passed to ``advance``
+        :type: when: float
+        :param: callback: function called without arguments
+        :type: callback: callable
+        :return: timer, which may be cancelled
+        :rtype: netchat.timer.Timer
+        """
+        timer = Timer(max(ceil(when / self.tick), self.current + 1), callback, self)
+        self._place(timer)
+        self.count += 1
+        return timer
+
+    def _place(self, timer):
+        delta = timer.tick - self.current
+        for level, wheel in enumerate(self.wheels):
+            if delta < 1 << (self.slot_bits * (level+1)) or level == len(self.wheels) - 1:
+                if delta >= 1 << (self.slot_bits * (level+1)):
+                    # beyond the top level: park in the slot reached last, then place again
+                    slot = (self.current >> (self.slot_bits * level)) - 1
+                else:
+                    slot = timer.tick >> (self.slot_bits * level)
+                wheel[slot & self.mask].append(timer)
+                return
+
+    def advance(self, now):
+        """expire the timers due by ``now`` (seconds), calling their callbacks
+
+        :param: now: current time, on the clock used for ``schedule``
+        :type: now: float
+        :return: number of timers expired
+        :rtype: int
+        """
+        target = int(now / self.tick)
+        expired = 0
+        while self.current < target:
+            if not self.count:
+                self.current = target
+                break
+            self.current += 1
+            for level in range(1, len(self.wheels)):
+                if self.current & ((1 << (self.slot_bits * level)) - 1):
+                    break
+                slot = (self.current >> (self.slot_bits * level)) & self.mask
+                timers, self.wheels[level][slot] = self.wheels[level][slot], []
+                for timer in timers:
+                    if timer.callback is not None:
+                        self._place(timer)
+            slot = self.current & self.mask
+            timers, self.wheels[0][slot] = self.wheels[0][slot], []
+            for timer in timers:
+                callback = timer.callback
+                if callback is None:
+                    continue
+                if timer.tick > self.current:
+                    self._place(timer)
+                    continue
+                timer.expired = True
+                self.count -= 1
+                expired += 1
+                callback()
+        return expired
+
+
+class LoopTimers(TimerWheel):
+    """timer wheel driven by an asyncio event loop with a single wakeup per tick while timers are pending"""
+
+    def __init__(self, loop, tick=TICK):
+        super().__init__(tick, now=loop.time())
+        self.loop = loop
+        self.handle = None
+
+    def call_at(self, when, callback):
+        """schedule callback for loop time ``when``, returning the cancellable timer"""
+        timer = self.schedule(when, callback)
+        if self.handle is None:
+            self.handle = self.loop.call_later(self.tick, self._run)
+        return timer
+
+    def _run(self):
+        self.handle = None
+        self.advance(self.loop.time())
+        if self.count:
+            self.handle = self.loop.call_later(self.tick, self._run)
+
+
+_loop_timers = weakref.WeakKeyDictionary()
+
+
+def loop_timers(loop):
+    """return the timer wheel shared by every session running on an event loop"""
+    timers = _loop_timers.get(loop)
+    if timers is None:
+        timers = _loop_timers[loop] = LoopTimers(loop)
+    return timers
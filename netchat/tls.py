@@ -0,0 +1,96 @@
+# netchat TLS client settings and session cache
+
+import socket
+import ssl
+import threading
+
+from collections import OrderedDict
+
+from .exception import TimeoutError
+
+CACHE_SIZE = 1024
+
+
+class TLS():
+    """client TLS settings, with a cache of TLS sessions for resuming later connections
+
+    One ``TLS`` object holds one ``ssl.SSLContext``; a session can only be resumed with the
+    context that created it, so share the object between every ``Session`` that should resume,
+    e.g. the sessions of a ``Batch`` or ``Pool``, or repeated polls of the same host.
+
+    :param: cafile: CA bundle used to verify the server, defaults to the system store
+    :type: cafile: str, optional
+    :param: certfile: client certificate, PEM
+    :type: certfile: str, optional
+    :param: keyfile: client certificate key, if not included in certfile
+    :type: keyfile: str, optional
+    :param: server_hostname: name sent as SNI and verified against the certificate, defaults to the host
+    :type: server_hostname: str, optional
+    :param: verify: verify the server certificate and hostname
+    :type: verify: bool
+    :param: cache_size: maximum number of (name, host, port) entries in the session cache
+    :type: cache_size: int
+    """
+
+    def __init__(
+        self, *, cafile=None, certfile=None, keyfile=None, server_hostname=None, verify=True, cache_size=CACHE_SIZE
+    ):
+        self.context = ssl.create_default_context(cafile=cafile)
+        if certfile:
+            self.context.load_cert_chain(certfile, keyfile)
+        if not verify:
+            self.context.check_hostname = False
+            self.context.verify_mode = ssl.CERT_NONE
+        self.server_hostname = server_hostname
+        self.cache_size = cache_size
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def name(self, address):
+        """return the SNI and verification name for address"""
+        return self.server_hostname or address[0]
+
+    def wrap(self, sock, address, timeout=None):
+        """perform the client handshake on a connected socket, resuming a cached session if possible
+
+        :param: sock: connected socket
+        :type: sock: socket.socket
+        :param: address: (host, port) the socket is connected to
+        :type: address: tuple
+        :param: timeout: seconds allowed for the handshake
+        :type: timeout: float, optional
+        :return: TLS socket, in blocking mode
+        :rtype: ssl.SSLSocket
+        """
+        key = (self.name(address), *address)
+        with self.lock:
+            session = self.sessions.get(key)
+        sock.settimeout(timeout)
+        try:
+            tls = self.context.wrap_socket(sock, server_hostname=self.name(address), session=session)
+        except socket.timeout:
+            sock.close()
+            raise TimeoutError(f'timeout in TLS handshake with {address[0]}:{address[1]}') from None
+        except BaseException:
+            sock.close()
+            raise
+        tls.settimeout(None)
+        self.save(tls, address)
+        return tls
+
+    def save(self, tls, address):
+        """cache the session of a TLS socket; TLS 1.3 tickets arrive after the handshake, so call again on close"""
+        session = tls.session
+        if session is None:
+            return
+        key = (self.name(address), *address)
+        with self.lock:
+            self.sessions[key] = session
+            self.sessions.move_to_end(key)
+            while len(self.sessions) > self.cache_size:
+                self.sessions.popitem(last=False)
+
+
+def describe(tls):
+    """return the ``status.CONNECTED`` event data for a TLS socket or SSL object"""
+    return dict(tls=tls.version(), cipher=tls.cipher()[0], resumed=tls.session_reused)
@@ -0,0 +1,190 @@
+# netchat session trace recording and replay
+
+import asyncio
+import gzip
+import json
+import threading
+
+from time import monotonic, time
+
+from .exception import ParameterError
+from .transport import format_address
+
+VERSION = 1
+
+
+def _open(pathname, mode):
+    if pathname.endswith('.gz'):
+        return gzip.open(pathname, mode + 't', encoding='utf-8')
+    return open(pathname, mode, encoding='utf-8')
+
+
+def _text(data):
+    # received and sent chunks are stored as latin-1 text, so any byte survives the JSON round trip
+    if isinstance(data, str):
+        data = data.encode()
+    return data.decode('latin-1')
+
+
+def _json(data):
+    if isinstance(data, (bytes, bytearray)):
+        return _text(data)
+    if isinstance(data, (tuple, list)):
+        return [_json(item) for item in data]
+    if isinstance(data, dict):
+        return {key: _json(value) for key, value in data.items()}
+    if data is None or isinstance(data, (str, int, float, bool)):
+        return data
+    return str(data)
+
+
+class Recorder():
+    """record a session timeline as a JSONL trace: timestamped rx/tx chunks and status events
+
+    The first line is a header ``{"netchat": 1, "address": "host:port", "started": epoch}``; each
+    following line is one of ``{"t": seconds, "rx": data}``, ``{"t": seconds, "tx": data}`` or
+    ``{"t": seconds, "event": "STATUS", "data": ...}``, where ``t`` is the offset from the start of
+    the session and chunk data is the received or sent bytes as latin-1 text.
+    A pathname ending in ``.gz`` is gzip compressed.
+
+    :param: pathname: trace file path
+    :type: pathname: str
+    :param: address: (host, port) of the recorded session
+    :type: address: tuple
+    """
+
+    def __init__(self, pathname, address):
+        self.pathname = pathname
+        self.file = _open(pathname, 'w')
+        self.started = monotonic()
+        self.lock = threading.Lock()
+        self._write(dict(netchat=VERSION, address=format_address(address), started=time()))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, _, exception, traceback):
+        self.close()
+        return False
+
+    def _write(self, record):
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self.lock:
+            self.file.write(line)
+
+    def rx(self, data):
+        """record a chunk received from the connection"""
+        if data:
+            self._write(dict(t=round(monotonic() - self.started, 6), rx=_text(data)))
+
+    def tx(self, data):
+        """record a chunk sent to the connection"""
+        if data:
+            self._write(dict(t=round(monotonic() - self.started, 6), tx=_text(data)))
+
+    def event(self, event, data=None):
+        """record a status event"""
+        self._write(dict(t=round(monotonic() - self.started, 6), event=str(event), data=_json(data)))
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+def read_trace(pathname):
+    """read a trace written by ``Recorder``
+
+    :param: pathname: trace file path
+    :type: pathname: str
+    :return: header and the list of records
+    :rtype: tuple
+    """
+    with _open(pathname, 'r') as fp:
+        header = json.loads(fp.readline() or 'null')
+        if not isinstance(header, dict) or header.get('netchat') != VERSION:
+            raise ParameterError(f'{pathname} is not a netchat trace')
+        return header, [json.loads(line) for line in fp if line.strip()]
+
+
+class ReplayServer():
+    """TCP server playing back the server side of a recorded trace to each client that connects
+
+    Recorded rx chunks are written to the client with the recorded gaps between them divided by
+    ``speed``; at each recorded tx the server reads as many bytes from the client as were sent in
+    the recording before continuing, so a client running the same script stays in step with the trace.
+    The connection is closed at the end of the trace.
+
+    :param: trace: trace file path
+    :type: trace: str
+    :param: host: listening address
+    :type: host: str
+    :param: port: listening port, defaults to any free port
+    :type: port: int
+    :param: speed: time compression factor; 0 replays without delays
+    :type: speed: float
+    """
+
+    def __init__(self, trace, *, host='localhost', port=0, speed=1.0):
+        self.header, records = read_trace(trace)
+        self.steps = self.compile(records)
+        self.host = host
+        self.port = port
+        self.speed = speed
+        self.connections = 0
+        self.server = None
+        self.loop = None
+        self.thread = None
+
+    @staticmethod
+    def compile(records):
+        """return the replay steps for trace records: ('rx', gap, bytes) and ('tx', byte count) tuples"""
+        steps = []
+        last = 0.0
+        for record in records:
+            if 'rx' in record:
+                steps.append(('rx', record['t'] - last, record['rx'].encode('latin-1')))
+                last = record['t']
+            elif 'tx' in record:
+                if steps and steps[-1][0] == 'tx':
+                    steps[-1] = ('tx', steps[-1][1] + len(record['tx']))
+                else:
+                    steps.append(('tx', len(record['tx'])))
+                last = record['t']
+        return steps
+
+    async def start(self):
+        """start listening on the running event loop"""
+        self.server = await asyncio.start_server(self.replay, self.host, self.port, backlog=4096)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.server
+
+    def __enter__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.start(), self.loop).result()
+        return self
+
+    def __exit__(self, _, exception, traceback):
+        self.loop.call_soon_threadsafe(self.server.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        return False
+
+    async def replay(self, reader, writer):
+        self.connections += 1
+        try:
+            for step in self.steps:
+                if step[0] == 'rx':
+                    _, gap, data = step
+                    if self.speed and gap > 0:
+                        await asyncio.sleep(gap / self.speed)
+                    writer.write(data)
+                    await writer.drain()
+                else:
+                    await reader.readexactly(step[1])
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
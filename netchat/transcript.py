@@ -0,0 +1,247 @@
+# netchat transcript writer
+
+import gzip
+import os
+import queue
+import re
+import shutil
+import threading
+
+from time import monotonic
+
+QUEUE_SIZE = 4096
+FLUSH_INTERVAL = 1.0
+BACKUPS = 5
+
+
+class RotatingFile():
+    """append-only transcript file, rotated when it grows past max_bytes or older than max_age
+
+    Rotation renames ``pathname`` to ``pathname.1`` (``pathname.1.gz`` when compressing),
+    shifting older files up and discarding any beyond ``backups``.
+
+    :param: pathname: transcript file path
+    :type: pathname: str
+    :param: max_bytes: rotate before a write would take the file past this size, defaults to never
+    :type: max_bytes: int, optional
+    :param: max_age: rotate once the file has been open this many seconds, defaults to never
+    :type: max_age: float, optional
+    :param: backups: number of rotated files kept
+    :type: backups: int
+    :param: compress: gzip rotated files
+    :type: compress: bool
+    """
+
+    def __init__(self, pathname, *, max_bytes=None, max_age=None, backups=BACKUPS, compress=False):
+        self.pathname = pathname
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backups = backups
+        self.compress = compress
+        self.rotations = 0
+        self.file = None
+        self._open()
+
+    def _open(self):
+        self.file = open(self.pathname, 'ab')
+        self.size = self.file.tell()
+        self.opened = monotonic()
+
+    def _backup(self, n):
+        return f"{self.pathname}.{n}{'.gz' if self.compress else ''}"
+
+    def _due(self, count):
+        if not self.size:
+            return False
+        if self.max_bytes and self.size + count > self.max_bytes:
+            return True
+        return bool(self.max_age) and monotonic() - self.opened >= self.max_age
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        if self._due(len(data)):
+            self.rotate()
+        self.file.write(data)
+        self.size += len(data)
+        return len(data)
+
+    def rotate(self):
+        """close the current file, shift the backups and start a new file"""
+        self.file.close()
+        if self.backups:
+            for n in range(self.backups - 1, 0, -1):
+                if os.path.exists(self._backup(n)):
+                    os.replace(self._backup(n), self._backup(n + 1))
+            if self.compress:
+                with open(self.pathname, 'rb') as src, gzip.open(self._backup(1), 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+                os.unlink(self.pathname)
+            else:
+                os.replace(self.pathname, self._backup(1))
+        else:
+            os.unlink(self.pathname)
+        self.rotations += 1
+        self._open()
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+class Transcript():
+    """file-like ``out`` stream that hands received data to a background writer thread
+
+    ``write`` only appends to a bounded queue, so a slow disk or pipe stalls EXPECT matching
+    only once ``queue_size`` chunks are waiting; the writer thread coalesces queued chunks into
+    one write per sink and flushes the sinks according to ``flush_interval``.
+
+    :param: sinks: streams receiving the transcript, such as a ``RotatingFile`` or ``sys.stdout``
+    :type: sinks: file-type
+    :param: queue_size: maximum number of chunks waiting for the writer thread
+    :type: queue_size: int
+    :param: flush_interval: seconds between sink flushes while data is pending; 0 flushes whenever
+      the queue empties, None only on close
+    :type: flush_interval: float, optional
+    :param: block: wait for queue space when full; False drops the chunk instead, so the session
+      never waits on the transcript but the transcript may be incomplete
+    :type: block: bool
+    :param: close_sinks: close the sinks when the transcript is closed
+    :type: close_sinks: bool
+
+    ..note:: chunks dropped because the queue was full are counted in ``dropped`` (bytes or characters)
+    ..note:: ``close`` raises the first error the writer thread met
+    """
+
+    _CLOSE = object()
+
+    def __init__(self, *sinks, queue_size=QUEUE_SIZE, flush_interval=FLUSH_INTERVAL, block=True, close_sinks=True):
+        self.sinks = sinks
+        self.flush_interval = flush_interval
+        self.block = block
+        self.close_sinks = close_sinks
+        self.dropped = 0
+        self.error = None
+        self.closed = False
+        self.queue = queue.Queue(queue_size)
+        self.thread = threading.Thread(target=self._writer, name='netchat-transcript', daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, _, exception, traceback):
+        self.close()
+        return False
+
+    def write(self, data):
+        if data:
+            try:
+                self.queue.put(data, block=self.block)
+            except queue.Full:
+                self.dropped += len(data)
+        return len(data)
+
+    def flush(self):
+        # called by the handlers after every write; flushing is the writer thread's job
+        pass
+
+    def close(self):
+        """wait for queued data to be written, flush the sinks and close them if owned"""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(self._CLOSE)
+        self.thread.join()
+        for sink in self.sinks:
+            sink.flush()
+            if self.close_sinks:
+                sink.close()
+        if self.error:
+            raise self.error
+
+    def _writer(self):
+        deadline = None
+        while True:
+            try:
+                chunk = self.queue.get(timeout=None if deadline is None else max(0, deadline - monotonic()))
+            except queue.Empty:
+                chunk = None
+            chunks = []
+            while chunk is not None and chunk is not self._CLOSE:
+                chunks.append(chunk)
+                try:
+                    chunk = self.queue.get_nowait()
+                except queue.Empty:
+                    chunk = None
+            if chunks:
+                self._write(chunks[0][:0].join(chunks))
+                if deadline is None and self.flush_interval is not None:
+                    deadline = monotonic() + self.flush_interval
+            if chunk is self._CLOSE:
+                return
+            if deadline is not None and monotonic() >= deadline:
+                self._flush()
+                deadline = None
+
+    def _write(self, data):
+        if self.error:
+            return
+        try:
+            for sink in self.sinks:
+                sink.write(data)
+        except Exception as ex:
+            self.error = ex
+
+    def _flush(self):
+        if self.error:
+            return
+        try:
+            for sink in self.sinks:
+                sink.flush()
+        except Exception as ex:
+            self.error = ex
+
+
+def open_transcript(template, address, *, echo=None, **kwargs):
+    """open a per-session transcript file named from a template
+
+    :param: template: file path; ``{host}`` and ``{port}`` are replaced with the session address, or for a
+      transport address with its scheme and its target reduced to file name characters
+    :type: template: str
+    :param: address: (host, port) or transport address of the session
+    :type: address: tuple/str
+    :param: echo: additional stream receiving the transcript, not closed with it
+    :type: echo: file-type, optional
+    :param: kwargs: ``RotatingFile`` options (max_bytes, max_age, backups, compress) and
+      ``Transcript`` options (queue_size, flush_interval, block)
+    :type: kwargs: dict
+    :return: transcript stream for use as a session's ``out``
+    :rtype: netchat.transcript.Transcript
+    """
+    if isinstance(address, str):
+        host, _, target = address.partition(':')
+        port = re.sub(r'[^\w.-]+', '_', target).strip('_')
+    else:
+        host, port = address
+    rotate = {key: kwargs.pop(key) for key in ('max_bytes', 'max_age', 'backups', 'compress') if key in kwargs}
+    file = RotatingFile(template.format(host=host, port=port), **rotate)
+    if echo is None:
+        return Transcript(file, **kwargs)
+    return _EchoTranscript(file, echo, **kwargs)
+
+
+class _EchoTranscript(Transcript):
+    """transcript that closes its file but leaves the echo stream open"""
+
+    def __init__(self, file, echo, **kwargs):
+        super().__init__(file, echo, close_sinks=False, **kwargs)
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.sinks[0].close()
@@ -0,0 +1,166 @@
+# netchat in-process transports
+
+import abc
+import shlex
+import socket
+import subprocess
+
+from .exception import ParameterError, TimeoutError
+from .net import connect
+
+EXIT_TIMEOUT = 1.0
+
+
+class Transport(abc.ABC):
+    """stream opened by the in-process handlers for one session
+
+    ``open`` returns a connected, blocking stream socket; ``close`` releases anything else the
+    transport holds once the handler has closed that socket.
+
+    :param: target: transport address, without the scheme
+    :type: target: str/tuple
+    """
+
+    scheme = None
+
+    def __init__(self, target):
+        self.target = target
+
+    @abc.abstractmethod
+    def open(self, timeout=None, retries=0, tls=None):
+        """return a connected socket
+
+        :param: timeout: seconds allowed for each round of connection attempts
+        :type: timeout: float, optional
+        :param: retries: connection attempt rounds after the first
+        :type: retries: int
+        :param: tls: TLS settings
+        :type: tls: netchat.tls.TLS, optional
+        :return: connected socket
+        :rtype: socket.socket
+        """
+
+    def close(self):
+        pass
+
+    def __str__(self):
+        return f"{self.scheme}:{self.target}"
+
+
+class TCP(Transport):
+    """TCP connection to a (host, port) address, optionally with TLS"""
+
+    scheme = 'tcp'
+
+    def open(self, timeout=None, retries=0, tls=None):
+        sock = connect(self.target, timeout=timeout, retries=retries)
+        if tls:
+            sock = tls.wrap(sock, self.target, timeout=timeout)
+        return sock
+
+    def __str__(self):
+        return ':'.join(str(part) for part in self.target)
+
+
+class Unix(Transport):
+    """connection to a unix domain stream socket, ``unix:/path/to/socket``"""
+
+    scheme = 'unix'
+
+    def open(self, timeout=None, retries=0, tls=None):
+        if tls:
+            raise ParameterError('tls is not supported on unix sockets')
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(self.target)
+        except socket.timeout:
+            sock.close()
+            raise TimeoutError(f'timeout connecting to {self}') from None
+        except BaseException:
+            sock.close()
+            raise
+        sock.settimeout(None)
+        return sock
+
+
+class Exec(Transport):
+    """local program driven over its stdin and stdout, ``exec:command args...``
+
+    The program's stdin, stdout and stderr are one end of a socket pair rather than a pty, so there
+    is no line discipline, echo or terminal buffering between the script and the program.
+    """
+
+    scheme = 'exec'
+
+    def __init__(self, target):
+        super().__init__(target)
+        self.process = None
+
+    def open(self, timeout=None, retries=0, tls=None):
+        if tls:
+            raise ParameterError('tls is not supported on exec transports')
+        parent, child = socket.socketpair()
+        try:
+            self.process = subprocess.Popen(
+                shlex.split(self.target), stdin=child, stdout=child, stderr=child, start_new_session=True
+            )
+        except BaseException:
+            parent.close()
+            raise
+        finally:
+            child.close()
+        return parent
+
+    def close(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(EXIT_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+
+
+TRANSPORTS = {transport.scheme: transport for transport in (TCP, Unix, Exec)}
+
+
+def register(transport):
+    """add a Transport subclass, making ``scheme:target`` addresses available to sessions
+
+    :param: transport: transport class with a ``scheme`` attribute
+    :type: transport: type
+    :return: transport
+    :rtype: type
+    """
+    TRANSPORTS[transport.scheme] = transport
+    return transport
+
+
+def is_local(address):
+    """return True if address names a registered transport other than TCP"""
+    if not isinstance(address, str):
+        return False
+    scheme = address.partition(':')[0]
+    return scheme in TRANSPORTS and scheme != TCP.scheme
+
+
+def open_transport(address):
+    """return the Transport for a (host, port) tuple or a ``scheme:target`` string
+
+    :param: address: session address
+    :type: address: tuple/str
+    :return: transport, not yet opened
+    :rtype: netchat.transport.Transport
+    """
+    if isinstance(address, tuple):
+        return TCP(address)
+    if not is_local(address):
+        raise ParameterError(f'unknown transport in address {address!r}')
+    scheme, _, target = address.partition(':')
+    return TRANSPORTS[scheme](target)
+
+
+def format_address(address):
+    """return the display form of a (host, port) tuple or transport address"""
+    return str(open_transport(address))
@@ -1,7 +1,12 @@
 import pytest
+import queue
+import shutil
+import socket
+import ssl
 import subprocess
 import logging
-from time import time
+import threading
+from time import monotonic, sleep, time
 
 
 class Server():
@@ -103,3 +108,141 @@ class CallbackCatcher():
 @pytest.fixture()
 def callback():
     return CallbackCatcher()
+
+
+class ChatServer():
+    """in-process TCP server: sends a login prompt, then answers each received line with a prompt
+
+    ``latency`` delays each answer as a slow link would, without serializing the answers; with ``path``
+    the server listens on a unix domain socket instead
+    """
+
+    def __init__(self, banner='hello\nlogin: ', prompt='> ', latency=0, ssl_context=None, path=None):
+        self.banner = banner
+        self.prompt = prompt
+        self.latency = latency
+        self.ssl_context = ssl_context
+        self.path = path
+        if path:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.bind(path)
+            self.sock.listen()
+            self.port = None
+        else:
+            self.sock = socket.create_server(('localhost', 0))
+            self.port = self.sock.getsockname()[1]
+        self.received = []
+        self.connections = 0
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, _, exception, traceback):
+        self.sock.close()
+        return False
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.chat, args=(conn, ), daemon=True).start()
+
+    def chat(self, conn):
+        self.connections += 1
+        if self.ssl_context:
+            try:
+                conn = self.ssl_context.wrap_socket(conn, server_side=True)
+            except (ssl.SSLError, ConnectionError):
+                conn.close()
+                return
+        with conn, conn.makefile('rwb', buffering=0) as stream:
+            replies = queue.Queue()
+            writer = threading.Thread(target=self.reply, args=(stream, replies), daemon=True)
+            writer.start()
+            try:
+                replies.put((monotonic(), self.banner.encode()))
+                for line in stream:
+                    line = line.decode().strip()
+                    self.received.append(line)
+                    if line == 'quit':
+                        replies.put((monotonic() + self.latency, b'bye\n'))
+                        return
+                    replies.put((monotonic() + self.latency, f'you said {line}\n{self.prompt}'.encode()))
+            except ConnectionError:
+                pass
+            finally:
+                replies.put(None)
+                writer.join()
+
+    def reply(self, stream, replies):
+        try:
+            for due, data in iter(replies.get, None):
+                sleep(max(0, due - monotonic()))
+                stream.write(data)
+        except (ConnectionError, ValueError):
+            pass
+
+
+@pytest.fixture()
+def chat_server():
+    with ChatServer() as s:
+        yield s
+
+
+@pytest.fixture()
+def unix_chat_server(tmp_path):
+    with ChatServer(path=str(tmp_path / 'chat.sock')) as s:
+        yield s
+
+
+@pytest.fixture()
+def slow_chat_server():
+    with ChatServer(latency=0.05) as s:
+        yield s
+
+
+@pytest.fixture()
+def blackhole():
+    """address of a listener whose accept queue is full, so that connection attempts hang"""
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(0)
+    address = listener.getsockname()
+    fillers = []
+    for _ in range(4):
+        sock = socket.socket()
+        sock.setblocking(False)
+        sock.connect_ex(address)
+        fillers.append(sock)
+    yield address
+    for sock in fillers:
+        sock.close()
+    listener.close()
+
+
+@pytest.fixture(scope='session')
+def certificate(tmp_path_factory):
+    """self-signed certificate and key for localhost, as (certfile, keyfile)"""
+    if not shutil.which('openssl'):
+        pytest.skip('openssl is not installed')
+    path = tmp_path_factory.mktemp('tls')
+    cert, key = str(path / 'cert.pem'), str(path / 'key.pem')
+    subprocess.run([
+        'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1', '-subj', '/CN=localhost', '-addext',
+        'subjectAltName=DNS:localhost,IP:127.0.0.1', '-keyout', key, '-out', cert
+    ],
+                   check=True,
+                   capture_output=True)
+    return cert, key
+
+
+@pytest.fixture()
+def tls_chat_server(certificate):
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(*certificate)
+    with ChatServer(ssl_context=context) as s:
+        yield s
@@ -0,0 +1,59 @@
+# netchat asyncio session tests
+
+import asyncio
+
+from netchat import AsyncSession, status
+
+
+def test_async_gather(chat_server):
+
+    async def chat(n):
+        script = f'"login: " user{n} "said user{n}" quit bye'
+        return await AsyncSession(('localhost', chat_server.port), script, out=None, err=None).run()
+
+    async def main():
+        return await asyncio.gather(*[chat(n) for n in range(50)])
+
+    assert asyncio.run(main()) == [status.DONE] * 50
+    assert sorted(chat_server.received) == sorted([f'user{n}' for n in range(50)] + ['quit'] * 50)
+
+
+def test_async_timeout_and_eof(chat_server, callback):
+    address = ('localhost', chat_server.port)
+    session = AsyncSession(address, 'nomatch', wait_timeout=0.2, out=None, err=None, events=list(status))
+    assert asyncio.run(session.run(callback.rx)) == status.TIMEOUT
+    assert [(event, data)
+            for event, data in callback.buffer
+            if event != status.TIMING][-3:-1] == [(status.TIMEOUT, None), (status.CLOSED, None)]
+    session = AsyncSession(address, '"login: " quit nomatch', out=None, err=None)
+    assert asyncio.run(session.run()) == status.EOF
+
+
+def test_async_element_and_session_timeouts(chat_server):
+    address = ('localhost', chat_server.port)
+
+    async def main():
+        sessions = [
+            AsyncSession(address, '"login: " admin @timeout:0.1 nomatch', wait_timeout=30, out=None, err=None)
+            for _ in range(20)
+        ]
+        sessions.append(AsyncSession(address, '"login: " x nomatch', session_timeout=0.2, out=None, err=None))
+        sessions.append(AsyncSession(address, '@timeout:5 "login: " quit bye', out=None, err=None))
+        return await asyncio.gather(*(session.run() for session in sessions))
+
+    assert asyncio.run(main()) == [status.TIMEOUT] * 21 + [status.DONE]
+
+
+def test_async_polling_loop(chat_server):
+    script = '"login: " admin @label:poll @sleep:0.01 "> " status "said status" "" @loop:poll:3 "> " quit bye'
+    session = AsyncSession(('localhost', chat_server.port), script, out=None, err=None)
+    assert asyncio.run(session.run()) == status.DONE
+    assert chat_server.received == ['admin'] + ['status'] * 3 + ['quit']
+
+
+def test_async_upload(chat_server, tmp_path):
+    path = tmp_path / 'upload'
+    path.write_text(''.join(f'line{n}\n' for n in range(20000)) + 'quit\n')
+    session = AsyncSession(('localhost', chat_server.port), f'"login: " @file:{path} bye', out=None, err=None)
+    assert asyncio.run(session.run()) == status.DONE
+    assert chat_server.received == [f'line{n}' for n in range(20000)] + ['quit']
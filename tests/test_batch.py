@@ -0,0 +1,53 @@
+# netchat batch mode tests
+
+import json
+
+from click.testing import CliRunner
+
+from netchat import spawn, status
+from netchat.batch import Batch, read_inventory
+from netchat.cli import cli
+
+
+def test_batch_results(chat_server):
+    targets = [('localhost', chat_server.port)] * 20
+    batch = Batch(targets, '"login: " admin "said admin" quit', parallel=4, out=None, err=None, spawn_type=spawn.direct)
+    results = list(batch.run())
+    assert len(results) == 20
+    assert all(result.ok for result in results)
+    assert json.loads(str(results[0]))['status'] == 'DONE'
+
+
+def test_batch_cli(chat_server, tmp_path):
+    targets = tmp_path / 'targets'
+    targets.write_text(f'# fleet\nlocalhost:{chat_server.port}\n\nlocalhost:1\n')
+    runner = CliRunner()
+    result = runner.invoke(cli, ['--targets', str(targets), '-s', 'direct', '-q', '"login: " admin'])
+    assert result.exit_code == 1
+    lines = [json.loads(line) for line in result.stdout.splitlines()]
+    assert sorted(line['status'] or 'ERROR' for line in lines) == ['DONE', 'ERROR']
+
+
+def test_batch_variables(chat_server, tmp_path):
+    targets = tmp_path / 'targets'
+    targets.write_text(f'localhost:{chat_server.port} user=alice\n127.0.0.1:{chat_server.port} user="bob smith"\n')
+    runner = CliRunner()
+    script = '"login: " ${user} "said ${user}" "${greeting} ${host}" "said ${greeting}" quit bye'
+    result = runner.invoke(cli, ['-T', str(targets), '-s', 'direct', '-q', '--var', 'greeting=hi', script])
+    assert result.exit_code == 0
+    assert sorted(chat_server.received
+                  ) == sorted(['alice', 'bob smith', 'hi localhost', 'hi 127.0.0.1', 'quit', 'quit'])
+    result = runner.invoke(cli, ['-T', str(targets), '-s', 'direct', '-q', script])
+    assert 'greeting' in json.loads(result.stdout.splitlines()[0])['error']
+
+
+def test_batch_repeated_target(chat_server, tmp_path):
+    targets = tmp_path / 'targets'
+    targets.write_text(f'localhost:{chat_server.port} line=1\nlocalhost:{chat_server.port} line=2\n')
+    with open(targets) as file:
+        inventory = read_inventory(file)
+    assert inventory == [(('localhost', chat_server.port), dict(line='1')),
+                         (('localhost', chat_server.port), dict(line='2'))]
+    batch = Batch(inventory, '"login: " "line ${line}" "said line"', out=None, err=None, spawn_type=spawn.direct)
+    assert all(result.ok for result in batch.run())
+    assert sorted(chat_server.received) == ['line 1', 'line 2']
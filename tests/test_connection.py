@@ -0,0 +1,81 @@
+# netchat connector relay tests
+
+import os
+import pstats
+import socket
+import subprocess
+import sys
+import threading
+
+from netchat import Connection, Session, status
+from netchat.stats import RelayCounters
+
+
+def test_relay_bulk_and_half_close():
+    _relay(os.urandom(4 * 1048576))
+
+
+def test_relay_counters():
+    payload = os.urandom(1048576)
+    counters = _relay(payload, RelayCounters())
+    assert counters.rx_bytes == counters.tx_bytes == len(payload)
+    assert counters.reads and counters.writes
+    assert counters.wakeups >= counters.writes / 2
+
+
+def test_connector_profile(chat_server, tmp_path):
+    profile = str(tmp_path / 'connector.pstats')
+    session = Session(('localhost', chat_server.port),
+                      '"login: " admin "> " quit bye',
+                      out=None,
+                      err=None,
+                      connector_profile=profile)
+    assert session.handler().exit_grace
+    assert session.run() == status.DONE
+    stats = pstats.Stats(profile)
+    assert any(function == 'relay' for _, _, function in stats.stats)
+
+
+def test_connector_exit():
+    session = Session(('localhost', 1), 'x', out=None, err=None)
+    assert session.handler().exit_grace is None
+    code = 'import sys, netchat.connection; print("cProfile" in sys.modules)'
+    assert subprocess.check_output([sys.executable, '-c', code], text=True).strip() == 'False'
+
+
+def _relay(payload, counters=None):
+    server = socket.create_server(('localhost', 0))
+
+    def echo():
+        conn, _ = server.accept()
+        with conn:
+            while data := conn.recv(65536):
+                conn.sendall(data)
+
+    threading.Thread(target=echo, daemon=True).start()
+
+    tx_read, tx_write = os.pipe()
+    rx_read, rx_write = os.pipe()
+    received = bytearray()
+
+    def source():
+        with open(tx_write, 'wb') as fp:
+            fp.write(payload)
+
+    def sink():
+        with open(rx_read, 'rb') as fp:
+            while data := fp.read(65536):
+                received.extend(data)
+
+    threads = [threading.Thread(target=source), threading.Thread(target=sink)]
+    for thread in threads:
+        thread.start()
+    connection = Connection(server.getsockname(), high_water=262144, stdin=tx_read, stdout=rx_write, counters=counters)
+    assert connection.run() == 0
+    os.close(tx_read)
+    os.close(rx_write)
+    for thread in threads:
+        thread.join()
+    server.close()
+    assert received == payload
+    return counters
@@ -0,0 +1,266 @@
+# netchat in-process handler tests
+
+import io
+import os
+import socket
+import threading
+
+from time import monotonic, sleep
+
+import pytest
+
+from click.testing import CliRunner
+
+from netchat import ParameterError, Script, Session, spawn, status
+from netchat.cli import cli
+from netchat.expect import Expecter
+
+
+def test_direct_done(chat_server, callback):
+    nc = Session(('localhost', chat_server.port),
+                 script='"login: " admin "> " quit bye',
+                 out=None,
+                 err=None,
+                 events=list(status),
+                 spawn_type=spawn.direct)
+    ret = nc.run(callback.rx)
+    assert ret == status.DONE
+    assert chat_server.received == ['admin', 'quit']
+    events = [event for event, _ in callback.buffer]
+    assert events[:2] == [status.CONNECTING, status.CONNECTED]
+    assert events[-2:] == [status.CLOSED, status.SUMMARY]
+    assert (status.FOUND, 'login: ') in callback.buffer
+
+
+def test_direct_regex_and_output(chat_server):
+    out = io.StringIO()
+    nc = Session(('localhost', chat_server.port),
+                 script='"lo.in: " admin "said (a|b)dmin"',
+                 out=out,
+                 err=None,
+                 spawn_type=spawn.direct)
+    assert nc.run() == status.DONE
+    assert 'hello\nlogin: admin\nyou said admin' in out.getvalue()
+
+
+def test_direct_timeout(chat_server):
+    nc = Session(('localhost', chat_server.port),
+                 script='nomatch',
+                 wait_timeout=0.2,
+                 out=None,
+                 err=None,
+                 spawn_type=spawn.direct)
+    assert nc.run() == status.TIMEOUT
+
+
+def test_direct_eof(chat_server):
+    nc = Session(('localhost', chat_server.port),
+                 script='"login: " quit nomatch',
+                 out=None,
+                 err=None,
+                 spawn_type=spawn.direct)
+    assert nc.run() == status.EOF
+
+
+def test_direct_alternatives(chat_server, callback):
+    script = '"login: " admin ( "said root" @exit:DONE "said admin" @exit:FAILED )'
+    nc = Session(('localhost', chat_server.port),
+                 script,
+                 out=None,
+                 err=None,
+                 events=list(status),
+                 spawn_type=spawn.direct)
+    assert nc.run(callback.rx) == status.FAILED
+    assert (status.EXPECT, ('said root', 'said admin')) in callback.buffer
+    assert (status.FOUND, 'said admin') in callback.buffer
+
+
+def test_expecter_incremental():
+    expecter = Expecter(max_buffer=100)
+    for n in range(1000):
+        expecter.feed(b'x'*99 + b'\n')
+        assert not expecter.search('login:')
+    assert expecter.bytes_received == 100000
+    assert expecter.bytes_scanned < 2 * expecter.bytes_received
+    assert len(expecter.buffer) <= 200
+    expecter.feed(b'log')
+    assert not expecter.search('login:')
+    expecter.feed(b'in: ')
+    assert expecter.search('login:')
+    assert expecter.after == 'login:'
+    assert expecter.buffer == ' '
+
+
+def test_expecter_search_window():
+    expecter = Expecter(search_window=10)
+    expecter.feed(b'y' * 1000)
+    assert not expecter.search('pro.pt>')
+    expecter.feed(b'z' * 1000)
+    assert not expecter.search('pro.pt>')
+    assert expecter.bytes_scanned == 2010
+    expecter.feed(b'prompt> ')
+    assert expecter.search('pro.pt>')
+    assert len(expecter.before) == 2000
+
+
+def test_direct_binary(chat_server):
+    out = io.BytesIO()
+    nc = Session(('localhost', chat_server.port),
+                 script=Script(script="'login: ' '\\x61dmin\\r\\n' 'said admin' ''", binary=True),
+                 out=out,
+                 err=None,
+                 spawn_type=spawn.direct,
+                 binary=True)
+    assert nc.run() == status.DONE
+    assert chat_server.received == ['admin']
+    assert b'login: admin\r\nyou said admin' in out.getvalue()
+    with pytest.raises(ParameterError):
+        Session(('localhost', chat_server.port), Script(script='a b'), spawn_type=spawn.direct, binary=True)
+
+
+def test_direct_stream(chat_server, tmp_path):
+    path = tmp_path / 'script'
+    path.write_text('# login\n"login: " admin\n# repeat\n' + '"> " again\n'*100 + '"> " quit bye\n')
+    with path.open() as fp:
+        script = Script(file=fp, stream=True)
+        nc = Session(('localhost', chat_server.port), script, out=None, err=None, spawn_type=spawn.direct)
+        assert nc.run() == status.DONE
+        assert fp.closed
+    assert chat_server.received == ['admin'] + ['again'] * 100 + ['quit']
+
+
+def test_direct_element_and_session_timeouts(chat_server):
+    address = ('localhost', chat_server.port)
+    nc = Session(address, '@timeout:0.2 nomatch', wait_timeout=30, out=None, err=None, spawn_type=spawn.direct)
+    assert nc.run() == status.TIMEOUT
+    assert nc.stats['elapsed'] < 5
+    script = '"login: " admin "said admin" x nomatch'
+    nc = Session(address, script, wait_timeout=30, session_timeout=0.3, out=None, err=None, spawn_type=spawn.direct)
+    assert nc.run() == status.TIMEOUT
+    assert 0.3 <= nc.stats['elapsed'] < 5
+
+
+def test_direct_write_timeout():
+    # a listener that never accepts, so its receive buffer fills
+    with socket.create_server(('localhost', 0)) as server:
+        script = Script(script='"" ' + 'x'*16*1048576)
+        nc = Session(server.getsockname(), script, write_timeout=0.2, out=None, err=None, spawn_type=spawn.direct)
+        assert nc.run() == status.TIMEOUT
+
+
+def test_direct_polling_loop(chat_server, callback):
+    script = '''
+        "login: " admin
+        @label:poll
+        @sleep:0.01
+        "> " status
+        ( "said status" "" "said alarm" @exit:FAILED )
+        @loop:poll:5
+        @ontimeout:done @timeout:0.1 nomatch fail
+        @label:done
+        "> " quit bye
+    '''
+    nc = Session(('localhost', chat_server.port), script, out=None, err=None, spawn_type=spawn.direct)
+    assert nc.run(callback.rx) == status.DONE
+    assert chat_server.received == ['admin'] + ['status'] * 5 + ['quit']
+    assert chat_server.connections == 1
+
+
+def test_direct_streamed_polling_loop(chat_server, tmp_path):
+    path = tmp_path / 'poll.chat'
+    path.write_text('"login: " admin\n@label:poll "> " status "said status" ""\n@loop:poll:3\n"> " quit bye\n')
+    with path.open() as fp:
+        script = Script(file=fp, stream=True)
+        nc = Session(('localhost', chat_server.port), script, out=None, err=None, spawn_type=spawn.direct)
+        assert nc.run() == status.DONE
+    assert chat_server.received == ['admin'] + ['status'] * 3 + ['quit']
+
+
+def test_direct_loop_session_timeout(chat_server):
+    script = '"login: " admin @label:poll @ontimeout:poll @timeout:0.05 nomatch x'
+    nc = Session(('localhost', chat_server.port),
+                 script,
+                 session_timeout=0.3,
+                 out=None,
+                 err=None,
+                 spawn_type=spawn.direct)
+    assert nc.run() == status.TIMEOUT
+
+
+def test_direct_upload(chat_server, callback, tmp_path):
+    lines = [f'{n:04d}' + 'x'*1019 for n in range(3000)]
+    path = tmp_path / 'upload'
+    path.write_text('\n'.join(lines + ['quit', '']))
+    nc = Session(('localhost', chat_server.port),
+                 script=f'"login: " @file:{path} bye',
+                 out=None,
+                 err=None,
+                 events=[status.PROGRESS],
+                 spawn_type=spawn.direct)
+    assert nc.run(callback.rx) == status.DONE
+    assert chat_server.received == lines + ['quit']
+    size = path.stat().st_size
+    progress = [data for event, data in callback.buffer if event == status.PROGRESS]
+    assert progress[-1] == dict(path=str(path), sent=size, total=size)
+    assert len(progress) == size//1048576 + 1
+    assert nc.stats['tx_bytes'] == size
+
+
+def test_direct_upload_pipe(chat_server):
+    read, write = os.pipe()
+    with open(write, 'wb') as fp:
+        fp.write(b'one\ntwo\nquit\n')
+    nc = Session(('localhost', chat_server.port),
+                 script=f'"login: " @file:/dev/fd/{read} bye',
+                 out=None,
+                 err=None,
+                 spawn_type=spawn.direct)
+    try:
+        assert nc.run() == status.DONE
+    finally:
+        os.close(read)
+    assert chat_server.received == ['one', 'two', 'quit']
+
+
+def test_direct_streamed_variables(chat_server, tmp_path):
+    path = tmp_path / 'login.chat'
+    path.write_text('"login: " ${host} "said ${host}" quit bye\n')
+    script = Script(pathname=str(path), stream=True)
+    nc = Session(('localhost', chat_server.port), script, out=None, err=None, spawn_type=spawn.direct)
+    assert nc.run() == status.DONE
+    assert chat_server.received == ['localhost', 'quit']
+
+
+def test_upload_requires_direct(chat_server, tmp_path):
+    path = tmp_path / 'upload'
+    path.write_text('one\nquit\n')
+    with pytest.raises(ParameterError):
+        Session(('localhost', chat_server.port), f'"login: " @file:{path}', spawn_type=spawn.internal)
+    result = CliRunner().invoke(cli, [f'localhost:{chat_server.port}', '"login: "', '-u', str(path), '-q'])
+    assert result.exit_code == 0
+    # the upload is the last step, so the session may close before the server has read it all
+    deadline = monotonic() + 5
+    while len(chat_server.received) < 2 and monotonic() < deadline:
+        sleep(0.01)
+    assert chat_server.received == ['one', 'quit']
+
+
+def test_direct_binary_frames():
+    server = socket.create_server(('localhost', 0))
+    received = bytearray()
+
+    def serve():
+        conn, _ = server.accept()
+        with conn:
+            conn.sendall(b'\x02ready\x03')
+            while data := conn.recv(65536):
+                received.extend(data)
+
+    thread = threading.Thread(target=serve)
+    thread.start()
+    script = Script(script="'\\x02ready\\x03' '\\x02\\x00\\x01\\x03' '' '\\x02end\\x03'", binary=True)
+    nc = Session(server.getsockname(), script, out=None, err=None, spawn_type=spawn.direct, binary=True)
+    assert nc.run() == status.DONE
+    thread.join()
+    server.close()
+    assert received == b'\x02\x00\x01\x03\x02end\x03'
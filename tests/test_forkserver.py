@@ -0,0 +1,99 @@
+# netchat forkserver tests
+
+import os
+import socket
+import threading
+from time import monotonic, sleep
+
+import pytest
+
+from netchat import Session, spawn, status
+from netchat import forkserver, net
+from netchat.exception import ForkServerError
+
+
+@pytest.fixture()
+def forkserver_path(tmp_path, monkeypatch):
+    path = str(tmp_path / 'forkserver.sock')
+    monkeypatch.setattr(forkserver, 'DEFAULT_PATH', path)
+    yield path
+    forkserver.stop(path)
+
+
+def test_forkserver_session(chat_server, forkserver_path):
+    for user in ['admin', 'root']:
+        nc = Session(('localhost', chat_server.port),
+                     f'"login: " {user} "said {user}" quit',
+                     wait_timeout=10,
+                     out=None,
+                     err=None,
+                     spawn_type=spawn.forkserver)
+        assert nc.run() == status.DONE
+    assert chat_server.received == ['admin', 'quit', 'root', 'quit']
+    assert chat_server.connections == 2
+
+
+def test_forkserver_session_resolver(chat_server, forkserver_path, monkeypatch):
+    calls = []
+    getaddrinfo = socket.getaddrinfo
+
+    def lookup(host, port, *args, **kwargs):
+        if host == 'chat.invalid':
+            calls.append(host)
+            host = '127.0.0.1'
+        return getaddrinfo(host, port, *args, **kwargs)
+
+    monkeypatch.setattr(socket, 'getaddrinfo', lookup)
+    net.resolver.clear()
+    for user in ['admin', 'root']:
+        nc = Session(('chat.invalid', chat_server.port),
+                     f'"login: " {user} "said {user}"',
+                     wait_timeout=10,
+                     out=None,
+                     err=None,
+                     spawn_type=spawn.forkserver)
+        assert nc.run() == status.DONE
+    assert calls == ['chat.invalid']
+    net.resolver.clear()
+
+
+def test_forkserver_stop(forkserver_path):
+    forkserver.start()
+    assert os.path.exists(forkserver_path)
+    forkserver.stop()
+    for _ in range(100):
+        if not os.path.exists(forkserver_path):
+            break
+        sleep(0.01)
+    assert not os.path.exists(forkserver_path)
+
+
+def test_forkserver_runtime_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(forkserver, 'DEFAULT_PATH', None)
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmp_path))
+    assert forkserver.default_path() == str(tmp_path / 'netchat' / 'forkserver.sock')
+    assert (tmp_path / 'netchat').stat().st_mode & 0o777 == 0o700
+    (tmp_path / 'netchat').chmod(0o755)
+    with pytest.raises(ForkServerError):
+        forkserver.default_path()
+
+
+def test_forkserver_close_latency(forkserver_path):
+    # the server ignores the connector's half-close, so only the pty hangup can end the connector
+    server = socket.create_server(('localhost', 0))
+    held = []
+
+    def serve():
+        while True:
+            conn, _ = server.accept()
+            held.append(conn)
+            conn.sendall(b'login: ')
+
+    threading.Thread(target=serve, daemon=True).start()
+    forkserver.start()
+    for _ in range(3):
+        nc = Session(server.getsockname(), '"login: "', out=None, err=None, spawn_type=spawn.forkserver)
+        started = monotonic()
+        assert nc.run() == status.DONE
+        assert monotonic() - started < 0.5
+    server.close()
@@ -0,0 +1,58 @@
+# netchat load generator tests
+
+import json
+import random
+
+from click.testing import CliRunner
+
+from netchat import spawn
+from netchat.cli import cli
+from netchat.histogram import Histogram
+from netchat.load import Load
+
+SCRIPT = '"login: " admin "said admin" quit bye'
+
+
+def test_histogram_percentiles():
+    values = [random.expovariate(100) for _ in range(20000)]
+    first, second = Histogram(), Histogram()
+    for n, value in enumerate(values):
+        (first if n % 2 else second).record(value)
+    merged = Histogram.from_dict(json.loads(json.dumps(first.to_dict()))).merge(second)
+    assert merged.count == len(values)
+    values.sort()
+    for percent in (50, 90, 99, 99.9):
+        exact = values[int(len(values) * percent / 100) - 1]
+        assert abs(merged.percentile(percent) - exact) <= exact/64 + 2e-6
+    summary = merged.summary()
+    assert summary['min'] == round(values[0], 6) and summary['max'] == round(values[-1], 6)
+    assert Histogram().summary() == dict(count=0)
+
+
+def test_load_rate(chat_server):
+    load = Load(('localhost', chat_server.port),
+                SCRIPT,
+                sessions=4,
+                rate=50,
+                duration=0.4,
+                wait_timeout=5,
+                spawn_type=spawn.direct)
+    report = load.run()
+    assert report['sessions'] == 20
+    assert report['statuses'] == dict(DONE=20)
+    assert report['connect']['count'] == report['session']['count'] == report['wait']['count'] == 20
+    assert sorted(report['steps']) == ['1', '2', '3']
+    assert chat_server.connections == 20
+
+
+def test_load_cli(chat_server):
+    result = CliRunner().invoke(
+        cli, [
+            'load', f'localhost:{chat_server.port}', '"login: " admin nomatch', '-t', '1', '-n', '2', '-D', '0.2',
+            '--json'
+        ]
+    )
+    report = json.loads(result.stdout)
+    assert result.exit_code == 1
+    assert report['statuses'] == dict(TIMEOUT=2)
+    assert 'wait' not in report
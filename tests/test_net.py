@@ -0,0 +1,106 @@
+# netchat connection establishment tests
+
+import asyncio
+import socket
+import subprocess
+import sys
+from time import monotonic
+
+import pytest
+
+from netchat import Session, TimeoutError, spawn, status
+from netchat import net
+from netchat.net import Resolver, connect, connect_async, interleave
+
+
+def addrinfo(address):
+    return (socket.AF_INET, socket.SOCK_STREAM, 6, '', address)
+
+
+def test_interleave():
+    v4 = [(socket.AF_INET, 1, 6, '', (f'10.0.0.{n}', 1)) for n in range(3)]
+    v6 = [(socket.AF_INET6, 1, 6, '', (f'::{n}', 1, 0, 0)) for n in range(2)]
+    assert interleave(v6 + v4) == [v6[0], v4[0], v6[1], v4[1], v4[2]]
+
+
+def test_resolver_cache(monkeypatch):
+    calls = []
+
+    def getaddrinfo(host, port, **kwargs):
+        calls.append(host)
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('127.0.0.1', port))]
+
+    monkeypatch.setattr(socket, 'getaddrinfo', getaddrinfo)
+    resolver = Resolver(ttl=60)
+    assert resolver.resolve('example.test', 80) is resolver.resolve('example.test', 80)
+    assert calls == ['example.test']
+    resolver.ttl = 0
+    resolver.clear()
+    resolver.resolve('example.test', 80)
+    resolver.resolve('example.test', 80)
+    assert len(calls) == 3
+
+
+def test_connector_uses_session_resolver(chat_server, monkeypatch):
+    calls = []
+    getaddrinfo = socket.getaddrinfo
+
+    def lookup(host, port, *args, **kwargs):
+        if host == 'chat.invalid':
+            calls.append(host)
+            host = '127.0.0.1'
+        return getaddrinfo(host, port, *args, **kwargs)
+
+    monkeypatch.setattr(socket, 'getaddrinfo', lookup)
+    net.resolver.clear()
+    for user in ['admin', 'root']:
+        nc = Session(('chat.invalid', chat_server.port), f'"login: " {user} "said {user}"', out=None, err=None)
+        assert nc.run() == status.DONE
+    # one lookup, made here: the connector subprocesses cannot resolve chat.invalid themselves
+    assert calls == ['chat.invalid']
+    net.resolver.clear()
+
+
+def test_happy_eyeballs(chat_server, blackhole):
+    resolver = Resolver()
+    resolver.store('dual.test', chat_server.port, [addrinfo(blackhole), addrinfo(('127.0.0.1', chat_server.port))])
+    started = monotonic()
+    with connect(('dual.test', chat_server.port), timeout=5, delay=0.05, cache=resolver) as sock:
+        assert sock.getpeername()[1] == chat_server.port
+    assert monotonic() - started < 1
+    sock = asyncio.run(connect_async(('dual.test', chat_server.port), timeout=5, delay=0.05, cache=resolver))
+    assert sock.getpeername()[1] == chat_server.port
+    sock.close()
+
+
+def test_connect_timeout_and_retries(monkeypatch, blackhole):
+    delays = []
+    monkeypatch.setattr(net, 'sleep', delays.append)
+    started = monotonic()
+    with pytest.raises(TimeoutError):
+        connect(blackhole, timeout=0.1, retries=2)
+    assert 0.3 <= monotonic() - started < 1
+    assert len(delays) == 2
+    assert 0 <= delays[0] <= net.BACKOFF and 0 <= delays[1] <= 2 * net.BACKOFF
+
+
+@pytest.mark.parametrize('spawn_type', [spawn.direct, spawn.internal])
+def test_session_connect_timeout(chat_server, spawn_type):
+    nc = Session(('localhost', chat_server.port),
+                 '"login: " admin "said admin"',
+                 out=None,
+                 err=None,
+                 spawn_type=spawn_type,
+                 connect_timeout=2,
+                 retries=1)
+    assert nc.run() == status.DONE
+
+
+def test_async_connect_timeout(blackhole):
+    with pytest.raises(TimeoutError):
+        asyncio.run(connect_async(blackhole, timeout=0.1))
+
+
+def test_connector_skips_asyncio():
+    code = 'import sys, netchat.connection; print("asyncio" in sys.modules)'
+    assert subprocess.check_output([sys.executable, '-c', code], text=True).strip() == 'False'
@@ -0,0 +1,49 @@
+# netchat pipelined SEND tests
+
+import asyncio
+from time import monotonic
+
+import pytest
+
+from netchat import AsyncSession, Session, spawn, status
+
+SCRIPT = '"login: " 0 ' + ' '.join(f'"said {n}" {n + 1}' for n in range(10)) + ' "said 10" quit bye'
+
+
+@pytest.mark.parametrize('spawn_type', [spawn.direct, spawn.internal])
+def test_pipeline_round_trips(slow_chat_server, spawn_type):
+    nc = Session(('localhost', slow_chat_server.port),
+                 SCRIPT,
+                 wait_timeout=5,
+                 out=None,
+                 err=None,
+                 spawn_type=spawn_type,
+                 pipeline=8)
+    started = monotonic()
+    assert nc.run() == status.DONE
+    if spawn_type == spawn.direct:
+        # lock-step would wait for 12 replies, each 50ms behind its request
+        assert monotonic() - started < 0.4
+    assert slow_chat_server.received == [str(n) for n in range(11)] + ['quit']
+
+
+def test_pipeline_events(chat_server, callback):
+    script = '"login: " admin "said admin" root ( "said root" @exit:FAILED "said" @exit:DONE )'
+    nc = Session(('localhost', chat_server.port),
+                 script,
+                 out=None,
+                 err=None,
+                 events=list(status),
+                 spawn_type=spawn.direct,
+                 pipeline=4)
+    assert nc.run(callback.rx) == status.FAILED
+    events = [(event, data) for event, data in callback.buffer if event in (status.SEND, status.FOUND)]
+    assert events == [(status.SEND, 'admin'), (status.SEND, 'root'), (status.FOUND, 'login: '),
+                      (status.FOUND, 'said admin'), (status.FOUND, 'said root')]
+
+
+def test_async_pipeline(slow_chat_server):
+    nc = AsyncSession(('localhost', slow_chat_server.port), SCRIPT, wait_timeout=5, out=None, err=None, pipeline=16)
+    started = monotonic()
+    assert asyncio.run(nc.run()) == status.DONE
+    assert monotonic() - started < 0.4
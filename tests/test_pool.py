@@ -0,0 +1,67 @@
+# netchat persistent session and pool tests
+
+import pytest
+
+from time import sleep
+
+from netchat import Pool, PersistentSession, ParameterError, Script, status
+
+
+def test_persistent_session(chat_server):
+    with PersistentSession(('localhost', chat_server.port), '"login: " admin "> "', out=None, err=None) as session:
+        for command in ['one', 'two', 'three']:
+            assert session.run(f'"" {command} "said {command}"') == status.DONE
+        assert chat_server.connections == 1
+        assert session.run('"" quit bye') == status.DONE
+        for _ in range(100):
+            if not session.alive():
+                break
+            sleep(0.01)
+        assert session.connection is None
+        assert session.run('"" again "said again"') == status.DONE
+    assert chat_server.connections == 2
+    assert chat_server.received == ['admin', 'one', 'two', 'three', 'quit', 'admin', 'again']
+
+
+def test_pool_reuse(chat_server):
+    address = ('localhost', chat_server.port)
+    with Pool(max_per_host=2, login='"login: " admin "> "', out=None, err=None) as pool:
+        for n in range(5):
+            assert pool.run(address, f'"" cmd{n} "said cmd{n}"') == status.DONE
+    assert chat_server.connections == 1
+
+
+def test_failed_script_closes(chat_server):
+    address = ('localhost', chat_server.port)
+    with Pool(login='"login: " admin "> "', out=None, err=None, wait_timeout=0.1) as pool:
+        assert pool.run(address, 'nomatch') == status.TIMEOUT
+        assert pool.run(address, '"" ok "said ok"') == status.DONE
+    assert chat_server.connections == 2
+
+
+def test_login_exception_closes(chat_server):
+    address = ('localhost', chat_server.port)
+
+    def callback(state, data):
+        if state == status.SEND:
+            raise ConnectionResetError('reset')
+
+    with Pool(login='"login: " admin "> "', out=None, err=None) as pool:
+        with pytest.raises(ConnectionResetError):
+            pool.run(address, '"" ok "said ok"', callback)
+        assert pool.count[address] == 0
+        assert pool.run(address, '"" ok "said ok"') == status.DONE
+        assert pool.count[address] == 1
+    assert pool.count[address] == 0
+    with pytest.raises(ParameterError):
+        pool.run(address, '"" ok "said ok"')
+
+
+def test_pool_binds_scripts(chat_server):
+    address = ('localhost', chat_server.port)
+    with Pool(login='"login: " admin "> "', out=None, err=None, variables=dict(item='disk')) as pool:
+        assert pool.run(address, '"" "show ${host}" "said show localhost"') == status.DONE
+        assert pool.run(address, Script(script='"" "${item} ${port}" "said disk"')) == status.DONE
+        with pytest.raises(ParameterError):
+            pool.run(address, Script(script='"" x', binary=True))
+    assert chat_server.received == ['admin', 'show localhost', f'disk {chat_server.port}']
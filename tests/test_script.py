@@ -0,0 +1,201 @@
+# netchat script tests
+
+import os
+
+import pytest
+
+from netchat import Script, ParameterError, status
+from netchat.pattern import compile_patternset
+from netchat.script import Cursor, Element, SendFile
+
+
+def test_parse_elements():
+    script = Script(script="login: admin 'pass word:' \"s3cr3t\" '\\$ $'")
+    assert [(e.expect, e.send) for e in script] == [('login:', 'admin'), ('pass word:', 's3cr3t'), ('\\$ $', '')]
+    assert script.elements[0].pattern.literal
+    assert not script.elements[2].pattern.literal
+    assert script.elements[2].pattern.search('prompt $ ') == (7, 9, 0)
+
+
+def test_patterns_shared():
+    first = Script(script='login: admin')
+    second = Script(script='login: root')
+    assert first.elements[0].pattern is second.elements[0].pattern
+
+
+def test_load_cached(tmp_path):
+    assert Script.load(script='a b c') is Script.load(script='a b c')
+    path = tmp_path / 'script'
+    path.write_text('# comment\nlogin: admin\n')
+    script = Script.load(pathname=str(path))
+    assert [(e.expect, e.send) for e in script] == [('login:', 'admin')]
+    assert Script.load(pathname=str(path)) is script
+    path.write_text('login: root\n')
+    os.utime(path, ns=(0, 0))
+    assert [(e.expect, e.send) for e in Script.load(pathname=str(path))] == [('login:', 'root')]
+
+
+def test_parse_alternatives():
+    script = Script(script="login: admin ( Password: s3cr3t 'Permission denied' @exit:FAILED '#' ) '' @@home")
+    login, group, last = script.elements
+    assert [(e.expect, e.send, e.exit) for e in group.elements] == [('Password:', 's3cr3t', None),
+                                                                    ('Permission denied', '', status.FAILED),
+                                                                    ('#', '', None)]
+    assert group.choose(1).exit == status.FAILED
+    assert (last.expect, last.send) == ('', '@home')
+    for bad in ['( a b', 'a b )', '( ( a b ) )', '( "" b )', 'a @exit:NOPE', 'a @file:']:
+        with pytest.raises(ParameterError):
+            Script(script=bad)
+    script = Script(script='a @nope "login: " "@admin" "Password:" "@secret!" b @')
+    assert [e.send for e in script] == ['@nope', '@admin', '@secret!', '@']
+
+
+def test_patternset():
+    patterns = compile_patternset(('Password:', 'denied', '(#|\\$) $'))
+    assert patterns.overlap is None
+    assert patterns.search('login: ok\nPermission denied\nPassword:') == (21, 27, 1)
+    assert patterns.search('host $ ') == (5, 7, 2)
+    assert patterns.search('Password:denied') == (0, 9, 0)
+    assert compile_patternset(('a', 'bcd')).overlap == 2
+
+
+def test_patternset_backreferences():
+    patterns = compile_patternset(('(x)\\1', '(a)\\1', '(?P<q>["\'])(\\w+)(?P=q)'))
+    assert patterns.search('xa aa') == (3, 5, 1)
+    assert patterns.search('say "hi"') == (4, 8, 2)
+    assert compile_patternset((b'(a)\\1[\\1]', b'(b)\\1')).search(b'bb aa\x01') == (0, 2, 1)
+    with pytest.raises(ParameterError):
+        compile_patternset(('(?P<q>a)(?P=q)', '(?P<q>b)(?P=q)'))
+
+
+def test_literal_parentheses():
+    script = Script(script="'\\(' a ( '\\)' b ok c )")
+    first, group = script.elements
+    assert first.pattern.search('f(x)') == (1, 2, 0)
+    assert group.pattern.search('f(x)') == (3, 4, 0)
+
+
+def test_parse_binary():
+    script = Script(script="'\\x00\\xffok' '\\x01\\r' \\$ ''", binary=True)
+    assert [(e.expect, e.send) for e in script] == [(b'\x00\xffok', b'\x01\r'), (b'$', b'')]
+    assert script.elements[0].pattern.literal
+    assert script.elements[0].pattern.search(b'xx\x00\xffok') == (2, 6, 0)
+    patterns = compile_patternset((b'\xfe', b'ok.'))
+    assert patterns.search(b'\x00ok!') == (1, 4, 1)
+
+
+def test_comments():
+    script = Script(script="# comment\n  # indented comment\n'#' cd\\ /tmp \"$# \" 'a\n# not a comment' b # c")
+    assert [(e.expect, e.send) for e in script] == [('#', 'cd /tmp'), ('$# ', 'a\n# not a comment'), ('b', '#'),
+                                                    ('c', '')]
+    for bad in ["'open", 'a "b', 'a \\']:
+        with pytest.raises(ParameterError):
+            Script(script=bad)
+
+
+def test_stream(tmp_path):
+    path = tmp_path / 'script'
+    with path.open('w') as fp:
+        fp.write('# generated\n')
+        for n in range(20000):
+            fp.write(f"'prompt {n % 10}> ' 'step {n}'\n")
+    script = Script(pathname=str(path), stream=True)
+    assert script.elements is None
+    elements = iter(script)
+    first = next(elements)
+    assert (first.expect, first.send) == ('prompt 0> ', 'step 0')
+    assert first.pattern is next(iter(script)).pattern
+    assert len(script) == 20000
+    assert [e.send for e in script][-1] == 'step 19999'
+
+
+def test_parse_timeouts():
+    script = Script(script='@timeout:2.5 "login: " admin "> " x @timeout:1 ( a b c d )')
+    first, second, group = script.elements
+    assert (first.timeout, second.timeout, group.timeout) == (2.5, None, 1.0)
+    assert [element.timeout for element in group.elements] == [None, None]
+    for text in ('@timeout:x a', '@timeout:-1 a', 'a b @timeout:1', '( @timeout:1 a b )', '@timeout:1 @timeout:2 a'):
+        with pytest.raises(ParameterError):
+            Script(script=text)
+
+
+def test_control_flow():
+    script = Script(script='@label:top x y @label:inner a b @loop:inner:2 @loop:top:3 @sleep:0.5 @exit:FAILED')
+    assert script.labels == {'top': 0, 'inner': 2}
+    steps = [getattr(step, 'expect', None) or repr(step) for step in Cursor(script)]
+    assert steps == ['x', 'a', 'a'] * 3 + ['Sleep<0.5>', 'Exit<FAILED>']
+    script = Script(script='@ontimeout:retry ( ok @goto:done fail @exit:FAILED ) @label:retry @label:done @@x y')
+    group = script.elements[0]
+    assert group.on_timeout == 'retry' and group.choose(0).goto == 'done'
+    assert script.elements[-1].expect == '@x'
+    assert Script(script='@host: x').elements[0].expect == '@host:'
+    for text in ('@goto:nowhere', 'a @goto:nowhere', '@label:a @label:a', '@loop:a:0 @label:a', '@sleep:x',
+                 '@exit:NOPE', '@timeout:1 @label:a', '( @label:a b )'):
+        with pytest.raises(ParameterError):
+            Script(script=text)
+
+
+def test_send_file():
+    send = Script(script='ready @file:/tmp/data.bin', binary=True).elements[0].send
+    assert isinstance(send, SendFile) and send.path == '/tmp/data.bin' and str(send) == '@file:/tmp/data.bin'
+
+
+def test_extend(tmp_path):
+    script = Script(script='@label:top "${prompt}" go')
+    extended = script.extend([Element('', SendFile('/tmp/data.bin'))])
+    assert len(script) == 2 and len(extended) == 3
+    assert extended.labels == {'top': 0} and extended.variables == {'prompt'}
+    assert [e.expect for e in extended.bind(dict(prompt='> ')).elements[1:]] == ['> ', '']
+    path = tmp_path / 'script'
+    path.write_text('a b\n')
+    with pytest.raises(ParameterError):
+        Script(pathname=str(path), stream=True).extend([Element('', 'x')])
+
+
+def test_bind():
+    script = Script(
+        script='"login: " ${user} "${host}> " "show $${x} ${port}" ( ${ok} "" fail @exit:FAILED ) go @file:${host}.cfg'
+    )
+    assert script.variables == {'user', 'host', 'port', 'ok'}
+    first = script.bind(dict(user='admin', host='r1', port=2, ok='OK'))
+    second = script.bind(dict(user='oper', host='r1', port=3, ok='OK'))
+    assert [first.elements[0].send, first.elements[1].send] == ['admin', 'show ${x} 2']
+    assert first.elements[3].send.path == 'r1.cfg'
+    assert first.elements[1].pattern is second.elements[1].pattern
+    assert first.elements[2].pattern is second.elements[2].pattern
+    assert script.bind(dict(user='a', host='r2', port=2, ok='OK')).elements[1].expect == 'r2> '
+    with pytest.raises(ParameterError):
+        script.bind(dict(user='admin'))
+    binary = Script(script="'\\x00${a}' x", binary=True)
+    assert binary.bind(dict(a='b')).elements[0].expect == b'\x00b'
+
+
+def test_bind_metacharacters():
+    script = Script(script='"${prompt}" x "${prompt} (ok|fail)" y "${sw}" z "${host}> " w')
+    bound = script.bind(dict(prompt='router[1]#', sw='sw(1', host='r1'))
+    buffer = 'router[1]# sw(1 router[1]# fail r1> '
+    assert [element.pattern.search(buffer)[:2] for element in bound.elements] == [(0, 10), (16, 31), (11, 15), (32, 36)]
+    assert bound.elements[3].pattern.literal
+
+
+def test_bind_stream(tmp_path):
+    path = tmp_path / 'chat'
+    path.write_text('"login: " ${user} "said ${user}" "$${x}"\n')
+    script = Script(pathname=str(path), stream=True)
+    assert [step.send for step in script.bind(dict(user='admin'))] == ['admin', '${x}']
+    with pytest.raises(ParameterError):
+        list(script.bind({}))
+    with pytest.raises(ParameterError):
+        list(script)
+
+
+def test_stream_jump(tmp_path):
+    path = tmp_path / 'chat'
+    path.write_text('x y @goto:start skipped z @label:start a b\n@loop:start:3 @label:end c d\n')
+    script = Script(pathname=str(path), stream=True)
+    assert [step.expect for step in Cursor(script)] == ['x', 'a', 'a', 'a', 'c']
+    path.write_text('a b @goto:nowhere\n')
+    cursor = Cursor(Script(pathname=str(path), stream=True))
+    assert next(cursor).expect == 'a'
+    with pytest.raises(ParameterError):
+        next(cursor)
@@ -0,0 +1,82 @@
+# netchat timing instrumentation tests
+
+import asyncio
+import json
+
+import pytest
+
+from click.testing import CliRunner
+
+from netchat import AsyncSession, Script, Session, spawn, status
+from netchat.batch import Batch
+from netchat.cli import cli
+
+
+def test_timing_events(chat_server, callback):
+    nc = Session(('localhost', chat_server.port),
+                 '"login: " admin "said admin" quit',
+                 out=None,
+                 err=None,
+                 events=[status.TIMING, status.SUMMARY],
+                 spawn_type=spawn.direct)
+    assert nc.run(callback.rx) == status.DONE
+    transitions = [data['transition'] for event, data in callback.buffer if event == status.TIMING]
+    assert transitions == ['CONNECTING->CONNECTED', 'EXPECT->FOUND', 'SEND->SENT', 'EXPECT->FOUND', 'SEND->SENT']
+    timing = callback.buffer[1][1]
+    assert timing['step'] == 1 and timing['data'] == 'login: ' and timing['rx_bytes'] == len('hello\nlogin: ')
+    event, summary = callback.buffer[-1]
+    assert event == status.SUMMARY and summary is nc.stats
+    assert summary['status'] == 'DONE' and summary['steps'] == 2
+    assert summary['tx_bytes'] == len('admin\nquit\n')
+    assert summary['elapsed'] >= summary['connect'] + summary['expect'] + summary['send']
+
+
+@pytest.mark.parametrize('session_class', [Session, AsyncSession])
+def test_pipeline_steps(chat_server, callback, session_class):
+    nc = session_class(('localhost', chat_server.port),
+                       '"login: " one "said one" two @label:end "said two" three "said three"',
+                       out=None,
+                       err=None,
+                       events=[status.TIMING],
+                       spawn_type=spawn.direct,
+                       pipeline=2)
+    result = nc.run(callback.rx)
+    if session_class is AsyncSession:
+        result = asyncio.run(result)
+    assert result == status.DONE
+    steps = sorted((data['step'], data['transition'], data['data']) for _, data in callback.buffer[1:])
+    # the label is step 3, and the SENDs run ahead of the EXPECTs but keep their own step numbers
+    assert steps == [(1, 'EXPECT->FOUND', 'login: '), (1, 'SEND->SENT', 'one'), (2, 'EXPECT->FOUND', 'said one'),
+                     (2, 'SEND->SENT', 'two'), (4, 'EXPECT->FOUND', 'said two'), (4, 'SEND->SENT', 'three'),
+                     (5, 'EXPECT->FOUND', 'said three')]
+    assert nc.stats['steps'] == 4
+
+
+def test_stats_cli(chat_server):
+    runner = CliRunner()
+    result = runner.invoke(cli, [f'localhost:{chat_server.port}', '-s', 'direct', '-q', '--stats', 'json', 'login:'])
+    assert result.exit_code == 0
+    assert json.loads(result.stderr.splitlines()[-1])['status'] == 'DONE'
+
+
+def test_binary_stats(chat_server):
+    # a slow reply makes the binary EXPECT the slowest transition
+    chat_server.latency = 0.1
+    script = "'login: ' 'admin\\x01\\n' 'said admin' 'quit\\n'"
+    nc = Session(('localhost', chat_server.port),
+                 Script(script=script, binary=True),
+                 out=None,
+                 err=None,
+                 binary=True,
+                 spawn_type=spawn.direct)
+    assert nc.run() == status.DONE
+    assert json.loads(json.dumps(nc.stats))['status'] == 'DONE'
+    batch = Batch([('localhost', chat_server.port)],
+                  script,
+                  stats=True,
+                  out=None,
+                  err=None,
+                  binary=True,
+                  spawn_type=spawn.direct)
+    result = json.loads(str(next(batch.run())))
+    assert result['status'] == 'DONE' and result['stats']['slowest']['data'] == 'said admin'
@@ -0,0 +1,50 @@
+# netchat timer wheel tests
+
+import asyncio
+import random
+
+from netchat.timer import TimerWheel, loop_timers
+
+
+def test_wheel_expiry_order():
+    wheel = TimerWheel(tick=1, slot_bits=2, levels=3)
+    fired = []
+    times = random.Random(1).sample(range(1, 200), 60)
+    timers = {when: wheel.schedule(when, lambda when=when: fired.append((when, wheel.current))) for when in times}
+    for when in times[::3]:
+        timers[when].cancel()
+    assert wheel.count == 40
+    for now in range(0, 201, 7):
+        wheel.advance(now)
+    assert sorted(when for when, _ in fired) == sorted(set(times) - set(times[::3]))
+    # each timer fires on its own tick, or on the first advance after it
+    assert all(when <= current < when + 7 for when, current in fired)
+    assert wheel.count == 0
+    assert all(timers[when].expired for when, _ in fired)
+
+
+def test_wheel_beyond_top_level():
+    wheel = TimerWheel(tick=1, slot_bits=2, levels=2)
+    fired = []
+    wheel.schedule(100, lambda: fired.append(wheel.current))
+    for now in range(101):
+        wheel.advance(now)
+    assert fired == [100]
+
+
+def test_loop_timers():
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        timers = loop_timers(loop)
+        assert loop_timers(loop) is timers
+        fired = []
+        started = loop.time()
+        timers.call_at(started + 0.05, lambda: fired.append(loop.time()))
+        timers.call_at(started + 0.05, fired.append).cancel()
+        await asyncio.sleep(0.2)
+        return started, fired, timers
+
+    started, fired, timers = asyncio.run(main())
+    assert len(fired) == 1 and 0.05 <= fired[0] - started < 0.15
+    assert timers.count == 0 and timers.handle is None
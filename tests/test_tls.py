@@ -0,0 +1,65 @@
+# netchat TLS transport tests
+
+import asyncio
+
+import pytest
+from click.testing import CliRunner
+
+from netchat import AsyncSession, ParameterError, Session, spawn, status
+from netchat.cli import cli
+from netchat.tls import TLS
+
+SCRIPT = '"login: " admin "said admin" quit bye'
+
+
+def connected(callback):
+    return [data for event, data in callback.buffer if event == status.CONNECTED]
+
+
+def test_tls_resumption(tls_chat_server, certificate, callback):
+    tls = TLS(cafile=certificate[0])
+    for _ in range(3):
+        nc = Session(('localhost', tls_chat_server.port),
+                     SCRIPT,
+                     out=None,
+                     err=None,
+                     events=[status.CONNECTED],
+                     spawn_type=spawn.direct,
+                     tls=tls)
+        assert nc.run(callback.rx) == status.DONE
+    assert [data['resumed'] for data in connected(callback)] == [False, True, True]
+    assert tls_chat_server.received == ['admin', 'quit'] * 3
+
+
+def test_tls_verify(tls_chat_server, certificate):
+    with pytest.raises(ParameterError):
+        Session(('localhost', tls_chat_server.port), SCRIPT, spawn_type=spawn.internal, tls=TLS())
+    nc = Session(('127.0.0.1', tls_chat_server.port), SCRIPT, out=None, err=None, spawn_type=spawn.direct, tls=TLS())
+    with pytest.raises(Exception, match='CERTIFICATE_VERIFY_FAILED'):
+        nc.run()
+    nc = Session(('127.0.0.1', tls_chat_server.port),
+                 SCRIPT,
+                 out=None,
+                 err=None,
+                 spawn_type=spawn.direct,
+                 tls=TLS(cafile=certificate[0], server_hostname='localhost'))
+    assert nc.run() == status.DONE
+
+
+def test_async_tls(tls_chat_server, certificate, callback):
+    nc = AsyncSession(('localhost', tls_chat_server.port),
+                      SCRIPT,
+                      out=None,
+                      err=None,
+                      events=[status.CONNECTED],
+                      tls=TLS(verify=False))
+    assert asyncio.run(nc.run(callback.rx)) == status.DONE
+    assert connected(callback)[0]['tls'].startswith('TLS')
+
+
+def test_tls_cli(tls_chat_server, certificate):
+    result = CliRunner().invoke(
+        cli, ['--tls', '--cafile', certificate[0], '-q', f'localhost:{tls_chat_server.port}', SCRIPT]
+    )
+    assert result.exit_code == 0, result.output
+    assert tls_chat_server.received == ['admin', 'quit']
@@ -0,0 +1,35 @@
+# netchat trace record and replay tests
+
+from click.testing import CliRunner
+
+from netchat import Session, spawn, status
+from netchat.batch import Batch
+from netchat.cli import cli
+from netchat.trace import Recorder, ReplayServer, read_trace
+
+SCRIPT = '"login: " admin "said admin" quit bye'
+
+
+def test_record(chat_server, tmp_path):
+    path = str(tmp_path / 'trace.jsonl')
+    with Recorder(path, ('localhost', chat_server.port)) as trace:
+        nc = Session(('localhost', chat_server.port), SCRIPT, out=None, err=None, spawn_type=spawn.direct, trace=trace)
+        assert nc.run() == status.DONE
+    header, records = read_trace(path)
+    assert header['address'] == f'localhost:{chat_server.port}'
+    assert ''.join(record['tx'] for record in records if 'tx' in record) == 'admin\nquit\n'
+    assert ''.join(record['rx'] for record in records if 'rx' in record).startswith('hello\nlogin: you said admin')
+    events = [record['event'] for record in records if 'event' in record]
+    assert events[:4] == ['CONNECTING', 'CONNECTED', 'TIMING', 'EXPECT'] and events[-1] == 'SUMMARY'
+    assert all(a['t'] <= b['t'] for a, b in zip(records, records[1:]))
+
+
+def test_replay(chat_server, tmp_path):
+    path = str(tmp_path / 'trace.jsonl.gz')
+    result = CliRunner().invoke(cli, ['record', path, '-q', '-s', 'direct', f'localhost:{chat_server.port}', SCRIPT])
+    assert result.exit_code == 0, result.output
+    with ReplayServer(path, speed=0) as server:
+        batch = Batch([('localhost', server.port)] * 20, SCRIPT, out=None, err=None, spawn_type=spawn.direct)
+        assert all(result.ok for result in batch.run())
+        assert server.connections == 20
+    assert chat_server.connections == 1
@@ -0,0 +1,108 @@
+# netchat transcript writer tests
+
+import gzip
+import io
+import threading
+from time import monotonic
+
+from click.testing import CliRunner
+
+from netchat import Session, spawn, status
+from netchat.batch import Batch
+from netchat.cli import cli
+from netchat.transcript import RotatingFile, Transcript, open_transcript
+
+
+class SlowSink(io.StringIO):
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def write(self, data):
+        self.release.wait()
+        return super().write(data)
+
+
+def test_transcript_never_blocks():
+    sink = SlowSink()
+    transcript = Transcript(sink, queue_size=8, block=False, close_sinks=False)
+    started = monotonic()
+    for n in range(100):
+        transcript.write(f'{n}\n')
+        transcript.flush()
+    assert monotonic() - started < 0.5
+    assert transcript.dropped > 0
+    sink.release.set()
+    transcript.close()
+    lines = sink.getvalue().splitlines()
+    assert lines[0] == '0' and len(lines) < 100
+    assert sum(len(f'{n}\n') for n in range(100)) == len(sink.getvalue()) + transcript.dropped
+
+
+def test_rotating_file(tmp_path):
+    path = str(tmp_path / 'out.log')
+    file = RotatingFile(path, max_bytes=10, backups=2, compress=True)
+    for n in range(4):
+        file.write(f'chunk {n}\n')
+    file.close()
+    assert file.rotations == 3
+    assert open(path).read() == 'chunk 3\n'
+    assert gzip.open(path + '.1.gz').read() == b'chunk 2\n'
+    assert gzip.open(path + '.2.gz').read() == b'chunk 1\n'
+    assert not (tmp_path / 'out.log.3.gz').exists()
+
+
+def test_session_transcript(chat_server, tmp_path):
+    echo = io.StringIO()
+    out = open_transcript(str(tmp_path / '{host}-{port}.log'), ('localhost', chat_server.port), echo=echo)
+    nc = Session(('localhost', chat_server.port),
+                 '"login: " admin "said admin"',
+                 out=out,
+                 err=None,
+                 spawn_type=spawn.direct)
+    assert nc.run() == status.DONE
+    out.close()
+    transcript = (tmp_path / f'localhost-{chat_server.port}.log').read_text()
+    assert transcript.startswith('hello\nlogin: admin\nyou said admin')
+    assert echo.getvalue() == transcript
+    assert not echo.closed
+
+
+def test_batch_transcripts(chat_server, tmp_path):
+    targets = [('localhost', chat_server.port), ('127.0.0.1', chat_server.port)]
+    batch = Batch(
+        targets,
+        '"login: " admin "said admin"',
+        out=None,
+        err=None,
+        spawn_type=spawn.direct,
+        transcript=str(tmp_path / '{host}.log'),
+        transcript_options=dict(flush_interval=0)
+    )
+    assert all(result.ok for result in batch.run())
+    for host, _ in targets:
+        assert 'you said admin' in (tmp_path / f'{host}.log').read_text()
+
+
+def test_transcript_blocks_by_default():
+    sink = SlowSink()
+    transcript = Transcript(sink, queue_size=8, close_sinks=False)
+    writer = threading.Thread(target=lambda: [transcript.write(f'{n}\n') for n in range(100)])
+    writer.start()
+    writer.join(0.2)
+    assert writer.is_alive()
+    sink.release.set()
+    writer.join()
+    transcript.close()
+    assert transcript.dropped == 0
+    assert sink.getvalue() == ''.join(f'{n}\n' for n in range(100))
+
+
+def test_cli_transcript_error_reported_last(chat_server):
+    result = CliRunner().invoke(
+        cli,
+        [f'localhost:{chat_server.port}', '"login: " admin "said admin"', '-o', '/dev/full', '--stats', 'json', '-q']
+    )
+    assert isinstance(result.exception, OSError)
+    assert '"status": "DONE"' in result.output
@@ -0,0 +1,107 @@
+# netchat transport tests
+
+import asyncio
+import shlex
+import sys
+
+import pytest
+
+from click.testing import CliRunner
+
+from netchat import AsyncSession, ParameterError, Session, spawn, status
+from netchat.batch import Batch
+from netchat.cli import cli
+from netchat.session import parse_address
+from netchat.transport import Exec, TCP, Transport, Unix, format_address, open_transport
+
+CHAT = '''
+import sys
+print('hello')
+print('login: ', end='')
+for line in sys.stdin:
+    line = line.strip()
+    if line == 'quit':
+        print('bye')
+        break
+    print(f'you said {line}')
+    print('> ', end='')
+'''
+
+EXEC = f'exec:{shlex.quote(sys.executable)} -u -c {shlex.quote(CHAT)}'
+
+
+def test_parse_address():
+    assert parse_address('localhost:23') == ('localhost', 23)
+    assert parse_address('unix:/run/chat.sock') == 'unix:/run/chat.sock'
+    assert parse_address('exec:cat -u') == 'exec:cat -u'
+    assert isinstance(open_transport(('localhost', 23)), TCP)
+    assert isinstance(open_transport('unix:/run/chat.sock'), Unix)
+    assert isinstance(open_transport('exec:cat'), Exec)
+    assert format_address(('localhost', 23)) == 'localhost:23'
+    assert format_address('unix:/run/chat.sock') == 'unix:/run/chat.sock'
+    with pytest.raises(ParameterError):
+        open_transport('ftp:localhost')
+
+
+def test_local_transport_requires_direct():
+    with pytest.raises(ParameterError):
+        Session('unix:/run/chat.sock', 'x', spawn_type=spawn.internal)
+
+
+def test_transport_is_abstract():
+    with pytest.raises(TypeError):
+        Transport('target')
+
+
+def test_batch_local_targets(unix_chat_server, tmp_path):
+    batch = Batch([f'unix:{unix_chat_server.path}', EXEC], '"login: " admin "said admin" quit bye', out=None, err=None)
+    assert all(result.ok for result in batch.run())
+    targets = tmp_path / 'targets'
+    targets.write_text(f'unix:{unix_chat_server.path}\n')
+    result = CliRunner().invoke(cli, ['-T', str(targets), '-q', '"login: " admin "said admin"'])
+    assert result.exit_code == 0
+    assert '"status": "DONE"' in result.output
+
+
+def test_unix(unix_chat_server, callback):
+    address = f'unix:{unix_chat_server.path}'
+    session = Session(address, '"login: " admin "> " quit bye', out=None, err=None, spawn_type=spawn.direct)
+    assert session.run(callback.rx) == status.DONE
+    assert unix_chat_server.received == ['admin', 'quit']
+
+
+def test_unix_missing(tmp_path):
+    session = Session(f'unix:{tmp_path}/none.sock', 'x', out=None, err=None, spawn_type=spawn.direct)
+    with pytest.raises(FileNotFoundError):
+        session.run()
+
+
+def test_exec(callback):
+    session = Session(EXEC, '"login: " admin "said admin" quit bye', out=None, err=None, spawn_type=spawn.direct)
+    assert session.run(callback.rx) == status.DONE
+
+
+def test_exec_eof_and_cleanup():
+    session = Session(EXEC, '"login: " quit nomatch', out=None, err=None, spawn_type=spawn.direct)
+    with session.handler() as handler:
+        assert session._run(handler) == status.EOF
+    assert handler.transport.process.poll() == 0
+
+
+def test_exec_terminated():
+    session = Session('exec:sleep 60', 'nomatch', wait_timeout=0.2, out=None, err=None, spawn_type=spawn.direct)
+    with session.handler() as handler:
+        assert session._run(handler) == status.TIMEOUT
+    assert handler.transport.process.poll() is not None
+
+
+def test_async_local_transports(unix_chat_server):
+
+    async def run():
+        sessions = [
+            AsyncSession(f'unix:{unix_chat_server.path}', '"login: " admin "> " quit bye', out=None, err=None),
+            AsyncSession(EXEC, '"login: " admin "said admin" quit bye', out=None, err=None)
+        ]
+        return await asyncio.gather(*(session.run() for session in sessions))
+
+    assert asyncio.run(run()) == [status.DONE, status.DONE]